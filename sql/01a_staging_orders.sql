@@ -1,25 +1,118 @@
 CREATE SCHEMA IF NOT EXISTS staging;
+CREATE SCHEMA IF NOT EXISTS mart;
 
-CREATE OR REPLACE VIEW staging.orders AS
+-- Typed, indexed copy of raw.features_orders. Every mart reads staging.orders, so the
+-- casts and the on-time flag are computed once here instead of on each reference.
+-- Rows are loaded in order_ts order, which keeps the BRIN index on order_ts tight.
+-- Customers are identified by the int cust_id from mart.customer_dim; the 32-char
+-- cust_uid is only kept there.
+
+-- Earlier versions defined staging.orders as a view, then as a table with the text
+-- cust_uid; replace those once
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('staging.orders')) = 'v' THEN
+    DROP VIEW staging.orders CASCADE;
+  ELSIF EXISTS (SELECT 1 FROM pg_attribute
+                WHERE attrelid = to_regclass('staging.orders') AND attname = 'cust_uid') THEN
+    DROP TABLE staging.orders CASCADE;
+  END IF;
+END $$;
+
+-- Customer surrogate keys. A cust_uid gets the next dense cust_id the first time it is
+-- seen (new customers numbered by first purchase) and keeps it across reloads.
+CREATE TABLE IF NOT EXISTS mart.customer_dim (
+  cust_id         int PRIMARY KEY,
+  cust_uid        text NOT NULL UNIQUE,
+  first_order_ts  timestamp
+);
+
+-- Earlier versions keyed these customer marts on the text cust_uid. Drop the ones that
+-- still have that column, once; the files that own them recreate them keyed on cust_id.
+-- Other mart tables are never touched, and after the first run no table matches.
+DO $$
+DECLARE t text;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['mart.rfm', 'mart.rfm_scored', 'mart.churn_features', 'mart.clv_proxy',
+                           'mart.churn_snapshot', 'mart.churn_snapshot_history', 'mart.churn_scores']
+  LOOP
+    IF EXISTS (SELECT 1 FROM pg_attribute
+               WHERE attrelid = to_regclass(t) AND attname = 'cust_uid' AND NOT attisdropped) THEN
+      EXECUTE format('DROP TABLE %s CASCADE', t);
+    END IF;
+  END LOOP;
+END $$;
+
+INSERT INTO mart.customer_dim (cust_id, cust_uid, first_order_ts)
 SELECT
-  fo.order_id,
-  fo.cust_uid,
-  fo.order_purchase_timestamp       AS order_ts,
-  fo.order_delivered_customer_date  AS delivered_ts,
-  fo.order_estimated_delivery_date  AS eta_ts,
-  fo.customer_id,
-  fo.cust_state,
-  fo.gmv,
-  fo.merchandise_total,
-  fo.freight_total,
-  fo.pay_total,
-  fo.review_score,
-  fo.main_payment_type,
-  fo.any_heavy_bulky,
+  (SELECT COALESCE(max(cust_id), 0) FROM mart.customer_dim)
+    + row_number() OVER (ORDER BY n.first_order_ts, n.cust_uid),
+  n.cust_uid,
+  n.first_order_ts
+FROM (
+  SELECT fo.cust_uid::text AS cust_uid, min(fo.order_purchase_timestamp)::timestamp AS first_order_ts
+  FROM raw.features_orders fo
+  WHERE fo.cust_uid IS NOT NULL
+    AND NOT EXISTS (SELECT 1 FROM mart.customer_dim d WHERE d.cust_uid = fo.cust_uid::text)
+  GROUP BY fo.cust_uid
+) n;
+ANALYZE mart.customer_dim;
+
+CREATE TABLE IF NOT EXISTS staging.orders (
+  order_id           text PRIMARY KEY,
+  cust_id            int,
+  order_ts           timestamp,
+  delivered_ts       timestamp,
+  eta_ts             timestamp,
+  customer_id        text,
+  cust_state         text,
+  gmv                numeric(18,6),
+  merchandise_total  numeric(18,6),
+  freight_total      numeric(18,6),
+  pay_total          numeric(18,6),
+  review_score       numeric(18,6),
+  main_payment_type  text,
+  any_heavy_bulky    boolean,
+  ontime_flag        int
+);
+
+TRUNCATE staging.orders;
+-- The reload gives the table a new relfilenode, which makes 06 rebuild bi_orders_daily
+-- in full; its change-tracking triggers are for in-place edits, so they are off meanwhile
+DO $$ BEGIN ALTER TABLE staging.orders DISABLE TRIGGER USER; END $$;
+-- Load without indexes and build them once at the end: faster than maintaining them per row
+ALTER TABLE staging.orders DROP CONSTRAINT IF EXISTS orders_pkey;
+DROP INDEX IF EXISTS staging.idx_orders_cust_ts;
+DROP INDEX IF EXISTS staging.brin_orders_ts;
+
+INSERT INTO staging.orders
+SELECT
+  fo.order_id::text,
+  cd.cust_id,
+  fo.order_purchase_timestamp::timestamp       AS order_ts,
+  fo.order_delivered_customer_date::timestamp  AS delivered_ts,
+  fo.order_estimated_delivery_date::timestamp  AS eta_ts,
+  fo.customer_id::text,
+  fo.cust_state::text,
+  fo.gmv::numeric(18,6),
+  fo.merchandise_total::numeric(18,6),
+  fo.freight_total::numeric(18,6),
+  fo.pay_total::numeric(18,6),
+  fo.review_score::numeric(18,6),
+  fo.main_payment_type::text,
+  fo.any_heavy_bulky::boolean,
   CASE
     WHEN fo.order_delivered_customer_date IS NOT NULL
      AND fo.order_estimated_delivery_date IS NOT NULL
      AND fo.order_delivered_customer_date <= fo.order_estimated_delivery_date
     THEN 1 ELSE 0
   END AS ontime_flag
-FROM raw.features_orders fo;
+FROM raw.features_orders fo
+LEFT JOIN mart.customer_dim cd ON cd.cust_uid = fo.cust_uid::text
+ORDER BY fo.order_purchase_timestamp;
+
+ALTER TABLE staging.orders ADD PRIMARY KEY (order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_cust_ts ON staging.orders (cust_id, order_ts);
+CREATE INDEX IF NOT EXISTS brin_orders_ts ON staging.orders USING brin (order_ts);
+DO $$ BEGIN ALTER TABLE staging.orders ENABLE TRIGGER USER; END $$;
+ANALYZE staging.orders;
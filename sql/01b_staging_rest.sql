@@ -1,41 +1,98 @@
-﻿CREATE SCHEMA IF NOT EXISTS staging;
+CREATE SCHEMA IF NOT EXISTS staging;
 
--- Items (already numeric from ingest)
-CREATE OR REPLACE VIEW staging.order_items AS
+-- Typed copies of the other raw tables (see 01a for staging.orders). The casts run once
+-- per load. The marts only hash-join order_items to orders, so order_items gets no index;
+-- the small lookup tables keep their natural key.
+
+-- Earlier versions defined these as views; replace them once
+DO $$
+DECLARE t text;
+BEGIN
+  FOR t IN
+    SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'staging' AND c.relkind = 'v'
+      AND c.relname IN ('order_items', 'products', 'reviews', 'payments')
+  LOOP
+    EXECUTE format('DROP VIEW staging.%I CASCADE', t);
+  END LOOP;
+END $$;
+
+-- Items
+CREATE TABLE IF NOT EXISTS staging.order_items (
+  order_id      text,
+  product_id    text,
+  seller_id     text,
+  item_price    numeric(18,6),
+  item_freight  numeric(18,6)
+);
+TRUNCATE staging.order_items;
+INSERT INTO staging.order_items
 SELECT
-  order_id,
-  product_id,
-  seller_id,
-  COALESCE(price, 0)::numeric(18,6)         AS item_price,
-  COALESCE(freight_value, 0)::numeric(18,6) AS item_freight
-FROM raw.order_items_clean;
+  oi.order_id::text,
+  oi.product_id::text,
+  oi.seller_id::text,
+  COALESCE(NULLIF(oi.price::text,'')::numeric, 0)::numeric(18,6)         AS item_price,
+  COALESCE(NULLIF(oi.freight_value::text,'')::numeric, 0)::numeric(18,6) AS item_freight
+FROM raw.order_items_clean oi;
+ANALYZE staging.order_items;
 
--- Products (use boolean is_heavy_bulky from ingest)
-CREATE OR REPLACE VIEW staging.products AS
+-- Products (boolean is_heavy_bulky from ingest)
+CREATE TABLE IF NOT EXISTS staging.products (
+  product_id             text PRIMARY KEY,
+  product_category_name  text,
+  product_weight_g       numeric(18,6),
+  product_length_cm      numeric(18,6),
+  product_height_cm      numeric(18,6),
+  product_width_cm       numeric(18,6),
+  product_volume_cm3     numeric(18,6),
+  heavy_bulky_flag       int
+);
+TRUNCATE staging.products;
+ALTER TABLE staging.products DROP CONSTRAINT IF EXISTS products_pkey;
+INSERT INTO staging.products
 SELECT
-  product_id,
-  product_category_name,
-  product_weight_g::numeric(18,6)  AS product_weight_g,
-  product_length_cm::numeric(18,6) AS product_length_cm,
-  product_height_cm::numeric(18,6) AS product_height_cm,
-  product_width_cm::numeric(18,6)  AS product_width_cm,
-  product_volume_cm3::numeric(18,6) AS product_volume_cm3,
+  product_id::text,
+  product_category_name::text,
+  product_weight_g::numeric(18,6),
+  product_length_cm::numeric(18,6),
+  product_height_cm::numeric(18,6),
+  product_width_cm::numeric(18,6),
+  product_volume_cm3::numeric(18,6),
   CASE WHEN is_heavy_bulky THEN 1 ELSE 0 END AS heavy_bulky_flag
 FROM raw.products_clean;
+ALTER TABLE staging.products ADD PRIMARY KEY (product_id);
+ANALYZE staging.products;
 
 -- Reviews
-CREATE OR REPLACE VIEW staging.reviews AS
-SELECT
-  order_id,
-  review_score::numeric(10,2) AS review_score
+CREATE TABLE IF NOT EXISTS staging.reviews (
+  order_id      text PRIMARY KEY,
+  review_score  numeric(10,2)
+);
+TRUNCATE staging.reviews;
+ALTER TABLE staging.reviews DROP CONSTRAINT IF EXISTS reviews_pkey;
+INSERT INTO staging.reviews
+SELECT order_id::text, review_score::numeric(10,2)
 FROM raw.order_reviews_dedup;
+ALTER TABLE staging.reviews ADD PRIMARY KEY (order_id);
+ANALYZE staging.reviews;
 
--- Payments (map to your actual columns)
-CREATE OR REPLACE VIEW staging.payments AS
+-- Payments
+CREATE TABLE IF NOT EXISTS staging.payments (
+  order_id           text PRIMARY KEY,
+  payment_type       text,
+  payment_value      numeric(18,6),
+  installments_max   int,
+  n_payment_methods  int
+);
+TRUNCATE staging.payments;
+ALTER TABLE staging.payments DROP CONSTRAINT IF EXISTS payments_pkey;
+INSERT INTO staging.payments
 SELECT
-  pa.order_id,
-  pa.main_payment_type AS payment_type,
-  pa.pay_total::numeric(18,6)     AS payment_value,
-  pa.installments_max,
-  pa.n_payment_methods
+  pa.order_id::text,
+  pa.main_payment_type::text     AS payment_type,
+  pa.pay_total::numeric(18,6)    AS payment_value,
+  pa.installments_max::int,
+  pa.n_payment_methods::int
 FROM raw.payments_order_agg pa;
+ALTER TABLE staging.payments ADD PRIMARY KEY (order_id);
+ANALYZE staging.payments;
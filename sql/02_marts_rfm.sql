@@ -3,7 +3,7 @@ CREATE SCHEMA IF NOT EXISTS mart;
 -- Optional: SET olist.ref_date = '2018-10-17';
 
 CREATE TABLE IF NOT EXISTS mart.rfm (
-  cust_uid text PRIMARY KEY,
+  cust_id int PRIMARY KEY,
   recency_days int,
   frequency int,
   monetary numeric(18,6)
@@ -16,17 +16,17 @@ WITH ref AS (
     (SELECT max(order_ts)::date FROM staging.orders)
   ) AS ref_date
 )
-INSERT INTO mart.rfm (cust_uid, recency_days, frequency, monetary)
+INSERT INTO mart.rfm (cust_id, recency_days, frequency, monetary)
 SELECT
-  o.cust_uid,
+  o.cust_id,
   (SELECT ref_date FROM ref) - max(o.order_ts)::date AS recency_days,
   COUNT(DISTINCT o.order_id) AS frequency,
   COALESCE(SUM(o.gmv),0)::numeric(18,6) AS monetary
 FROM staging.orders o
-GROUP BY o.cust_uid;
+GROUP BY o.cust_id;
 
 CREATE TABLE IF NOT EXISTS mart.rfm_scored (
-  cust_uid text PRIMARY KEY,
+  cust_id int PRIMARY KEY,
   recency_days int,
   frequency int,
   monetary numeric(18,6),
@@ -36,17 +36,17 @@ CREATE TABLE IF NOT EXISTS mart.rfm_scored (
 TRUNCATE mart.rfm_scored;
 
 WITH r_score AS (
-  SELECT cust_uid, recency_days, NTILE(5) OVER (ORDER BY recency_days ASC, cust_uid) AS r FROM mart.rfm
+  SELECT cust_id, recency_days, NTILE(5) OVER (ORDER BY recency_days ASC, cust_id) AS r FROM mart.rfm
 ),
 f_score AS (
-  SELECT cust_uid, NTILE(5) OVER (ORDER BY frequency DESC, cust_uid) AS f FROM mart.rfm
+  SELECT cust_id, NTILE(5) OVER (ORDER BY frequency DESC, cust_id) AS f FROM mart.rfm
 ),
 m_score AS (
-  SELECT cust_uid, NTILE(5) OVER (ORDER BY monetary DESC, cust_uid) AS m FROM mart.rfm
+  SELECT cust_id, NTILE(5) OVER (ORDER BY monetary DESC, cust_id) AS m FROM mart.rfm
 )
 INSERT INTO mart.rfm_scored
-SELECT rf.cust_uid, rf.recency_days, rf.frequency, rf.monetary, r.r, f.f, m.m, (r.r + f.f + m.m) AS rfm_sum
+SELECT rf.cust_id, rf.recency_days, rf.frequency, rf.monetary, r.r, f.f, m.m, (r.r + f.f + m.m) AS rfm_sum
 FROM mart.rfm rf
-JOIN r_score r USING (cust_uid)
-JOIN f_score f USING (cust_uid)
-JOIN m_score m USING (cust_uid);
+JOIN r_score r USING (cust_id)
+JOIN f_score f USING (cust_id)
+JOIN m_score m USING (cust_id);
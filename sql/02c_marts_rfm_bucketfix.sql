@@ -5,7 +5,7 @@ TRUNCATE mart.rfm_scored;
 
 WITH dist AS (
   SELECT
-    cust_uid, recency_days, frequency, monetary,
+    cust_id, recency_days, frequency, monetary,
     cume_dist() OVER (ORDER BY recency_days ASC)  AS cd_r,
     cume_dist() OVER (ORDER BY frequency    DESC) AS cd_f,
     cume_dist() OVER (ORDER BY monetary     DESC) AS cd_m
@@ -13,16 +13,16 @@ WITH dist AS (
 ),
 buckets AS (
   SELECT
-    cust_uid, recency_days, frequency, monetary,
+    cust_id, recency_days, frequency, monetary,
     -- Map (0,1] -> {1..5} by clamping 1.0 down just a hair
     (1 + floor(LEAST(cd_r, 0.9999999999) * 5))::int AS br,
     (1 + floor(LEAST(cd_f, 0.9999999999) * 5))::int AS bf,
     (1 + floor(LEAST(cd_m, 0.9999999999) * 5))::int AS bm
   FROM dist
 )
-INSERT INTO mart.rfm_scored (cust_uid, recency_days, frequency, monetary, r, f, m, rfm_sum)
+INSERT INTO mart.rfm_scored (cust_id, recency_days, frequency, monetary, r, f, m, rfm_sum)
 SELECT
-  cust_uid, recency_days, frequency, monetary,
+  cust_id, recency_days, frequency, monetary,
   (6 - br) AS r,  -- smaller recency = more recent = better
   (6 - bf) AS f,  -- larger frequency = better
   (6 - bm) AS m,  -- larger monetary  = better
@@ -13,21 +13,21 @@ TRUNCATE mart.rfm_scored;
 
 WITH r_dist AS (
   SELECT
-    cust_uid,
+    cust_id,
     recency_days,
     cume_dist() OVER (ORDER BY recency_days ASC) AS cd_r
   FROM mart.rfm
 ),
 m_dist AS (
   SELECT
-    cust_uid,
+    cust_id,
     monetary,
     cume_dist() OVER (ORDER BY monetary DESC) AS cd_m
   FROM mart.rfm
 ),
 r_b AS (
   SELECT
-    cust_uid,
+    cust_id,
     recency_days,
     -- clamp 1.0 a hair down so bucket is 1..5 then flip so 5=best (most recent)
     (6 - (1 + floor(LEAST(cd_r, 0.9999999999) * 5))::int) AS r
@@ -35,7 +35,7 @@ r_b AS (
 ),
 m_b AS (
   SELECT
-    cust_uid,
+    cust_id,
     monetary,
     -- 5 = highest monetary
     (6 - (1 + floor(LEAST(cd_m, 0.9999999999) * 5))::int) AS m
@@ -43,7 +43,7 @@ m_b AS (
 ),
 f_b AS (
   SELECT
-    cust_uid,
+    cust_id,
     frequency,
     CASE
       WHEN frequency IS NULL THEN 1
@@ -54,9 +54,9 @@ f_b AS (
     END AS f
   FROM mart.rfm
 )
-INSERT INTO mart.rfm_scored (cust_uid, recency_days, frequency, monetary, r, f, m, rfm_sum)
+INSERT INTO mart.rfm_scored (cust_id, recency_days, frequency, monetary, r, f, m, rfm_sum)
 SELECT
-  rf.cust_uid,
+  rf.cust_id,
   rf.recency_days,
   rf.frequency,
   rf.monetary,
@@ -65,6 +65,6 @@ SELECT
   m_b.m,
   (r_b.r + f_b.f + m_b.m) AS rfm_sum
 FROM mart.rfm rf
-JOIN r_b   ON r_b.cust_uid = rf.cust_uid
-JOIN m_b   ON m_b.cust_uid = rf.cust_uid
-JOIN f_b   ON f_b.cust_uid = rf.cust_uid;
+JOIN r_b   ON r_b.cust_id = rf.cust_id
+JOIN m_b   ON m_b.cust_id = rf.cust_id
+JOIN f_b   ON f_b.cust_id = rf.cust_id;
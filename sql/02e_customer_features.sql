@@ -0,0 +1,128 @@
+CREATE SCHEMA IF NOT EXISTS mart;
+
+-- Earlier versions returned the text cust_uid; a result type cannot be replaced in place
+DO $$
+BEGIN
+  IF pg_get_function_result(to_regprocedure('mart.customer_features(date, integer)')) LIKE '%cust_uid text%' THEN
+    DROP FUNCTION IF EXISTS mart.churn_snapshot_at(date);
+    DROP FUNCTION mart.customer_features(date, integer);
+  END IF;
+END $$;
+
+-- Shared per-customer feature builder for 03_marts_churn_features and 05_churn_snapshot.
+-- One scan and one GROUP BY over staging.orders; every aggregate is a FILTER clause.
+--   p_cutoff  : features use orders with order_ts::date <= p_cutoff; the 30/60/90d windows end there
+--   p_horizon : orders in (p_cutoff, p_cutoff + p_horizon] are counted as orders_next (for labels)
+-- Only customers with at least one order on/before p_cutoff are returned.
+CREATE OR REPLACE FUNCTION mart.customer_features(p_cutoff date, p_horizon int DEFAULT 0)
+RETURNS TABLE (
+  cust_id int,
+  recency_days int,
+  frequency int,
+  monetary numeric(18,6),
+  orders_30d int,
+  orders_60d int,
+  orders_90d int,
+  avg_order_value numeric(18,6),
+  avg_delivery_days numeric(18,6),
+  avg_review_score numeric(18,6),
+  pay_share_card numeric(18,6),
+  pay_share_boleto numeric(18,6),
+  pay_share_voucher numeric(18,6),
+  heavy_bulky_share numeric(18,6),
+  ontime_rate numeric(18,6),
+  orders_next int
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT
+    o.cust_id,
+    (p_cutoff - max(o.d) FILTER (WHERE o.pre))::int                                     AS recency_days,
+    (COUNT(DISTINCT o.order_id) FILTER (WHERE o.pre))::int                              AS frequency,
+    COALESCE(SUM(o.gmv) FILTER (WHERE o.pre), 0)::numeric(18,6)                         AS monetary,
+    (COUNT(*) FILTER (WHERE o.pre AND o.d > p_cutoff - 30))::int                        AS orders_30d,
+    (COUNT(*) FILTER (WHERE o.pre AND o.d > p_cutoff - 60))::int                        AS orders_60d,
+    (COUNT(*) FILTER (WHERE o.pre AND o.d > p_cutoff - 90))::int                        AS orders_90d,
+    (AVG(COALESCE(o.gmv, 0)) FILTER (WHERE o.pre))::numeric(18,6)                       AS avg_order_value,
+    (AVG(EXTRACT(EPOCH FROM (o.delivered_ts - o.order_ts)) / 86400.0)
+       FILTER (WHERE o.pre AND o.delivered_ts IS NOT NULL AND o.order_ts IS NOT NULL))::numeric(18,6)
+                                                                                        AS avg_delivery_days,
+    (AVG(o.review_score) FILTER (WHERE o.pre))::numeric(18,6)                           AS avg_review_score,
+    (AVG(CASE WHEN o.pay_type = 'credit_card' THEN 1 ELSE 0 END) FILTER (WHERE o.pre))::numeric(18,6)
+                                                                                        AS pay_share_card,
+    (AVG(CASE WHEN o.pay_type = 'boleto'      THEN 1 ELSE 0 END) FILTER (WHERE o.pre))::numeric(18,6)
+                                                                                        AS pay_share_boleto,
+    (AVG(CASE WHEN o.pay_type = 'voucher'     THEN 1 ELSE 0 END) FILTER (WHERE o.pre))::numeric(18,6)
+                                                                                        AS pay_share_voucher,
+    (AVG(CASE WHEN o.any_heavy_bulky THEN 1 ELSE 0 END) FILTER (WHERE o.pre))::numeric(18,6)
+                                                                                        AS heavy_bulky_share,
+    (AVG(o.ontime_flag) FILTER (WHERE o.pre))::numeric(18,6)                            AS ontime_rate,
+    (COUNT(*) FILTER (WHERE NOT o.pre))::int                                            AS orders_next
+  FROM (
+    SELECT
+      s.*,
+      s.order_ts::date             AS d,
+      s.order_ts::date <= p_cutoff AS pre,
+      LOWER(s.main_payment_type)   AS pay_type
+    FROM staging.orders s
+    WHERE s.order_ts < p_cutoff + p_horizon + 1   -- order_ts::date <= cutoff + horizon, as a range
+  ) o
+  GROUP BY o.cust_id
+  HAVING COUNT(*) FILTER (WHERE o.pre) > 0
+$$;
+
+-- One churn snapshot at p_t0: features as of p_t0, R/M/F scores and the 90-day churn label
+-- (1 = no order in (p_t0, p_t0 + 90 days]). Rows match mart.churn_snapshot column for column.
+-- Used by 05_churn_snapshot (latest t0) and src/build_snapshot_history.py (rolling t0 backfill).
+CREATE OR REPLACE FUNCTION mart.churn_snapshot_at(p_t0 date)
+RETURNS TABLE (
+  cust_id int,
+  snapshot_date date,
+  churn_90d int,
+  recency_days int,
+  frequency int,
+  monetary numeric(18,6),
+  r int, f int, m int,
+  orders_30d int, orders_60d int, orders_90d int,
+  avg_order_value numeric(18,6),
+  avg_delivery_days numeric(18,6),
+  avg_review_score numeric(18,6),
+  pay_share_card numeric(18,6),
+  pay_share_boleto numeric(18,6),
+  pay_share_voucher numeric(18,6),
+  heavy_bulky_share numeric(18,6),
+  ontime_rate numeric(18,6)
+)
+LANGUAGE sql STABLE
+AS $$
+  SELECT
+    cf.cust_id,
+    p_t0 AS snapshot_date,
+    -- Label using FUTURE window after t0
+    CASE WHEN cf.orders_next > 0 THEN 0 ELSE 1 END AS churn_90d,
+    cf.recency_days,
+    cf.frequency,
+    cf.monetary,
+    -- Tie-robust R/M quintiles (5 = best) and rule-based F at t0
+    (6 - (1 + floor(LEAST(cume_dist() OVER (ORDER BY cf.recency_days ASC), 0.9999999999) * 5))::int) AS r,
+    CASE
+      WHEN cf.frequency IS NULL THEN 1
+      WHEN cf.frequency = 1 THEN 1
+      WHEN cf.frequency = 2 THEN 3
+      WHEN cf.frequency BETWEEN 3 AND 4 THEN 4
+      ELSE 5
+    END AS f,
+    (6 - (1 + floor(LEAST(cume_dist() OVER (ORDER BY cf.monetary DESC),    0.9999999999) * 5))::int) AS m,
+    COALESCE(cf.orders_30d,0),
+    COALESCE(cf.orders_60d,0),
+    COALESCE(cf.orders_90d,0),
+    cf.avg_order_value,
+    cf.avg_delivery_days,
+    cf.avg_review_score,
+    COALESCE(cf.pay_share_card,0),
+    COALESCE(cf.pay_share_boleto,0),
+    COALESCE(cf.pay_share_voucher,0),
+    COALESCE(cf.heavy_bulky_share,0),
+    COALESCE(cf.ontime_rate,0)
+  FROM mart.customer_features(p_t0, 90) cf
+$$;
@@ -4,7 +4,7 @@ CREATE SCHEMA IF NOT EXISTS mart;
 -- SET olist.ref_date = '2018-10-17';
 
 CREATE TABLE IF NOT EXISTS mart.churn_features (
-  cust_uid text PRIMARY KEY,
+  cust_id int PRIMARY KEY,
   recency_days int,
   frequency int,
   monetary numeric(18,6),
@@ -23,80 +23,29 @@ CREATE TABLE IF NOT EXISTS mart.churn_features (
 );
 TRUNCATE mart.churn_features;
 
+-- Per-customer aggregates come from the shared single-pass builder
+-- mart.customer_features (sql/02e_customer_features.sql), as of ref_date.
 WITH ref AS (
   SELECT COALESCE(
     NULLIF(current_setting('olist.ref_date', true), '')::date,
     (SELECT max(order_ts)::date FROM staging.orders)
   ) AS ref_date
 ),
-orders AS (
-  SELECT * FROM staging.orders
-),
-deliver AS (
-  SELECT o.order_id, o.cust_uid,
-         EXTRACT(EPOCH FROM (o.delivered_ts - o.order_ts))/86400.0 AS delivery_days
-  FROM orders o
-  WHERE o.delivered_ts IS NOT NULL AND o.order_ts IS NOT NULL
-),
-pmix AS (
-  SELECT
-    o.cust_uid,
-    AVG(CASE WHEN LOWER(o.main_payment_type)='credit_card' THEN 1 ELSE 0 END)::numeric(18,6) AS pay_share_card,
-    AVG(CASE WHEN LOWER(o.main_payment_type)='boleto'      THEN 1 ELSE 0 END)::numeric(18,6) AS pay_share_boleto,
-    AVG(CASE WHEN LOWER(o.main_payment_type)='voucher'     THEN 1 ELSE 0 END)::numeric(18,6) AS pay_share_voucher
-  FROM orders o
-  GROUP BY o.cust_uid
-),
-o_recent AS (
-  SELECT o.cust_uid,
-         SUM(CASE WHEN o.order_ts::date > (ref.ref_date - INTERVAL '30 days') THEN 1 ELSE 0 END) AS orders_30d,
-         SUM(CASE WHEN o.order_ts::date > (ref.ref_date - INTERVAL '60 days') THEN 1 ELSE 0 END) AS orders_60d,
-         SUM(CASE WHEN o.order_ts::date > (ref.ref_date - INTERVAL '90 days') THEN 1 ELSE 0 END) AS orders_90d
-  FROM orders o, ref
-  GROUP BY o.cust_uid
-),
-aov AS (
-  SELECT o.cust_uid, AVG(COALESCE(o.gmv,0))::numeric(18,6) AS avg_order_value
-  FROM orders o
-  GROUP BY o.cust_uid
-),
-deliv_cust AS (
-  SELECT d.cust_uid, AVG(d.delivery_days)::numeric(18,6) AS avg_delivery_days
-  FROM deliver d
-  GROUP BY d.cust_uid
-),
-review_cust AS (
-  SELECT o.cust_uid, AVG(o.review_score)::numeric(18,6) AS avg_review_score
-  FROM orders o
-  GROUP BY o.cust_uid
-),
-heavy_cust AS (
-  SELECT o.cust_uid, AVG(CASE WHEN o.any_heavy_bulky THEN 1 ELSE 0 END)::numeric(18,6) AS heavy_bulky_share
-  FROM orders o
-  GROUP BY o.cust_uid
-),
-ontime AS (
-  SELECT o.cust_uid, AVG(o.ontime_flag)::numeric(18,6) AS ontime_rate
-  FROM orders o
-  GROUP BY o.cust_uid
+feat AS (
+  SELECT cf.*
+  FROM ref, mart.customer_features(ref.ref_date) cf
 )
 INSERT INTO mart.churn_features
 SELECT
-  r.cust_uid, r.recency_days, r.frequency, r.monetary,
+  r.cust_id, r.recency_days, r.frequency, r.monetary,
   rs.r, rs.f, rs.m,
-  orc.orders_30d, orc.orders_60d, orc.orders_90d,
-  a.avg_order_value,
-  d.avg_delivery_days,
-  rv.avg_review_score,
-  COALESCE(p.pay_share_card,0), COALESCE(p.pay_share_boleto,0), COALESCE(p.pay_share_voucher,0),
-  COALESCE(h.heavy_bulky_share,0),
-  otime.ontime_rate
+  cf.orders_30d, cf.orders_60d, cf.orders_90d,
+  cf.avg_order_value,
+  cf.avg_delivery_days,
+  cf.avg_review_score,
+  COALESCE(cf.pay_share_card,0), COALESCE(cf.pay_share_boleto,0), COALESCE(cf.pay_share_voucher,0),
+  COALESCE(cf.heavy_bulky_share,0),
+  cf.ontime_rate
 FROM mart.rfm r
-JOIN mart.rfm_scored rs USING (cust_uid)
-LEFT JOIN o_recent   orc ON orc.cust_uid = r.cust_uid
-LEFT JOIN aov        a   ON a.cust_uid   = r.cust_uid
-LEFT JOIN deliv_cust d   ON d.cust_uid   = r.cust_uid
-LEFT JOIN review_cust rv ON rv.cust_uid  = r.cust_uid
-LEFT JOIN pmix       p   ON p.cust_uid   = r.cust_uid
-LEFT JOIN heavy_cust h   ON h.cust_uid   = r.cust_uid
-LEFT JOIN ontime     otime ON otime.cust_uid = r.cust_uid;
+JOIN mart.rfm_scored rs USING (cust_id)
+LEFT JOIN feat cf ON cf.cust_id = r.cust_id;
@@ -20,40 +20,36 @@ ORDER BY d;
 -- ========== CLV PROXY (rolling 90-day average per customer) ==========
 -- Approach:
 --   1) Aggregate to customer-day GMV
---   2) For each (cust_uid, day), compute sum over prior 90 days (inclusive) / 90
+--   2) For each (cust_id, day), sum over prior 90 days (inclusive) / 90
+--      via a RANGE window frame: one sort + one pass per customer instead of
+--      a correlated subquery per row.
+-- Incremental refresh (only customers with new orders): sql/04b_clv_incremental.sql
 
 CREATE TABLE IF NOT EXISTS mart.clv_proxy (
-  cust_uid text,
+  cust_id int,
   as_of_date date,
   clv_90d numeric(18,6),
-  PRIMARY KEY (cust_uid, as_of_date)
+  PRIMARY KEY (cust_id, as_of_date)
 );
 TRUNCATE mart.clv_proxy;
 
 WITH daily_cust AS (
   SELECT
-    o.cust_uid,
+    o.cust_id,
     o.order_ts::date AS as_of_date,
     COALESCE(SUM(o.gmv),0)::numeric(18,6) AS gmv_day
   FROM staging.orders o
-  GROUP BY o.cust_uid, o.order_ts::date
-),
-roll AS (
-  SELECT
-    a.cust_uid,
-    a.as_of_date,
-    (
-      SELECT COALESCE(SUM(b.gmv_day),0)
-      FROM daily_cust b
-      WHERE b.cust_uid = a.cust_uid
-        AND b.as_of_date > a.as_of_date - INTERVAL '90 days'
-        AND b.as_of_date <= a.as_of_date
-    ) / 90.0 AS clv_90d
-  FROM daily_cust a
+  GROUP BY o.cust_id, o.order_ts::date
 )
-INSERT INTO mart.clv_proxy (cust_uid, as_of_date, clv_90d)
-SELECT cust_uid, as_of_date, clv_90d::numeric(18,6)
-FROM roll;
+INSERT INTO mart.clv_proxy (cust_id, as_of_date, clv_90d)
+SELECT
+  cust_id,
+  as_of_date,
+  (SUM(gmv_day) OVER (
+     PARTITION BY cust_id ORDER BY as_of_date
+     RANGE BETWEEN INTERVAL '89 days' PRECEDING AND CURRENT ROW
+   ) / 90.0)::numeric(18,6) AS clv_90d
+FROM daily_cust;
 
 -- Helpful indexes for snappy lookups
-CREATE INDEX IF NOT EXISTS idx_clv_proxy_cust_date ON mart.clv_proxy (cust_uid, as_of_date DESC);
+CREATE INDEX IF NOT EXISTS idx_clv_proxy_cust_date ON mart.clv_proxy (cust_id, as_of_date DESC);
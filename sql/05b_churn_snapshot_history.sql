@@ -0,0 +1,25 @@
+CREATE SCHEMA IF NOT EXISTS mart;
+
+-- Rolling-origin training set: one mart.churn_snapshot_at(t0) per snapshot_date.
+-- Partitions (one per t0) are built and attached by src/build_snapshot_history.py;
+-- this file only creates the empty parent so it is safe to re-run.
+-- reads: mart.churn_snapshot_at
+CREATE TABLE IF NOT EXISTS mart.churn_snapshot_history (
+  cust_id int NOT NULL,
+  snapshot_date date NOT NULL,
+  churn_90d int,
+  recency_days int,
+  frequency int,
+  monetary numeric(18,6),
+  r int, f int, m int,
+  orders_30d int, orders_60d int, orders_90d int,
+  avg_order_value numeric(18,6),
+  avg_delivery_days numeric(18,6),
+  avg_review_score numeric(18,6),
+  pay_share_card numeric(18,6),
+  pay_share_boleto numeric(18,6),
+  pay_share_voucher numeric(18,6),
+  heavy_bulky_share numeric(18,6),
+  ontime_rate numeric(18,6),
+  PRIMARY KEY (snapshot_date, cust_id)
+) PARTITION BY LIST (snapshot_date);
@@ -1,17 +1,33 @@
 CREATE SCHEMA IF NOT EXISTS staging;
 CREATE SCHEMA IF NOT EXISTS mart;
 
--- 1) Items view (safe casts)
-CREATE OR REPLACE VIEW staging.order_items AS
-SELECT
-  oi.order_id,
-  oi.product_id,
-  oi.seller_id,
-  COALESCE(NULLIF(oi.price::text,'')::numeric, 0)::numeric(18,6)         AS item_price,
-  COALESCE(NULLIF(oi.freight_value::text,'')::numeric, 0)::numeric(18,6) AS item_freight
-FROM raw.order_items_clean oi;
-
--- 2) Daily KPI table
+-- BI marts are refreshed without blocking dashboards:
+--   * bi_orders_daily stays a table, updated in place for the days whose orders changed
+--     since the last run (triggers on staging.orders, which it reads, record them). It is
+--     rebuilt in full when the table is new or staging.orders was reloaded by 01a (new
+--     relfilenode).
+--   * seller_pareto, geo_state and law3_scores are materialized views with a unique index
+--     each, refreshed CONCURRENTLY: readers keep the old contents until the new ones commit.
+--     run_sql keeps an md5 of each CREATE MATERIALIZED VIEW statement as the view's comment
+--     and drops the view before running this file when its statement changed, so an
+--     edited query is recreated here rather than skipped by IF NOT EXISTS.
+
+-- 0) Earlier versions built the three views as tables; replace those once
+DO $$
+DECLARE t text;
+BEGIN
+  FOR t IN
+    SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'mart' AND c.relkind = 'r'
+      AND c.relname IN ('seller_pareto', 'geo_state', 'law3_scores')
+  LOOP
+    EXECUTE format('DROP TABLE mart.%I CASCADE', t);
+  END LOOP;
+END $$;
+
+-- 1) Items: staging.order_items is a typed table built by 01b
+
+-- 2) Daily KPI table (incremental)
 CREATE TABLE IF NOT EXISTS mart.bi_orders_daily (
   d date PRIMARY KEY,
   orders int,
@@ -21,7 +37,99 @@ CREATE TABLE IF NOT EXISTS mart.bi_orders_daily (
   avg_review numeric(10,6),
   heavy_bulky_share numeric(10,6)
 );
-TRUNCATE mart.bi_orders_daily;
+
+-- Purchase days touched since the last refresh. Append-only: concurrent writers only
+-- insert, so they never wait on each other's marks; a refresh de-duplicates when it claims.
+CREATE TABLE IF NOT EXISTS mart._bi_orders_daily_dirty (
+  d date NOT NULL,
+  marked_at timestamptz DEFAULT now()
+);
+-- Earlier versions upserted one row per day (primary key on d, plus a claimed flag).
+-- Checked first: ALTER TABLE would lock out the writers even when there is nothing to drop.
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_schema = 'mart' AND table_name = '_bi_orders_daily_dirty' AND column_name = 'claimed') THEN
+    ALTER TABLE mart._bi_orders_daily_dirty DROP CONSTRAINT IF EXISTS _bi_orders_daily_dirty_pkey,
+                                            DROP COLUMN claimed;
+  END IF;
+END $$;
+-- One row while bi_orders_daily is current for staging.orders at source_version
+CREATE TABLE IF NOT EXISTS mart._bi_orders_daily_state (
+  source_version text,
+  refreshed_at timestamptz
+);
+
+-- Earlier versions tracked changes on raw.features_orders, which bi_orders_daily does not
+-- read; drop those triggers once (checked first, DROP TRIGGER locks the table)
+DO $$
+DECLARE t text;
+BEGIN
+  FOR t IN
+    SELECT tgname FROM pg_trigger
+    WHERE tgrelid = to_regclass('raw.features_orders') AND tgname IN ('bi_dirty_ins', 'bi_dirty_upd', 'bi_dirty_del')
+  LOOP
+    EXECUTE format('DROP TRIGGER %I ON raw.features_orders', t);
+  END LOOP;
+END $$;
+
+-- Row changes to staging.orders mark their old and new purchase days
+CREATE OR REPLACE FUNCTION mart.bi_mark_dirty_days() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO mart._bi_orders_daily_dirty (d)
+    SELECT DISTINCT order_ts::date FROM new_rows WHERE order_ts IS NOT NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO mart._bi_orders_daily_dirty (d)
+    SELECT DISTINCT order_ts::date FROM old_rows WHERE order_ts IS NOT NULL;
+  END IF;
+  RETURN NULL;
+END $$;
+
+-- Transition tables allow one event per trigger. Creating a trigger locks the table
+-- against writes, so they are only created when missing (e.g. after a re-ingest).
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'staging.orders'::regclass AND tgname = 'bi_dirty_ins') THEN
+    CREATE TRIGGER bi_dirty_ins AFTER INSERT ON staging.orders
+      REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION mart.bi_mark_dirty_days();
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'staging.orders'::regclass AND tgname = 'bi_dirty_upd') THEN
+    CREATE TRIGGER bi_dirty_upd AFTER UPDATE ON staging.orders
+      REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION mart.bi_mark_dirty_days();
+  END IF;
+  IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = 'staging.orders'::regclass AND tgname = 'bi_dirty_del') THEN
+    CREATE TRIGGER bi_dirty_del AFTER DELETE ON staging.orders
+      REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION mart.bi_mark_dirty_days();
+  END IF;
+END $$;
+
+-- A reloaded source table (01a truncates and refills it) invalidates the state
+DO $$
+BEGIN
+  DELETE FROM mart._bi_orders_daily_state
+  WHERE source_version IS DISTINCT FROM
+        (SELECT relfilenode::text FROM pg_class WHERE oid = 'staging.orders'::regclass);
+END $$;
+
+-- Claim the marks committed so far. Marks committed after the DELETE stay in the log
+-- for the next run; if this run fails, the rollback puts the claimed ones back.
+CREATE TEMP TABLE _bi_claimed (d date PRIMARY KEY) ON COMMIT DROP;
+DO $$
+BEGIN
+  WITH claimed AS (DELETE FROM mart._bi_orders_daily_dirty RETURNING d)
+  INSERT INTO _bi_claimed SELECT DISTINCT d FROM claimed;
+  ANALYZE _bi_claimed;
+END $$;
+
+-- Without a current state row every day is rebuilt. DELETE rather than TRUNCATE, so
+-- readers keep seeing the old rows until this transaction commits.
+DELETE FROM mart.bi_orders_daily b
+WHERE NOT EXISTS (SELECT 1 FROM mart._bi_orders_daily_state)
+   OR b.d IN (SELECT d FROM _bi_claimed);
+
 INSERT INTO mart.bi_orders_daily (d, orders, gmv, ontime_rate, late_rate, avg_review, heavy_bulky_share)
 SELECT
   o.order_ts::date AS d,
@@ -32,18 +140,24 @@ SELECT
   AVG(o.review_score)::numeric(10,6) AS avg_review,
   AVG(CASE WHEN o.any_heavy_bulky THEN 1 ELSE 0 END)::numeric(10,6) AS heavy_bulky_share
 FROM staging.orders o
+-- The lower bound is a plain range on order_ts, so the BRIN index skips older blocks
+WHERE o.order_ts >= (SELECT CASE WHEN EXISTS (SELECT 1 FROM mart._bi_orders_daily_state)
+                                 THEN min(d) ELSE '-infinity'::date END
+                     FROM _bi_claimed)
+  AND (NOT EXISTS (SELECT 1 FROM mart._bi_orders_daily_state)
+       OR o.order_ts::date IN (SELECT d FROM _bi_claimed))
 GROUP BY o.order_ts::date
 ORDER BY d;
 
--- 3) Seller Pareto table
-CREATE TABLE IF NOT EXISTS mart.seller_pareto (
-  seller_id text,
-  state text,
-  gmv numeric(18,6),
-  rank int,
-  cumulative_share numeric(10,6)
-);
-TRUNCATE mart.seller_pareto;
+DO $$
+BEGIN
+  DELETE FROM mart._bi_orders_daily_state;
+  INSERT INTO mart._bi_orders_daily_state (source_version, refreshed_at)
+  SELECT relfilenode::text, now() FROM pg_class WHERE oid = 'staging.orders'::regclass;
+END $$;
+
+-- 3) Seller Pareto view
+CREATE MATERIALIZED VIEW IF NOT EXISTS mart.seller_pareto AS
 WITH item_dest AS (
   SELECT
     oi.seller_id,
@@ -63,7 +177,7 @@ seller_state_counts AS (
 seller_dominant_state AS (
   SELECT seller_id, cust_state AS state
   FROM (
-    SELECT s.*, ROW_NUMBER() OVER (PARTITION BY seller_id ORDER BY c DESC) AS rn
+    SELECT s.*, ROW_NUMBER() OVER (PARTITION BY seller_id ORDER BY c DESC, cust_state) AS rn
     FROM seller_state_counts s
   ) z WHERE z.rn=1
 ),
@@ -78,26 +192,20 @@ seller_rank AS (
   FROM seller_tot t
   LEFT JOIN seller_dominant_state d USING(seller_id)
 )
-INSERT INTO mart.seller_pareto (seller_id, state, gmv, rank, cumulative_share)
 SELECT
-  seller_id,
-  state,
-  gmv_total AS gmv,
-  rnk AS rank,
+  seller_id::text AS seller_id,
+  state::text AS state,
+  gmv_total::numeric(18,6) AS gmv,
+  rnk::int AS rank,
   (gmv_cum / NULLIF(gmv_all,0))::numeric(10,6) AS cumulative_share
-FROM seller_rank;
-
--- 4) Geo state table
-CREATE TABLE IF NOT EXISTS mart.geo_state (
-  state text PRIMARY KEY,
-  cust_share numeric(10,6),
-  seller_share numeric(10,6),
-  gmv_share numeric(10,6),
-  desert_index numeric(10,6)
-);
-TRUNCATE mart.geo_state;
+FROM seller_rank
+WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_seller_pareto ON mart.seller_pareto (seller_id);
+
+-- 4) Geo state view
+CREATE MATERIALIZED VIEW IF NOT EXISTS mart.geo_state AS
 WITH custs AS (
-  SELECT cust_state AS state, COUNT(DISTINCT cust_uid) AS n_cust
+  SELECT cust_state AS state, COUNT(DISTINCT cust_id) AS n_cust
   FROM staging.orders GROUP BY cust_state
 ),
 cust_tot AS ( SELECT SUM(n_cust) AS n_all FROM custs ),
@@ -112,9 +220,8 @@ gmv_s AS (
   FROM staging.orders GROUP BY cust_state
 ),
 gmv_tot AS ( SELECT SUM(gmv)::numeric(18,6) AS gmv_all FROM staging.orders )
-INSERT INTO mart.geo_state (state, cust_share, seller_share, gmv_share, desert_index)
 SELECT
-  s.state,
+  s.state::text AS state,
   (COALESCE(c.n_cust,0) / NULLIF(ct.n_all,0))::numeric(10,6) AS cust_share,
   (COALESCE(se.n_sellers,0) / NULLIF(st.n_all,0))::numeric(10,6) AS seller_share,
   (COALESCE(gs.gmv_s,0) / NULLIF(gt.gmv_all,0))::numeric(10,6) AS gmv_share,
@@ -129,16 +236,12 @@ CROSS JOIN cust_tot ct
 LEFT JOIN sell se ON se.state = s.state
 CROSS JOIN sell_tot st
 LEFT JOIN gmv_s gs ON gs.state = s.state
-CROSS JOIN gmv_tot gt;
-
--- 5) Law 3 distribution table
-CREATE TABLE IF NOT EXISTS mart.law3_scores (
-  ontime_flag int,
-  review_score int,
-  n int,
-  pct numeric(10,6)
-);
-TRUNCATE mart.law3_scores;
+CROSS JOIN gmv_tot gt
+WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_geo_state ON mart.geo_state (state);
+
+-- 5) Law 3 distribution view
+CREATE MATERIALIZED VIEW IF NOT EXISTS mart.law3_scores AS
 WITH base AS (
   SELECT
     CASE WHEN o.ontime_flag=1 THEN 1 ELSE 0 END AS ontime_flag,
@@ -151,6 +254,22 @@ agg AS (
   GROUP BY ontime_flag, review_score
 ),
 tot AS (SELECT SUM(n) AS n_all FROM agg)
-INSERT INTO mart.law3_scores (ontime_flag, review_score, n, pct)
-SELECT a.ontime_flag, a.review_score, a.n, (a.n / NULLIF(t.n_all,0))::numeric(10,6)
-FROM agg a CROSS JOIN tot t;
+SELECT a.ontime_flag::int AS ontime_flag, a.review_score::int AS review_score, a.n::int AS n,
+       (a.n / NULLIF(t.n_all,0))::numeric(10,6) AS pct
+FROM agg a CROSS JOIN tot t
+WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_law3_scores ON mart.law3_scores (ontime_flag, review_score);
+
+-- 6) Refresh in dependency order. CONCURRENTLY diffs against the unique index and only
+-- blocks other refreshes; a view that was never populated gets a plain first fill.
+DO $$
+DECLARE v text;
+BEGIN
+  FOREACH v IN ARRAY ARRAY['seller_pareto', 'geo_state', 'law3_scores'] LOOP
+    IF (SELECT relispopulated FROM pg_class WHERE oid = format('mart.%I', v)::regclass) THEN
+      EXECUTE format('REFRESH MATERIALIZED VIEW CONCURRENTLY mart.%I', v);
+    ELSE
+      EXECUTE format('REFRESH MATERIALIZED VIEW mart.%I', v);
+    END IF;
+  END LOOP;
+END $$;
@@ -0,0 +1,20 @@
+-- Pre-rewrite CLV build (correlated subquery), kept as the bench_sql.py baseline.
+CREATE TABLE IF NOT EXISTS mart.clv_proxy (
+  cust_id int, as_of_date date, clv_90d numeric(18,6), PRIMARY KEY (cust_id, as_of_date)
+);
+TRUNCATE mart.clv_proxy;
+WITH daily_cust AS (
+  SELECT o.cust_id, o.order_ts::date AS as_of_date, COALESCE(SUM(o.gmv),0)::numeric(18,6) AS gmv_day
+  FROM staging.orders o
+  GROUP BY o.cust_id, o.order_ts::date
+),
+roll AS (
+  SELECT a.cust_id, a.as_of_date,
+    (SELECT COALESCE(SUM(b.gmv_day),0) FROM daily_cust b
+      WHERE b.cust_id = a.cust_id
+        AND b.as_of_date > a.as_of_date - INTERVAL '90 days'
+        AND b.as_of_date <= a.as_of_date) / 90.0 AS clv_90d
+  FROM daily_cust a
+)
+INSERT INTO mart.clv_proxy (cust_id, as_of_date, clv_90d)
+SELECT cust_id, as_of_date, clv_90d::numeric(18,6) FROM roll;
@@ -1,9 +1,16 @@
 ﻿# -*- coding: utf-8 -*-
 import os
 import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
 import numpy as np
 import pandas as pd
 
+import artifacts
+from profiling import span
+
+Z_975 = 1.959963984540054  # two-sided 95% normal quantile
+
 def parse_floats(csv_str, name):
     try:
         return [float(x) for x in csv_str.split(",") if x.strip() != ""]
@@ -13,21 +20,243 @@ def parse_floats(csv_str, name):
 def load_preds(preds_path):
     if not os.path.exists(preds_path):
         raise FileNotFoundError(f"Missing {preds_path}. Run the snapshot trainer first.")
-    df = pd.read_csv(preds_path)
-    need = {"cust_uid", "churn_prob"}
-    if not need.issubset(df.columns):
-        raise ValueError(f"{preds_path} must contain columns: {need}")
-    df = df.sort_values(["cust_uid", "churn_prob"], ascending=[True, False]).drop_duplicates("cust_uid", keep="first")
-    return df[["cust_uid", "churn_prob"]].reset_index(drop=True)
+    need = ["cust_id", "churn_prob"]
+    try:
+        df = artifacts.read_frame(preds_path, columns=need)
+    except ValueError as e:   # missing column
+        raise ValueError(f"{preds_path} must contain columns: {set(need)}") from e
+    df["cust_id"] = df["cust_id"].astype(np.int32)
+    df = df.sort_values(["cust_id", "churn_prob"], ascending=[True, False]).drop_duplicates("cust_id", keep="first")
+    return df[["cust_id", "churn_prob"]].reset_index(drop=True)
 
 def load_aov(snapshot_path):
     if os.path.exists(snapshot_path):
-        snap = pd.read_csv(snapshot_path, usecols=["cust_uid", "avg_order_value"])
+        snap = artifacts.read_frame(snapshot_path, columns=["cust_id", "avg_order_value"])
+        snap["cust_id"] = snap["cust_id"].astype(np.int32)
         snap["avg_order_value"] = snap["avg_order_value"].fillna(0)
         return snap
-    return pd.DataFrame(columns=["cust_uid", "avg_order_value"])
+    return pd.DataFrame({"cust_id": pd.Series(dtype=np.int32), "avg_order_value": pd.Series(dtype=float)})
+
+def sort_by_risk(df):
+    """Sort customers once (highest churn risk first); top-k targets are then prefixes."""
+    df = df.sort_values("churn_prob", ascending=False, kind="stable")
+    p0 = (1 - df["churn_prob"].to_numpy(dtype=float)).clip(1e-6, 1 - 1e-6)
+    aov = df.get("avg_order_value", pd.Series(0, index=df.index)).fillna(0).to_numpy(dtype=float)
+    return p0, aov
+
+def mc_deltas(p0, aov, discounts, margin, beta, n_mc, rng, chunk_size):
+    """
+    Monte Carlo delta profit for every discount on one targeted set.
+    Replicates are drawn as (chunk_size, k) uniform matrices; the same uniforms
+    are reused for every discount (common random numbers), only p1 changes.
+    Returns an array of shape (len(discounts), n_mc).
+    """
+    k = len(p0)
+    base_w = aov * margin
+    p1s = [np.clip(p0 + beta * d * (1 - p0), 0, 1) for d in discounts]
+    out = np.empty((len(discounts), n_mc))
+    for start in range(0, n_mc, chunk_size):
+        m = min(chunk_size, n_mc - start)
+        base = (rng.random((m, k)) < p0) @ base_w
+        u1 = rng.random((m, k))
+        for i, (d, p1) in enumerate(zip(discounts, p1s)):
+            out[i, start:start + m] = (u1 < p1) @ (aov * (margin - d)) - base
+    return out
 
-def simulate(df, targets, discounts, margin, beta, n_mc, seed):
+def bootstrap_deltas(p0, aov, discounts, margin, beta, n_mc, rng, chunk_size):
+    """
+    "exact-bootstrap": per-customer expected deltas are computed exactly (no
+    Bernoulli draws) and replicates resample the targeted customers with
+    replacement, so the CI reflects which customers land in the target set.
+    Resampling counts are shared across discounts.
+    """
+    k = len(p0)
+    out = np.zeros((len(discounts), n_mc))
+    if k == 0:
+        return out
+    contrib = np.stack([np.clip(p0 + beta * d * (1 - p0), 0, 1) * aov * (margin - d) - p0 * aov * margin
+                        for d in discounts])
+    for start in range(0, n_mc, chunk_size):
+        m = min(chunk_size, n_mc - start)
+        idx = rng.integers(0, k, size=(m, k)) + (np.arange(m) * k)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=m * k).reshape(m, k)
+        out[:, start:start + m] = contrib @ counts.T
+    return out
+
+DELTA_SAMPLERS = {"mc": mc_deltas, "exact-bootstrap": bootstrap_deltas}
+
+def simulate_cell(p0_all, aov_all, tp, discounts, margin, beta, n_mc, rng, chunk_size, ci_method="mc"):
+    """One grid cell: a target_pct at a given margin/beta, evaluated for every discount."""
+    n = len(p0_all)
+    k = int(np.ceil(tp * n))
+    p0 = p0_all[:k]
+    aov = aov_all[:k]
+    if np.all((aov == 0) | np.isnan(aov)):
+        aov = np.full_like(p0, 100.0, dtype=float)  # global fallback
+
+    deltas_all = DELTA_SAMPLERS[ci_method](p0, aov, discounts, margin, beta, n_mc, rng, chunk_size)
+
+    out = []
+    for d, deltas in zip(discounts, deltas_all):
+        p1 = np.clip(p0 + beta * d * (1 - p0), 0, 1)
+
+        base_profit_exp  = float((p0 * aov * margin).sum())
+        treat_profit_exp = float((p1 * aov * (margin - d)).sum())
+        delta_exp = treat_profit_exp - base_profit_exp
+
+        exp_disc_cost = float((p1 * aov * d).sum())
+        roi = (delta_exp / exp_disc_cost) if exp_disc_cost > 0 else float("nan")
+
+        lift = float(np.mean(p1 - p0))
+
+        ci_lo, ci_hi = np.percentile(deltas, [2.5, 97.5])
+
+        out.append({
+            "target_pct": tp,
+            "discount": d,
+            "n_target": k,
+            "avg_aov": float(np.nanmean(aov)),
+            "avg_p0": float(p0.mean()),
+            "avg_p1": float(p1.mean()),
+            "lift_abs": lift,
+            "delta_profit_expectation": float(delta_exp),
+            "delta_profit_mc_mean": float(deltas.mean()),
+            "delta_profit_ci_lo": float(ci_lo),
+            "delta_profit_ci_hi": float(ci_hi),
+            "treat_roi": float(roi),
+            "margin": margin,
+            "beta": beta,
+        })
+    return out
+
+def normal_grid(p0_all, aov_all, targets, discounts, margins, betas):
+    """
+    Closed-form CLT path. The delta is a sum of independent scaled Bernoullis:
+      mean = sum aov*(margin-d)*p1 - aov*margin*p0
+      var  = sum (aov*(margin-d))^2 * p1(1-p1) + (aov*margin)^2 * p0(1-p0)
+    Prefix sums over the risk-sorted customers make every target_pct an O(1)
+    lookup, so no sampling is needed. Yields (cell_index, rows) like iter_grid.
+    """
+    n = len(p0_all)
+
+    def csum(x):
+        return np.concatenate([[0.0], np.cumsum(x, dtype=float)])
+
+    ks = [int(np.ceil(tp * n)) for tp in targets]
+    n_nonzero = csum(aov_all != 0)
+    s_aov = csum(aov_all)
+    s_p0, s_v0 = csum(p0_all), csum(p0_all * (1 - p0_all))
+    s_p0a, s_v0a = csum(p0_all * aov_all), csum(aov_all ** 2 * p0_all * (1 - p0_all))
+
+    cells = {}
+    for bi, b in enumerate(betas):
+        for d in discounts:
+            p1_all = np.clip(p0_all + b * d * (1 - p0_all), 0, 1)
+            s_p1, s_v1 = csum(p1_all), csum(p1_all * (1 - p1_all))
+            s_p1a, s_v1a = csum(p1_all * aov_all), csum(aov_all ** 2 * p1_all * (1 - p1_all))
+
+            for mi, m in enumerate(margins):
+                for ti, (tp, k) in enumerate(zip(targets, ks)):
+                    if n_nonzero[k] == 0:
+                        # global fallback aov = 100 for the whole targeted set
+                        avg_aov = 100.0
+                        e0, e1 = 100.0 * s_p0[k], 100.0 * s_p1[k]
+                        v0, v1 = 1e4 * s_v0[k], 1e4 * s_v1[k]
+                    else:
+                        avg_aov = s_aov[k] / k
+                        e0, e1 = s_p0a[k], s_p1a[k]
+                        v0, v1 = s_v0a[k], s_v1a[k]
+
+                    delta_exp = (m - d) * e1 - m * e0
+                    sd = float(np.sqrt((m - d) ** 2 * v1 + m ** 2 * v0))
+                    exp_disc_cost = d * e1
+                    roi = (delta_exp / exp_disc_cost) if exp_disc_cost > 0 else float("nan")
+                    avg_p0 = s_p0[k] / k if k else float("nan")
+                    avg_p1 = s_p1[k] / k if k else float("nan")
+
+                    cells.setdefault((mi * len(betas) + bi) * len(targets) + ti, []).append({
+                        "target_pct": tp,
+                        "discount": d,
+                        "n_target": k,
+                        "avg_aov": float(avg_aov),
+                        "avg_p0": float(avg_p0),
+                        "avg_p1": float(avg_p1),
+                        "lift_abs": float(avg_p1 - avg_p0),
+                        "delta_profit_expectation": float(delta_exp),
+                        "delta_profit_mc_mean": float(delta_exp),
+                        "delta_profit_ci_lo": float(delta_exp - Z_975 * sd),
+                        "delta_profit_ci_hi": float(delta_exp + Z_975 * sd),
+                        "treat_roi": float(roi),
+                        "margin": m,
+                        "beta": b,
+                    })
+    for idx in sorted(cells):
+        yield idx, cells[idx]
+
+# --- process-pool plumbing: customer arrays live in shared memory, one attach per worker ---
+_SHARED = {}
+
+def _attach_shared(shm_name, n):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arr = np.ndarray((2, n), dtype=np.float64, buffer=shm.buf)
+    _SHARED.update(shm=shm, p0=arr[0], aov=arr[1])
+
+def _cell(p0_all, aov_all, task):
+    idx, tp, discounts, margin, beta, n_mc, seed_seq, chunk_size, ci_method = task
+    rng = np.random.default_rng(seed_seq)
+    k = int(np.ceil(tp * len(p0_all)))
+    # rows = simulated customer outcomes (replicates x targeted customers)
+    with span("ab.cell", target_pct=tp, margin=margin, beta=beta, ci_method=ci_method,
+              rows=n_mc * k * len(discounts)):
+        return idx, simulate_cell(p0_all, aov_all, tp, discounts, margin, beta,
+                                  n_mc, rng, chunk_size, ci_method)
+
+def _run_cell(task):
+    return _cell(_SHARED["p0"], _SHARED["aov"], task)
+
+def iter_grid(df, targets, discounts, margins, betas, n_mc, seed, chunk_size=50, workers=1,
+              ci_method="mc"):
+    """
+    Yield (cell_index, rows) for every (margin, beta, target_pct) cell as it finishes.
+    Each cell draws from its own SeedSequence child, so results do not depend on
+    the worker count or on completion order.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be >= 1, got {chunk_size}")
+    p0_all, aov_all = sort_by_risk(df)
+    if ci_method == "normal":
+        yield from normal_grid(p0_all, aov_all, targets, discounts, margins, betas)
+        return
+
+    cells = [(m, b, tp) for m in margins for b in betas for tp in targets]
+    seeds = np.random.SeedSequence(seed).spawn(len(cells))
+    tasks = [(i, tp, discounts, m, b, n_mc, s, chunk_size, ci_method)
+             for i, ((m, b, tp), s) in enumerate(zip(cells, seeds))]
+
+    if workers <= 1:
+        for task in tasks:
+            yield _cell(p0_all, aov_all, task)
+        return
+
+    n = len(p0_all)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, 2 * n * 8))
+    arr = np.ndarray((2, n), dtype=np.float64, buffer=shm.buf)
+    try:
+        arr[0], arr[1] = p0_all, aov_all
+        with mp.Pool(workers, initializer=_attach_shared, initargs=(shm.name, n)) as pool:
+            yield from pool.imap_unordered(_run_cell, tasks)
+    finally:
+        del arr
+        shm.close()
+        shm.unlink()
+
+def sort_results(res):
+    return res.sort_values(
+        ["delta_profit_expectation", "margin", "beta", "target_pct", "discount"],
+        ascending=[False, True, True, True, True], kind="stable",
+    ).reset_index(drop=True)
+
+def simulate(df, targets, discounts, margin, beta, n_mc, seed, chunk_size=50, workers=1, ci_method="mc"):
     """
     Assumptions:
       p0  = baseline return prob ~= (1 - churn_prob)
@@ -37,63 +266,15 @@ def simulate(df, targets, discounts, margin, beta, n_mc, seed):
         baseline: aov * margin
         treated : aov * (margin - d)
       We compare expected treated vs baseline profit on the targeted set.
-      CIs via Monte Carlo over Bernoulli draws.
+      CIs via Monte Carlo over Bernoulli draws, batched chunk_size replicates at a time
+      (ci_method="mc"), a closed-form normal approximation ("normal"), or a
+      customer-resampling bootstrap of exact expectations ("exact-bootstrap").
     """
-    rng = np.random.default_rng(seed)
     out = []
-
-    df = df.copy()
-    df["p0"] = (1 - df["churn_prob"]).clip(1e-6, 1 - 1e-6)
-    df["avg_order_value"] = df.get("avg_order_value", pd.Series(0, index=df.index)).fillna(0)
-
-    for tp in targets:
-        n = len(df)
-        k = int(np.ceil(tp * n))
-        targeted = df.sort_values("churn_prob", ascending=False).head(k).copy()
-
-        p0 = targeted["p0"].to_numpy()
-        aov = targeted["avg_order_value"].to_numpy()
-        if np.all((aov == 0) | np.isnan(aov)):
-            aov = np.full_like(p0, 100.0, dtype=float)  # global fallback
-
-        for d in discounts:
-            p1 = np.clip(p0 + beta * d * (1 - p0), 0, 1)
-
-            base_profit_exp  = float((p0 * aov * margin).sum())
-            treat_profit_exp = float((p1 * aov * (margin - d)).sum())
-            delta_exp = treat_profit_exp - base_profit_exp
-
-            exp_disc_cost = float((p1 * aov * d).sum())
-            roi = (delta_exp / exp_disc_cost) if exp_disc_cost > 0 else float("nan")
-
-            lift = float(np.mean(p1 - p0))
-
-            deltas = []
-            for _ in range(n_mc):
-                b0 = rng.binomial(1, p0)
-                b1 = rng.binomial(1, p1)
-                delta = (b1 * aov * (margin - d) - b0 * aov * margin).sum()
-                deltas.append(delta)
-            deltas = np.array(deltas)
-            ci_lo, ci_hi = np.percentile(deltas, [2.5, 97.5])
-
-            out.append({
-                "target_pct": tp,
-                "discount": d,
-                "n_target": k,
-                "avg_aov": float(np.nanmean(aov)),
-                "avg_p0": float(p0.mean()),
-                "avg_p1": float(p1.mean()),
-                "lift_abs": lift,
-                "delta_profit_expectation": float(delta_exp),
-                "delta_profit_mc_mean": float(deltas.mean()),
-                "delta_profit_ci_lo": float(ci_lo),
-                "delta_profit_ci_hi": float(ci_hi),
-                "treat_roi": float(roi),
-            })
-
-    res = pd.DataFrame(out).sort_values(["delta_profit_expectation"], ascending=False)
-    return res
+    for _, rows in iter_grid(df, targets, discounts, [margin], [beta], n_mc, seed,
+                             chunk_size=chunk_size, workers=workers, ci_method=ci_method):
+        out.extend(rows)
+    return sort_results(pd.DataFrame(out))
 
 def main():
     ap = argparse.ArgumentParser()
@@ -101,24 +282,42 @@ def main():
     ap.add_argument("--snapshot", default=os.path.join("outputs", "churn_snapshot.csv"))
     ap.add_argument("--targets", default="0.1,0.2,0.25,0.3")
     ap.add_argument("--discounts", default="0.05,0.07,0.10")
-    ap.add_argument("--margin", type=float, default=0.25)
-    ap.add_argument("--beta", type=float, default=0.50)
+    ap.add_argument("--margin", default="0.25", help="comma list to sweep several margins")
+    ap.add_argument("--beta", default="0.50", help="comma list to sweep several betas")
     ap.add_argument("--n-mc", type=int, default=300)
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--chunk-size", type=int, default=50, help="MC replicates drawn per batch (bounds memory)")
+    ap.add_argument("--workers", type=int, default=1, help="process pool size for the grid sweep")
+    ap.add_argument("--ci-method", choices=["mc", "normal", "exact-bootstrap"], default="mc")
     ap.add_argument("--out", default=os.path.join("outputs", "ab_sim_results.csv"))
     args = ap.parse_args()
+    if args.chunk_size < 1:
+        ap.error("--chunk-size must be >= 1")
 
     targets = parse_floats(args.targets, "targets")
     discounts = parse_floats(args.discounts, "discounts")
+    margins = parse_floats(args.margin, "margin")
+    betas = parse_floats(args.beta, "beta")
+
+    with span("ab.load") as sp:
+        preds = load_preds(args.preds)
+        snap  = load_aov(args.snapshot)
 
-    preds = load_preds(args.preds)
-    snap  = load_aov(args.snapshot)
+        df = preds.merge(snap, on="cust_id", how="left")
+        sp.set(rows=len(df))
 
-    df = preds.merge(snap, on="cust_uid", how="left")
-    res = simulate(df, targets, discounts, args.margin, args.beta, args.n_mc, args.seed)
+    # One row per (cell, discount): small enough to keep, so the CSV is written once, sorted
+    out = []
+    with span("ab.grid", workers=args.workers):
+        for _, rows in iter_grid(df, targets, discounts, margins, betas, args.n_mc, args.seed,
+                                 chunk_size=args.chunk_size, workers=args.workers,
+                                 ci_method=args.ci_method):
+            out.extend(rows)
+    res = sort_results(pd.DataFrame(out))
 
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-    res.to_csv(args.out, index=False)
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    res.to_csv(args.out + ".part", index=False)
+    os.replace(args.out + ".part", args.out)
 
     print("\\nTop policies by expected delta profit:")
     print(res.head(5).to_string(index=False))
@@ -0,0 +1,267 @@
+"""
+Columnar cache for the CSV artifacts the pipeline shares (mart exports, predictions).
+
+    import artifacts
+    snap = artifacts.read_frame('outputs/churn_snapshot.csv', columns=['cust_id', 'avg_order_value'])
+    python src/artifacts.py outputs/*.csv          # build/refresh caches and list them
+
+The CSV stays the interchange format. Its cache is an uncompressed Arrow IPC (Feather v2)
+file in an artifacts/ directory next to it, plus a JSON sidecar: sha256 of the Arrow file,
+rows, columns, the size/mtime of the CSV it mirrors and, for mart exports, the version of
+the source table (row count, relfilenode, last run_sql refresh). Readers memory-map the
+Arrow file and only convert the requested columns, so a load costs milliseconds instead
+of a full CSV parse.
+
+A cache is used while the CSV's size and mtime match the sidecar. Otherwise (first read,
+CSV rewritten by another tool) the CSV is streamed into a new cache block by block, so
+building it takes a few blocks of memory rather than the whole file. Writers that
+produce the CSV (export_model_csvs, train_churn_snapshot) build the cache right away, and
+export_model_csvs skips tables whose source version has not changed since the last export.
+Date and timestamp columns stay strings, as pandas.read_csv leaves them.
+
+OLIST_ARTIFACT_CACHE=0 turns the cache off: reads go straight to the CSV.
+Parquet paths are read directly (memory-mapped, column-projected), without a cache.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+ENABLED = os.getenv('OLIST_ARTIFACT_CACHE', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+CACHE_DIRNAME = 'artifacts'
+HASH_BLOCK = 8 * 1024 * 1024
+
+def cache_paths(csv_path):
+    """(arrow_path, sidecar_path) of the cache for csv_path."""
+    d, name = os.path.split(os.path.abspath(csv_path))
+    stem = os.path.splitext(name)[0]
+    base = os.path.join(d, CACHE_DIRNAME, stem)
+    return base + '.arrow', base + '.json'
+
+def file_version(path):
+    st = os.stat(path)
+    return {'bytes': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def read_meta(csv_path):
+    _, meta_path = cache_paths(csv_path)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_current(csv_path, meta=None):
+    """True if csv_path has a cache that still mirrors it."""
+    meta = meta if meta is not None else read_meta(csv_path)
+    if not meta or not os.path.exists(csv_path):
+        return False
+    arrow_path, _ = cache_paths(csv_path)
+    try:
+        return (meta.get('csv') == file_version(csv_path)
+                and os.path.getsize(arrow_path) == meta.get('bytes'))
+    except OSError:
+        return False
+
+def _part_path(path):
+    """
+    Temp name next to path, unique per writer, so concurrent builders of one cache never
+    write to the same file; each moves its own into place with os.replace.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return f'{path}.{os.getpid()}.{uuid.uuid4().hex[:12]}.part'
+
+@contextmanager
+def _removed_on_error(tmp):
+    try:
+        yield tmp
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _atomic_json(path, obj):
+    with _removed_on_error(_part_path(path)) as tmp:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, indent=2, default=str)
+        os.replace(tmp, path)
+
+def _publish(csv_path, tmp, rows, columns, source):
+    """Move a finished Arrow file into place as the cache of csv_path and write its sidecar."""
+    arrow_path, meta_path = cache_paths(csv_path)
+    os.replace(tmp, arrow_path)
+    meta = {
+        'csv': file_version(csv_path),
+        'path': arrow_path,
+        'sha256': sha256_file(arrow_path),
+        'bytes': os.path.getsize(arrow_path),
+        'rows': rows,
+        'columns': columns,
+        'source': source,
+        'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    _atomic_json(meta_path, meta)
+    return meta
+
+def write_table(csv_path, table, source=None):
+    """Write table as the cache of csv_path (which must already exist); returns the sidecar."""
+    import pyarrow.feather as feather
+    with _removed_on_error(_part_path(cache_paths(csv_path)[0])) as tmp:
+        feather.write_feather(table, tmp, compression='uncompressed')
+        return _publish(csv_path, tmp, table.num_rows, table.column_names, source)
+
+def write_frame(csv_path, df, source=None):
+    """Cache a DataFrame that was just written to csv_path (no re-parse of the CSV)."""
+    import pyarrow as pa
+    return write_table(csv_path, pa.Table.from_pandas(df, preserve_index=False), source)
+
+def _as_pandas_types(schema):
+    """ConvertOptions that leave the temporal columns of schema as strings, like pandas.read_csv."""
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    temporal = [f.name for f in schema if pa.types.is_temporal(f.type)]
+    return pv.ConvertOptions(column_types={c: pa.string() for c in temporal}) if temporal else None
+
+def parse_csv(csv_path):
+    """Arrow table for a whole CSV, typed like pandas.read_csv (dates/timestamps left as strings)."""
+    import pyarrow.csv as pv
+    table = pv.read_csv(csv_path)
+    convert = _as_pandas_types(table.schema)
+    if convert is not None:
+        table = pv.read_csv(csv_path, convert_options=convert)
+    return table
+
+def _stream_csv(csv_path, tmp):
+    """
+    Copy csv_path into the Arrow file tmp one block at a time; returns (rows, columns).
+    Types are inferred from the first block, so memory stays at a few blocks whatever
+    the file size.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    with pv.open_csv(csv_path) as reader:
+        convert = _as_pandas_types(reader.schema)
+    rows = 0
+    with pv.open_csv(csv_path, convert_options=convert) as reader, \
+            pa.ipc.new_file(tmp, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+        return rows, reader.schema.names
+
+def cache_csv(csv_path, source=None):
+    """
+    Parse csv_path once and (re)write its cache; returns the sidecar. The CSV is streamed
+    into the cache; only if a later block does not fit the types of the first one (an int
+    column with a decimal further down) is it re-read whole, so the types can widen.
+    """
+    import pyarrow as pa
+    from profiling import span
+    with span('artifacts.cache', path=csv_path) as sp:
+        try:
+            with _removed_on_error(_part_path(cache_paths(csv_path)[0])) as tmp:
+                meta = _publish(csv_path, tmp, *_stream_csv(csv_path, tmp), source)
+        except pa.ArrowInvalid:
+            sp.set(streamed=False)
+            meta = write_table(csv_path, parse_csv(csv_path), source)
+        sp.set(rows=meta['rows'])
+    return meta
+
+def read_table(path, columns=None):
+    """
+    Arrow table for a CSV (through its cache) or Parquet path, memory-mapped and
+    restricted to columns. Raises FileNotFoundError like pandas.read_csv would.
+    """
+    import pyarrow.feather as feather
+    if path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns, memory_map=True)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    if not is_current(path):
+        cache_csv(path)
+    return feather.read_table(cache_paths(path)[0], columns=columns, memory_map=True)
+
+def read_frame(path, columns=None):
+    """DataFrame for a CSV/Parquet artifact; with the cache off, a plain CSV read."""
+    if columns is not None:
+        columns = list(columns)
+    if not ENABLED and not path.lower().endswith('.parquet'):
+        return pd.read_csv(path, usecols=columns)
+    from profiling import span
+    with span('artifacts.read', path=path) as sp:
+        df = read_table(path, columns).to_pandas()
+        sp.set(rows=len(df))
+    return df
+
+def iter_frames(path, chunksize, columns=None):
+    """Chunks of exactly chunksize rows (the last one shorter), as pandas.read_csv yields them."""
+    if not ENABLED and not path.lower().endswith('.parquet'):
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+        return
+    table = read_table(path, columns)
+    for start in range(0, table.num_rows, chunksize):
+        yield table.slice(start, chunksize).to_pandas()
+
+def table_versions(conn, tables):
+    """
+    {table: version} for schema-qualified tables: exact row count, relfilenode (changes on
+    TRUNCATE/DROP) and the last successful run_sql refresh that wrote the table.
+    Missing tables map to None.
+    """
+    out = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('mart._run_log') IS NOT NULL")
+        has_log = cur.fetchone()[0]
+        for t in tables:
+            cur.execute('SELECT relfilenode FROM pg_class WHERE oid = to_regclass(%s)', (t,))
+            row = cur.fetchone()
+            if row is None:
+                out[t] = None
+                continue
+            cur.execute(f'SELECT count(*) FROM {t}')
+            version = {'table': t, 'rows': cur.fetchone()[0], 'relfilenode': row[0], 'refreshed_at': None}
+            if has_log:
+                cur.execute("""
+                    SELECT max(started_at)::text FROM mart._run_log
+                    WHERE status = 'ok' AND row_counts ? %s
+                """, (t,))
+                version['refreshed_at'] = cur.fetchone()[0]
+            out[t] = version
+    conn.rollback()
+    return out
+
+def describe(csv_path):
+    meta = read_meta(csv_path)
+    if not meta:
+        return f'{csv_path}: no cache'
+    state = 'current' if is_current(csv_path, meta) else 'stale'
+    return (f"{csv_path}: {state}, {meta['rows']:,} rows x {len(meta['columns'])} cols, "
+            f"{meta['bytes'] / 1e6:.1f} MB, sha256 {meta['sha256'][:12]}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Build or inspect the Arrow caches of CSV artifacts.')
+    ap.add_argument('paths', nargs='+', help='CSV artifacts')
+    ap.add_argument('--list', action='store_true', help='only report cache state')
+    args = ap.parse_args(argv)
+    for p in args.paths:
+        if not args.list and not is_current(p):
+            cache_csv(p)
+        print(describe(p))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+End-to-end pipeline benchmark on synthetic data (src/synth_data.py).
+
+  python src/bench_pipeline.py --orders 1e4,1e5,1e6
+  python src/bench_pipeline.py --orders 1e7 --stages ingest,sql,export_model --fail-on-regression
+
+For every scale the harness generates (or reuses) data in <workdir>/orders_<n>/data_clean,
+resets the scratch database when ingest is among the stages (raw/staging/mart schemas
+are dropped) and runs each stage as its own process from that directory, as a user would:
+
+  ingest        src/ingest.py                      sql_duckdb    run_sql.py --engine duckdb
+  sql           run_sql.py --all --force           train         train_churn_snapshot.py
+  export_model  export_model_csvs.py               train_stream  train_churn_stream.py
+  export_bi     export_bi_csvs.py                  score         score_churn.py
+  ab            ab_simulator.py
+
+The sql stage also records each sql/ file's wall time from mart._run_log. Results are
+appended to --out (a JSON list, one record per scale and stage), and each stage is
+compared with its last successful run at the same scale, so regressions show up
+between runs. A failed stage stops that scale; its output is in
+<workdir>/orders_<n>/logs/<stage>.log.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+from db import connection
+from bench_sql import ensure_database
+import synth_data
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+
+# stage -> script and arguments ({jobs} is --jobs)
+STAGES = {
+    'ingest':       ['ingest.py', '--jobs', '{jobs}'],
+    'sql':          ['run_sql.py', '--all', '--force', '--workers', '{jobs}'],
+    'sql_duckdb':   ['run_sql.py', '--all', '--engine', 'duckdb', '--out-dir', os.path.join('outputs', 'marts')],
+    'export_model': ['export_model_csvs.py', '--workers', '{jobs}'],
+    'export_bi':    ['export_bi_csvs.py', '--workers', '{jobs}'],
+    'train':        ['train_churn_snapshot.py'],
+    'train_stream': ['train_churn_stream.py'],
+    'score':        ['score_churn.py', '--model', os.path.join('models', 'churn_logit_snapshot.joblib')],
+    'ab':           ['ab_simulator.py'],
+}
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def reset_database(dbname):
+    ensure_database(dbname)
+    with connection(dbname) as conn:
+        with conn.cursor() as cur:
+            cur.execute('DROP SCHEMA IF EXISTS raw CASCADE; DROP SCHEMA IF EXISTS staging CASCADE;'
+                        'DROP SCHEMA IF EXISTS mart CASCADE;')
+
+def node_timings(dbname):
+    """sql/ file -> wall seconds from the latest run_sql --all run."""
+    with connection(dbname) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT node, wall_s::float8 FROM mart._run_log
+                WHERE run_id = (SELECT run_id FROM mart._run_log ORDER BY started_at DESC LIMIT 1)
+                  AND status = 'ok'
+                ORDER BY node
+            """)
+            return dict(cur.fetchall())
+
+def run_stage(stage, scale_dir, dbname, jobs):
+    """Run one stage as a subprocess in scale_dir; returns (ok, seconds)."""
+    script, *args = STAGES[stage]
+    cmd = [sys.executable, os.path.join(SRC, script)] + [a.format(jobs=jobs) for a in args]
+    env = dict(os.environ, PG_DB=dbname)
+    os.makedirs(os.path.join(scale_dir, 'logs'), exist_ok=True)
+    with open(os.path.join(scale_dir, 'logs', f'{stage}.log'), 'w', encoding='utf-8') as log:
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=scale_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        secs = time.perf_counter() - t0
+    return proc.returncode == 0, secs
+
+def bench_scale(n_orders, stages, workdir, dbname, jobs, seed):
+    scale_dir = os.path.join(workdir, f'orders_{n_orders}')
+    data_dir = os.path.join(scale_dir, 'data_clean')
+    records = []
+
+    if synth_data.is_current(data_dir, n_orders, seed):
+        print(f'-> {n_orders:,} orders: reusing {data_dir}')
+    else:
+        print(f'-> {n_orders:,} orders: generating {data_dir} ...')
+        t0 = time.perf_counter()
+        synth_data.generate(data_dir, n_orders, seed)
+        records.append({'stage': 'generate', 'status': 'ok', 'wall_s': time.perf_counter() - t0})
+
+    if 'ingest' in stages:
+        reset_database(dbname)
+    for stage in stages:
+        ok, secs = run_stage(stage, scale_dir, dbname, jobs)
+        rec = {'stage': stage, 'status': 'ok' if ok else 'failed', 'wall_s': secs}
+        if ok and stage == 'sql':
+            rec['nodes'] = node_timings(dbname)
+        records.append(rec)
+        print(f'   {stage:<14} {rec["status"]:<6} {secs:9.2f}s')
+        if not ok:
+            print(f'   see {os.path.join(scale_dir, "logs", stage + ".log")}')
+            break
+    for rec in records:
+        rec['orders'] = n_orders
+    return records
+
+def previous_runs(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def compare(records, history, tolerance):
+    """Print each stage against its last ok run at the same scale; returns the regressions."""
+    last = {}
+    for rec in history:
+        if rec.get('status') == 'ok':
+            last[(rec['orders'], rec['stage'])] = rec
+    regressions = []
+    for rec in records:
+        prev = last.get((rec['orders'], rec['stage']))
+        note = ''
+        if rec['status'] == 'ok' and prev:
+            change = rec['wall_s'] / prev['wall_s'] - 1 if prev['wall_s'] else 0.0
+            note = f'{change:+6.0%} vs {prev.get("git") or "?"} ({prev["wall_s"]:.2f}s)'
+            if change > tolerance:
+                note += '  REGRESSION'
+                regressions.append(rec)
+        print(f'   {rec["orders"]:>12,}  {rec["stage"]:<14} {rec["status"]:<6} {rec["wall_s"]:9.2f}s  {note}')
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description='Time every pipeline stage on synthetic data at several scales.')
+    ap.add_argument('--orders', default='1e4,1e5,1e6', help='Comma list of order counts')
+    ap.add_argument('--stages', default=','.join(STAGES), help=f'Comma list of: {", ".join(STAGES)}')
+    ap.add_argument('--workdir', default=os.path.join('outputs', 'bench', 'pipeline'),
+                    help='Generated data and per-stage outputs/logs, one directory per scale')
+    ap.add_argument('--db', default='olist_bench_pipeline', help='Scratch database (schemas are dropped)')
+    ap.add_argument('--jobs', type=int, default=4, help='Workers for ingest/sql/exports')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--out', default=os.path.join('outputs', 'bench', 'pipeline_bench.json'))
+    ap.add_argument('--tolerance', type=float, default=0.20, help='Slowdown flagged as a regression')
+    ap.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if any stage regressed')
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f'Unknown stage(s): {", ".join(sorted(unknown))}')
+    scales = [int(float(x)) for x in args.orders.split(',') if x.strip()]
+    workdir = os.path.abspath(args.workdir)
+
+    run = {'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git': git_revision(),
+           'host': platform.node(), 'cpus': os.cpu_count(), 'jobs': args.jobs}
+    records = []
+    for n in scales:
+        records += [{**run, **rec} for rec in bench_scale(n, stages, workdir, args.db, args.jobs, args.seed)]
+
+    history = previous_runs(args.out)
+    print('-> Results')
+    regressions = compare(records, history, args.tolerance)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(history + records, f, indent=2)
+    print(f'Wrote {args.out}')
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
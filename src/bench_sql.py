@@ -0,0 +1,157 @@
+"""
+Before/after timings for rewritten SQL stages on synthetic order volumes.
+
+Everything runs in a scratch database (default olist_bench, created if missing)
+whose staging.orders is a generated table, so real marts are never touched.
+
+  python src/bench_sql.py --case clv --rows 1000000,10000000
+"""
+import os
+import json
+import time
+import argparse
+import psycopg2
+from db import connection
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+
+# Synthetic staging.orders: ~0.8 customers per order (skewed repeat purchases),
+# two years of purchase timestamps, Olist-like payment mix and delivery times.
+SYNTH_ORDERS_SQL = """
+DROP SCHEMA IF EXISTS staging CASCADE;
+DROP SCHEMA IF EXISTS mart CASCADE;
+CREATE SCHEMA staging;
+CREATE SCHEMA mart;
+CREATE TABLE staging.orders AS
+SELECT
+  md5('o' || i)                                           AS order_id,
+  c                                                       AS cust_id,
+  ts                                                      AS order_ts,
+  ts + (2 + random() * 25) * interval '1 day'             AS delivered_ts,
+  ts + (10 + random() * 15) * interval '1 day'            AS eta_ts,
+  md5('k' || i)                                           AS customer_id,
+  (ARRAY['SP','RJ','MG','RS','PR','BA'])[1 + floor(random() * 6)::int] AS cust_state,
+  round((20 + random() * 250)::numeric, 2)                AS gmv,
+  NULL::numeric AS merchandise_total, NULL::numeric AS freight_total, NULL::numeric AS pay_total,
+  (1 + floor(random() * 5))::numeric                      AS review_score,
+  CASE WHEN random() < 0.74 THEN 'credit_card' WHEN random() < 0.75 THEN 'boleto' ELSE 'voucher' END
+                                                          AS main_payment_type,
+  random() < 0.1                                          AS any_heavy_bulky,
+  0                                                       AS ontime_flag
+FROM (
+  SELECT i, timestamp '2016-09-01' + random() * interval '760 days' AS ts,
+         (1 + floor(%(n_cust)s * power(random(), 1.3)))::int AS c
+  FROM generate_series(1, %(rows)s) i
+) g;
+UPDATE staging.orders SET ontime_flag = (delivered_ts <= eta_ts)::int;
+ANALYZE staging.orders;
+"""
+
+# case -> setup steps (untimed), before, after, and a check query to compare outputs.
+# Steps are SQL text or a path under sql/; sql/bench/legacy_* keep the pre-rewrite builds.
+CASES = {
+    "clv": {
+        "setup": [],
+        "before": ["bench/legacy_04_clv.sql"],
+        "after": ["04_daily_revenue_and_clv.sql"],
+        "check": "SELECT count(*), sum(clv_90d) FROM mart.clv_proxy",
+    },
+    "features": {
+        "setup": ["02_marts_rfm.sql"],
+        "before": ["bench/legacy_03_churn_features.sql", "bench/legacy_05_churn_snapshot.sql"],
+        "after": ["02e_customer_features.sql", "03_marts_churn_features.sql", "05_churn_snapshot.sql"],
+        "check": """
+            SELECT (SELECT count(*) || '/' || sum(orders_90d) || '/' || sum(avg_delivery_days)
+                      || '/' || sum(pay_share_card) || '/' || sum(ontime_rate) FROM mart.churn_features),
+                   (SELECT count(*) || '/' || sum(churn_90d) || '/' || sum(r + f + m)
+                      || '/' || sum(avg_order_value) || '/' || sum(heavy_bulky_share) FROM mart.churn_snapshot)
+        """,
+    },
+}
+
+def read_step(step):
+    if step.endswith(".sql"):
+        with open(os.path.join(SQL_DIR, step), "r", encoding="utf-8") as f:
+            return f.read().lstrip('\ufeff')
+    return step
+
+def ensure_database(name):
+    with connection(autocommit=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+            if cur.fetchone() is None:
+                cur.execute(f'CREATE DATABASE "{name}"')
+
+def check(conn, sql):
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            return [str(v) for v in cur.fetchone()]
+    except psycopg2.Error:
+        return None
+    finally:
+        conn.rollback()
+
+def run_steps(conn, steps):
+    """Run steps in one transaction; returns seconds, or None on statement timeout."""
+    with conn.cursor() as cur:
+        t0 = time.perf_counter()
+        try:
+            for step in steps:
+                cur.execute(read_step(step))
+            conn.commit()
+        except psycopg2.errors.QueryCanceled:
+            conn.rollback()
+            return None
+        return time.perf_counter() - t0
+
+def bench(cases, rows_list, dbname, timeout_s):
+    ensure_database(dbname)
+    results = []
+    with connection(dbname, statement_timeout=f"{int(timeout_s)}s") as conn:
+        for rows in rows_list:
+            print(f"-> Generating {rows:,} synthetic orders in {dbname} ...")
+            with conn.cursor() as cur:
+                cur.execute(SYNTH_ORDERS_SQL, {"rows": rows, "n_cust": int(rows * 0.8)})
+            conn.commit()
+
+            for name in cases:
+                case = CASES[name]
+                run_steps(conn, case["setup"])
+                rec = {"case": name, "rows": rows}
+                for side in ("before", "after"):
+                    secs = run_steps(conn, case[side])
+                    result = check(conn, case["check"]) if secs is not None else None
+                    rec[f"{side}_s"] = secs
+                    rec[f"{side}_check"] = result
+                    shown = f"{secs:.2f}s" if secs is not None else f"timeout (>{timeout_s}s)"
+                    print(f"   {name:<10} {side:<6} {shown:>16}  check={result or '-'}")
+                if rec["before_s"] and rec["after_s"]:
+                    print(f"   {name:<10} speedup {rec['before_s'] / rec['after_s']:.1f}x")
+                results.append(rec)
+    return results
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--case", default=",".join(CASES), help=f"comma list of: {', '.join(CASES)}")
+    ap.add_argument("--rows", default="1000000,10000000", help="comma list of synthetic order counts")
+    ap.add_argument("--db", default="olist_bench", help="scratch database (dropped/recreated schemas)")
+    ap.add_argument("--timeout", type=int, default=3600, help="per-build statement_timeout in seconds")
+    ap.add_argument("--out", default=os.path.join("outputs", "bench", "sql_bench.json"))
+    args = ap.parse_args()
+
+    cases = [c.strip() for c in args.case.split(",") if c.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        raise SystemExit(f"Unknown case(s): {', '.join(sorted(unknown))}")
+    rows_list = [int(float(x)) for x in args.rows.split(",") if x.strip()]
+
+    results = bench(cases, rows_list, args.db, args.timeout)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
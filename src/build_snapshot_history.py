@@ -0,0 +1,126 @@
+"""
+Rolling-origin churn training set: mart.churn_snapshot_history, LIST-partitioned by
+snapshot_date, one partition per t0 filled from mart.churn_snapshot_at(t0).
+
+By default t0 steps back monthly from the latest date with a complete 90-day label
+window (last order date - 90 days), for --months snapshots. Dates are fanned out
+over --workers connections. Each partition is built as a standalone table, filled,
+and attached in a single transaction, so a date is either fully present or absent:
+re-runs skip finished partitions unless --force is given.
+
+  python src/build_snapshot_history.py --months 24 --workers 4
+  python src/build_snapshot_history.py --dates 2018-03-01,2018-06-01 --force
+"""
+import os
+import time
+import argparse
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from db import connection
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+PARENT = "mart.churn_snapshot_history"
+LABEL_DAYS = 90
+
+def partition_name(t0):
+    return f"churn_snapshot_history_p{t0:%Y%m%d}"
+
+def ensure_parent(conn):
+    """(Re)create the snapshot functions and the partitioned parent; both are idempotent."""
+    with conn.cursor() as cur:
+        for fname in ("02e_customer_features.sql", "05b_churn_snapshot_history.sql"):
+            with open(os.path.join(SQL_DIR, fname), "r", encoding="utf-8") as f:
+                cur.execute(f.read().lstrip('\ufeff'))
+    conn.commit()
+
+def order_date_range(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT min(order_ts)::date, max(order_ts)::date FROM staging.orders")
+        return cur.fetchone()
+
+def monthly_cutoffs(first_order, last_order, months):
+    """Monthly t0 values ending at the latest t0 whose label window is complete."""
+    anchor = pd.Timestamp(last_order - pd.Timedelta(days=LABEL_DAYS))
+    dates = [(anchor - pd.DateOffset(months=k)).date() for k in range(months)]
+    return sorted(d for d in dates if d > first_order)
+
+def existing_partitions(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+        """, (PARENT,))
+        return {r[0] for r in cur.fetchall()}
+
+def build_partition(t0, force=False):
+    """Build, fill and attach one partition in a single transaction. Returns (rows, seconds)."""
+    name = partition_name(t0)
+    t_start = time.perf_counter()
+    with connection() as conn:
+        with conn.cursor() as cur:
+            if force:
+                cur.execute(f"DROP TABLE IF EXISTS mart.{name}")
+            # Fill a plain table first and attach at the end: CREATE ... PARTITION OF would
+            # hold a lock on the parent for the whole insert and serialize the workers.
+            cur.execute(f"CREATE TABLE mart.{name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cur.execute(f"INSERT INTO mart.{name} SELECT s.* FROM mart.churn_snapshot_at(%s) s", (t0,))
+            rows = cur.rowcount
+            cur.execute(f"ALTER TABLE mart.{name} ADD PRIMARY KEY (snapshot_date, cust_id)")
+            # The CHECK lets ATTACH skip its validation scan of the new partition.
+            cur.execute(f"ALTER TABLE mart.{name} ADD CONSTRAINT {name}_t0 CHECK (snapshot_date = %s)", (t0,))
+            cur.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION mart.{name} FOR VALUES IN (%s)", (t0,))
+            cur.execute(f"ALTER TABLE mart.{name} DROP CONSTRAINT {name}_t0")
+            cur.execute(f"ANALYZE mart.{name}")
+    return rows, time.perf_counter() - t_start
+
+def main():
+    ap = argparse.ArgumentParser(description="Backfill mart.churn_snapshot_history for rolling t0 dates.")
+    ap.add_argument("--months", type=int, default=24, help="Number of monthly t0 values (default 24)")
+    ap.add_argument("--dates", default=None,
+                    help="Comma-separated t0 dates (YYYY-MM-DD); overrides --months")
+    ap.add_argument("--workers", type=int, default=4, help="Parallel database connections")
+    ap.add_argument("--force", action="store_true", help="Rebuild partitions that already exist")
+    args = ap.parse_args()
+
+    with connection() as conn:
+        ensure_parent(conn)
+        first_order, last_order = order_date_range(conn)
+        done = existing_partitions(conn)
+
+    if args.dates:
+        cutoffs = sorted({date.fromisoformat(s.strip()) for s in args.dates.split(",") if s.strip()})
+        late = [d for d in cutoffs if (last_order - d).days < LABEL_DAYS]
+        for d in late:
+            print(f"   skip {d}: label window ends after the last order ({last_order})")
+        cutoffs = [d for d in cutoffs if d not in late]
+    else:
+        cutoffs = monthly_cutoffs(first_order, last_order, args.months)
+
+    todo = [d for d in cutoffs if args.force or partition_name(d) not in done]
+    print(f"-> {len(cutoffs)} snapshot dates {cutoffs[0] if cutoffs else '-'} .. "
+          f"{cutoffs[-1] if cutoffs else '-'}; {len(cutoffs) - len(todo)} already built, "
+          f"{len(todo)} to build with {args.workers} workers")
+
+    t_start = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(build_partition, d, args.force): d for d in todo}
+        for fut in as_completed(futures):
+            d = futures[fut]
+            try:
+                rows, secs = fut.result()
+                print(f"   {d}  {rows:>9,} rows  {secs:7.1f}s")
+            except Exception as e:
+                failed.append(d)
+                print(f"   {d}  FAILED: {e}")
+    print(f"Done in {time.perf_counter() - t_start:.1f}s"
+          + (f"; {len(failed)} failed: {', '.join(map(str, sorted(failed)))}" if failed else ""))
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,394 @@
-def run_all():
-    return
+"""
+Data-quality gate for the data_clean/ CSVs, run by ingest.py before anything is loaded.
+
+  python src/checks.py                                   # data_clean/ -> outputs/checks/report.json
+  python src/checks.py --data-dir /data/olist/data_clean --workers 4
+
+Each whitelisted file is streamed in blocks with pyarrow's CSV reader (values kept as
+strings, so a bad value is reported instead of failing the parse) and every block
+goes through vectorized checks from RULES: required columns, nulls, types (regex
+match in Arrow), value ranges and allowed values. Files are scanned in parallel on a
+process pool, so memory is bounded by the block size plus 8 bytes per key value:
+
+  - unique keys: each key is hashed to a uint64 per block; the hashes are sorted once
+    at the end and adjacent equal values are candidate duplicates. Candidates are
+    confirmed against the actual strings in a second pass over that column only, so
+    a hash collision cannot fail a load.
+  - foreign keys (FOREIGN_KEYS): each side reduces to its sorted unique hashes and the
+    child side is probed with np.searchsorted.
+
+run_all() writes a JSON report (one entry per check with status, failed count and
+example values) and raises DataQualityError when an error-severity check fails;
+warn-severity checks are reported but do not fail ingest.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from profiling import span
+
+DATA_CLEAN = os.path.join(os.getcwd(), "data_clean")
+REPORT_PATH = os.path.join("outputs", "checks", "report.json")
+BLOCK_BYTES = 16 * 1024 * 1024
+N_EXAMPLES = 5
+
+# Value patterns, matched against the raw CSV text (empty fields are nulls)
+TYPE_PATTERNS = {
+    "int": r"^[+-]?\d{1,18}(\.0*)?$",
+    "float": r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$",
+    "ts": r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$",
+    "bool": r"^(?i:true|false|t|f|yes|no|y|n|0|1)$",
+    "str": None,
+}
+
+# Per file: key columns that must be unique (None: no key) and per-column rules.
+# Column rule keys: type, required (no nulls), min, max, values (allowed set), severity.
+RULES = {
+    "features_orders.csv": {
+        "unique": ("order_id",),
+        "columns": {
+            "order_id": {"type": "str", "required": True},
+            "cust_uid": {"type": "str", "required": True},
+            "order_purchase_timestamp": {"type": "ts", "required": True},
+            "order_delivered_customer_date": {"type": "ts"},
+            "order_estimated_delivery_date": {"type": "ts"},
+            "gmv": {"type": "float", "min": 0},
+            "merchandise_total": {"type": "float", "min": 0},
+            "freight_total": {"type": "float", "min": 0},
+            "pay_total": {"type": "float", "min": 0},
+            "review_score": {"type": "int", "min": 1, "max": 5},
+            "any_heavy_bulky": {"type": "bool"},
+        },
+    },
+    "order_items_clean.csv": {
+        "unique": ("order_id", "order_item_id"),
+        "columns": {
+            "order_id": {"type": "str", "required": True},
+            "order_item_id": {"type": "int", "required": True, "min": 1},
+            "product_id": {"type": "str", "required": True},
+            "seller_id": {"type": "str", "required": True},
+            "price": {"type": "float", "min": 0},
+            "freight_value": {"type": "float", "min": 0},
+        },
+    },
+    "products_clean.csv": {
+        "unique": ("product_id",),
+        "columns": {
+            "product_id": {"type": "str", "required": True},
+            "product_weight_g": {"type": "float", "min": 0},
+            "product_length_cm": {"type": "float", "min": 0},
+            "product_height_cm": {"type": "float", "min": 0},
+            "product_width_cm": {"type": "float", "min": 0},
+            "product_volume_cm3": {"type": "float", "min": 0},
+            "is_heavy_bulky": {"type": "bool"},
+        },
+    },
+    "order_reviews_dedup.csv": {
+        "unique": ("order_id",),
+        "columns": {
+            "order_id": {"type": "str", "required": True},
+            "review_score": {"type": "int", "min": 1, "max": 5},
+        },
+    },
+    "payments_order_agg.csv": {
+        "unique": ("order_id",),
+        "columns": {
+            "order_id": {"type": "str", "required": True},
+            "pay_total": {"type": "float", "min": 0},
+            "installments_max": {"type": "int", "min": 0},
+            "n_payment_methods": {"type": "int", "min": 1},
+        },
+    },
+}
+
+# (child file, column, parent file, column, severity): every child value must exist in the parent
+FOREIGN_KEYS = [
+    ("order_items_clean.csv", "order_id", "features_orders.csv", "order_id", "error"),
+    ("order_items_clean.csv", "product_id", "products_clean.csv", "product_id", "error"),
+    ("order_reviews_dedup.csv", "order_id", "features_orders.csv", "order_id", "warn"),
+    ("payments_order_agg.csv", "order_id", "features_orders.csv", "order_id", "warn"),
+]
+
+class DataQualityError(Exception):
+    """Raised by run_all() when an error-severity check fails; .report holds the full report."""
+    def __init__(self, report):
+        failed = [f"{c['file']}:{c['check']}" + (f"({c['column']})" if c.get("column") else "")
+                  for c in report["checks"] if c["status"] == "failed" and c["severity"] == "error"]
+        super().__init__(f"{len(failed)} data check(s) failed: {', '.join(failed)}")
+        self.report = report
+
+# ---------- hashing ----------
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+def hash_values(arr):
+    """uint64 hash per value of a string Arrow array (nulls hash as '')."""
+    values = pc.fill_null(arr, "").to_numpy(zero_copy_only=False)
+    return pd.util.hash_array(values, categorize=False)
+
+def hash_key(batch, cols, cache=None):
+    """Combined uint64 hash of cols per row; cache ({column: hashes}) avoids rehashing a column."""
+    cache = {} if cache is None else cache
+    for c in cols:
+        if c not in cache:
+            cache[c] = hash_values(batch.column(c))
+    h = cache[cols[0]]
+    for c in cols[1:]:
+        with np.errstate(over="ignore"):
+            h = h * _MIX ^ cache[c]
+    return h
+
+def key_strings(batch, cols):
+    if len(cols) == 1:
+        return pc.fill_null(batch.column(cols[0]), "")
+    return pc.binary_join_element_wise(*[pc.fill_null(batch.column(c), "") for c in cols], "|")
+
+def dedup_sorted(h):
+    """Unique values of a sorted array (np.unique without its sort or hash table)."""
+    return h[np.concatenate(([True], h[1:] != h[:-1]))] if len(h) else h
+
+# ---------- scanning ----------
+def read_header(path):
+    return list(pd.read_csv(path, nrows=0).columns)
+
+def iter_batches(path, columns):
+    """Record batches of `columns`, all as strings; empty fields are nulls."""
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=BLOCK_BYTES),
+        convert_options=pacsv.ConvertOptions(column_types={c: pa.string() for c in columns},
+                                             include_columns=list(columns), strings_can_be_null=True),
+    )
+    for batch in reader:
+        yield batch
+
+def _result(file, check, severity, failed, column=None, examples=(), **extra):
+    return {"file": file, "check": check, "column": column, "severity": severity,
+            "status": "failed" if failed else "ok", "failed": int(failed),
+            "examples": list(examples)[:N_EXAMPLES], **extra}
+
+class _Counter:
+    """Failed-row count and first few offending values for one (column, check)."""
+    __slots__ = ("failed", "examples")
+    def __init__(self):
+        self.failed, self.examples = 0, []
+
+    def add(self, arr, mask):
+        n = pc.sum(mask).as_py() or 0
+        if n:
+            self.failed += n
+            if len(self.examples) < N_EXAMPLES:
+                bad = arr.filter(mask).slice(0, N_EXAMPLES - len(self.examples))
+                self.examples += bad.to_pylist()
+
+def column_checks(rule):
+    """Check names that apply to a column rule, in report order."""
+    names = []
+    if rule.get("required"):
+        names.append("not_null")
+    if TYPE_PATTERNS[rule.get("type", "str")]:
+        names.append("type")
+    if "min" in rule or "max" in rule:
+        names.append("range")
+    if "values" in rule:
+        names.append("allowed_values")
+    return names
+
+def check_column(arr, rule, counters):
+    """Vectorized checks of one string column block; adds to counters[check]."""
+    if rule.get("required"):
+        counters["not_null"].add(arr, pc.is_null(arr))
+    present = pc.is_valid(arr)
+    pattern = TYPE_PATTERNS[rule.get("type", "str")]
+    valid = present
+    if pattern:
+        matches = pc.fill_null(pc.match_substring_regex(arr, pattern), False)
+        counters["type"].add(arr, pc.and_(present, pc.invert(matches)))
+        valid = matches
+    if "min" in rule or "max" in rule:
+        nums = pc.cast(pc.if_else(valid, arr, pa.scalar(None, pa.string())), pa.float64())
+        out = pa.scalar(False)
+        if "min" in rule:
+            out = pc.or_(out, pc.less(nums, rule["min"]))
+        if "max" in rule:
+            out = pc.or_(out, pc.greater(nums, rule["max"]))
+        counters["range"].add(arr, pc.fill_null(out, False))
+    if "values" in rule:
+        allowed = pc.is_in(arr, value_set=pa.array(sorted(rule["values"])))
+        counters["allowed_values"].add(arr, pc.and_(present, pc.invert(allowed)))
+
+def scan_file(path, rules, fk_columns):
+    """
+    Stream one file through its column checks. Returns (stats, results, key_hashes,
+    fk_hashes): key_hashes are the sorted candidate-duplicate hashes of the unique key,
+    fk_hashes maps each column in fk_columns to its sorted unique hashes.
+    """
+    fname = os.path.basename(path)
+    t0 = time.perf_counter()
+    header = read_header(path)
+    results = []
+
+    missing = [c for c in rules["columns"] if c not in header]
+    results.append(_result(fname, "required_columns", "error", len(missing), examples=missing))
+    col_rules = {c: r for c, r in rules["columns"].items() if c in header}
+    key = tuple(rules.get("unique") or ())
+    if any(c not in header for c in key):
+        key = ()
+    fk_columns = [c for c in fk_columns if c in header]
+    wanted = list(dict.fromkeys([*col_rules, *key, *fk_columns]))
+
+    counters = {c: {name: _Counter() for name in column_checks(r)} for c, r in col_rules.items()}
+    key_parts, fk_parts = [], {c: [] for c in fk_columns}
+    rows = 0
+    with span("checks.scan", file=fname, bytes=os.path.getsize(path)) as sp:
+        for batch in iter_batches(path, wanted):
+            rows += batch.num_rows
+            for c, rule in col_rules.items():
+                check_column(batch.column(c), rule, counters[c])
+            hashed = {}
+            if key:
+                key_parts.append(hash_key(batch, key, hashed))
+            for c in fk_columns:
+                if (c,) != key:   # a unique key's hashes are reused below
+                    fk_parts[c].append(hash_key(batch, (c,), hashed))
+        sp.set(rows=rows)
+
+    for c, rule in col_rules.items():
+        for name, cnt in counters[c].items():
+            results.append(_result(fname, name, rule.get("severity", "error"), cnt.failed,
+                                   column=c, examples=cnt.examples))
+
+    dup_hashes = np.empty(0, dtype=np.uint64)
+    fk_hashes = {}
+    if key_parts:
+        h = np.sort(np.concatenate(key_parts))
+        dup_hashes = dedup_sorted(h[1:][h[1:] == h[:-1]])
+        if len(key) == 1 and key[0] in fk_parts:
+            fk_hashes[key[0]] = dedup_sorted(h)
+        del h, key_parts
+    for c, parts in fk_parts.items():
+        if c not in fk_hashes:
+            fk_hashes[c] = dedup_sorted(np.sort(np.concatenate(parts))) if parts else np.empty(0, dtype=np.uint64)
+    stats = {"rows": rows, "bytes": os.path.getsize(path), "seconds": time.perf_counter() - t0}
+    return stats, results, (key, dup_hashes), fk_hashes
+
+def find_values(path, cols, hashes, limit=None):
+    """Second pass over cols only: {key string: count} for rows whose key hash is in hashes."""
+    found = {}
+    for batch in iter_batches(path, cols):
+        mask = np.isin(hash_key(batch, cols), hashes)
+        if mask.any():
+            for v in key_strings(batch, cols).filter(pa.array(mask)).to_pylist():
+                found[v] = found.get(v, 0) + 1
+        if limit and len(found) >= limit:
+            break
+    return found
+
+def confirm_duplicates(path, key, dup_hashes):
+    """(rows beyond the first per duplicated key, example keys), from the actual strings."""
+    if not len(dup_hashes):
+        return 0, []
+    dups = {k: n for k, n in find_values(path, list(key), dup_hashes).items() if n > 1}
+    return sum(n - 1 for n in dups.values()), sorted(dups)[:N_EXAMPLES]
+
+def orphans(child_hashes, parent_hashes):
+    """Child hashes absent from the (sorted, unique) parent hashes."""
+    if not len(parent_hashes):
+        return child_hashes
+    pos = np.minimum(np.searchsorted(parent_hashes, child_hashes), len(parent_hashes) - 1)
+    return child_hashes[parent_hashes[pos] != child_hashes]
+
+# ---------- entry points ----------
+def run_all(data_dir=DATA_CLEAN, workers=4, report_path=REPORT_PATH, raise_on_error=True):
+    """
+    Check every whitelisted CSV present in data_dir; writes the JSON report and returns
+    it. Raises DataQualityError if an error-severity check failed (unless raise_on_error
+    is False).
+    """
+    t_start = time.perf_counter()
+    present = {f.lower(): f for f in os.listdir(data_dir) if f.lower().endswith(".csv")}
+    files = {name: os.path.join(data_dir, present[name.lower()]) for name in RULES if name.lower() in present}
+    fk_cols = {name: set() for name in files}
+    for child, ccol, parent, pcol, _ in FOREIGN_KEYS:
+        if child in files and parent in files:
+            fk_cols[child].add(ccol); fk_cols[parent].add(pcol)
+
+    scans = {}
+    with span("checks.run_all", files=len(files)):
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(files) or 1, os.cpu_count() or 1))) as ex:
+            futs = {name: ex.submit(scan_file, path, RULES[name], sorted(fk_cols[name]))
+                    for name, path in files.items()}
+            scans = {name: fut.result() for name, fut in futs.items()}
+
+        results = [_result(name, "file_present", "error", 1) for name in RULES if name not in files]
+        for name, (stats, res, (key, dup_hashes), _) in scans.items():
+            results += res
+            if key:
+                n_dup, examples = confirm_duplicates(files[name], key, dup_hashes)
+                results.append(_result(name, "unique", "error", n_dup, column=",".join(key), examples=examples))
+
+        for child, ccol, parent, pcol, severity in FOREIGN_KEYS:
+            if child not in scans or parent not in scans:
+                continue
+            child_h, parent_h = scans[child][3].get(ccol), scans[parent][3].get(pcol)
+            if child_h is None or parent_h is None:
+                continue
+            missing = orphans(child_h, parent_h)
+            examples = sorted(find_values(files[child], [ccol], missing, limit=N_EXAMPLES)) if len(missing) else []
+            results.append(_result(child, "foreign_key", severity, len(missing), column=ccol,
+                                   examples=examples, references=f"{parent}.{pcol}"))
+
+    failed = [r for r in results if r["status"] == "failed"]
+    report = {
+        "ok": not any(r["severity"] == "error" for r in failed),
+        "data_dir": os.path.abspath(data_dir),
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": round(time.perf_counter() - t_start, 3),
+        "files": {name: s[0] for name, s in scans.items()},
+        "checks": results,
+    }
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+        tmp = report_path + ".part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(tmp, report_path)
+    if raise_on_error and not report["ok"]:
+        raise DataQualityError(report)
+    return report
+
+def format_report(report):
+    lines = []
+    for name, st in report["files"].items():
+        lines.append(f"   {name:<26} {st['rows']:>12,} rows  {st['bytes'] / 1e6:>9.1f} MB  {st['seconds']:6.2f}s")
+    for r in report["checks"]:
+        if r["status"] == "failed":
+            where = f"{r['file']}:{r['check']}" + (f"({r['column']})" if r["column"] else "")
+            mark = "❌" if r["severity"] == "error" else "⚠️ "
+            lines.append(f"   {mark} {where}: {r['failed']:,} failed, e.g. {r['examples']}")
+    return "\n".join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description="Validate the data_clean/ CSVs before ingest.")
+    ap.add_argument("--data-dir", default=DATA_CLEAN)
+    ap.add_argument("--workers", type=int, default=4, help="files scanned in parallel")
+    ap.add_argument("--out", default=REPORT_PATH, help="JSON report path")
+    args = ap.parse_args()
+
+    report = run_all(args.data_dir, args.workers, args.out, raise_on_error=False)
+    print(format_report(report))
+    n_failed = sum(r["status"] == "failed" for r in report["checks"])
+    print(f"{'Data checks OK ✅' if report['ok'] else 'Data checks FAILED ❌'} "
+          f"({len(report['checks'])} checks, {n_failed} failed, {report['seconds']:.1f}s) -> {args.out}")
+    if not report["ok"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,132 @@
 import os
+import atexit
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 
 load_dotenv()
 
-def get_conn():
-    return psycopg2.connect(
+# Session settings applied once per connection (libpq `options`), not per query.
+# Defaults come from the environment; unset means the server default.
+#   PG_STATEMENT_TIMEOUT=300s  PG_WORK_MEM=256MB  OLIST_REF_DATE=2018-10-17  OLIST_LATENESS_DAYS=60
+SESSION_ENV = {
+    "statement_timeout": "PG_STATEMENT_TIMEOUT",
+    "work_mem": "PG_WORK_MEM",
+    "olist.ref_date": "OLIST_REF_DATE",
+    "olist.lateness_days": "OLIST_LATENESS_DAYS",
+}
+POOL_MAX = int(os.getenv("PG_POOL_MAX", 8))
+
+def conn_params(dbname=None):
+    return dict(
         host=os.getenv("PG_HOST", "localhost"),
         port=int(os.getenv("PG_PORT", 5432)),
-        dbname=os.getenv("PG_DB", "olist"),
+        dbname=dbname or os.getenv("PG_DB", "olist"),
         user=os.getenv("PG_USER", "olist"),
         password=os.getenv("PG_PASSWORD", "olist"),
+        client_encoding="UTF8",
     )
+
+def session_settings(statement_timeout=None, work_mem=None, ref_date=None):
+    """Env defaults overridden by explicit arguments; None/'' values are dropped."""
+    settings = {k: os.getenv(env) for k, env in SESSION_ENV.items()}
+    overrides = {"statement_timeout": statement_timeout, "work_mem": work_mem, "olist.ref_date": ref_date}
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return {k: str(v) for k, v in settings.items() if v not in (None, "")}
+
+def session_options(settings):
+    parts = []
+    for k, v in sorted(settings.items()):
+        v = str(v).replace(" ", "\\ ")   # libpq splits options on unescaped whitespace
+        parts.append(f"-c {k}={v}")
+    return " ".join(parts)
+
+def get_conn(dbname=None, **settings):
+    """A new, unpooled connection (long-lived workers, CREATE DATABASE, ...)."""
+    opts = session_options(session_settings(**settings))
+    return psycopg2.connect(**conn_params(dbname), **({"options": opts} if opts else {}))
+
+class BlockingPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool that waits for a free connection instead of raising PoolError."""
+    def __init__(self, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(0, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(dbname=None, maxconn=None, **settings):
+    """
+    Process-wide pool per (database, session settings). The first call for a key
+    sizes the pool (maxconn, default PG_POOL_MAX); later calls reuse it.
+    """
+    settings = session_settings(**settings)
+    key = (dbname or os.getenv("PG_DB", "olist"), tuple(sorted(settings.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            opts = session_options(settings)
+            pool = BlockingPool(maxconn or POOL_MAX, **conn_params(dbname),
+                                **({"options": opts} if opts else {}))
+            _pools[key] = pool
+        return pool
+
+@contextmanager
+def connection(dbname=None, autocommit=False, **settings):
+    """
+    Borrow a pooled connection: commit on success, roll back on error, and hand it
+    back. Broken connections are discarded instead of returned to the pool.
+
+        with connection() as conn:
+            df = pd.read_sql_query(sql, conn)
+    """
+    pool = get_pool(dbname, **settings)
+    conn = pool.getconn()
+    broken = False
+    try:
+        conn.autocommit = autocommit
+        yield conn
+        if not autocommit:
+            conn.commit()
+    except BaseException:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        raise
+    finally:
+        broken = broken or bool(conn.closed)
+        if not broken:
+            conn.autocommit = False
+        pool.putconn(conn, close=broken)
+
+@contextmanager
+def cursor(dbname=None, **settings):
+    """Shorthand for a cursor on a pooled connection (committed on success)."""
+    with connection(dbname, **settings) as conn:
+        with conn.cursor() as cur:
+            yield cur
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
@@ -0,0 +1,254 @@
+"""
+In-process DuckDB engine for the sql/ pipeline: same staging/mart SQL, no Postgres.
+
+  python src/run_sql.py --all --engine duckdb                      # data_clean/*.csv -> outputs/marts/*.parquet
+  python src/run_sql.py --all --engine duckdb --ref-date 2018-10-17 --duckdb-file outputs/olist.duckdb
+
+raw.* tables are read straight from data_clean/*.csv with read_csv_auto. Column types
+come from ingest's schema manifest while it matches the file (and its per-column
+overrides otherwise), so both engines see the same input types. The DAG from
+run_sql.build_dag runs in filename order, one transaction per file, with each
+statement parallelised across cores by DuckDB itself. Every mart.* table is then
+written to Parquet.
+
+to_duckdb() translates the Postgres dialect the pipeline uses:
+  current_setting('olist.ref_date', true) -> getvariable('olist.ref_date')  (set from --ref-date)
+  DO $$ ... $$ blocks                    -> dropped (Postgres-side admin only)
+  plpgsql functions, CREATE TRIGGER      -> dropped (change tracking for incremental refreshes;
+                                            every DuckDB run rebuilds from the CSVs anyway)
+  CREATE MATERIALIZED VIEW ... WITH NO DATA -> CREATE OR REPLACE TABLE ... AS (filled at once)
+  REFRESH MATERIALIZED VIEW              -> dropped
+  numeric(p,s)                           -> DECIMAL(p,s)
+  bare numeric                           -> DOUBLE (DuckDB's bare DECIMAL is (18,3))
+  LANGUAGE sql set-returning functions   -> table macros, columns named and cast as in RETURNS TABLE
+  width_bucket(x, lo, hi, n)             -> compatibility macro with Postgres semantics
+  CREATE INDEX, PARTITION BY ...         -> dropped (no use for a Parquet build)
+  PRIMARY KEY constraints                -> dropped (NOT NULL kept); DuckDB's key index made the
+                                            TRUNCATE + INSERT rebuilds several times slower than the queries
+  ALTER TABLE ADD PRIMARY KEY / DROP CONSTRAINT, ANALYZE -> dropped (same reason; no planner stats)
+  CREATE TEMP TABLE ... ON COMMIT DROP   -> plain temp table (each file runs once per connection)
+"""
+import os
+import re
+import json
+import time
+
+from ingest import COLUMN_TYPE_OVERRIDES, FILE_WHITELIST, sanitize_table_name
+from run_sql import COMMENT_PAT, SQL_DIR, build_dag
+
+DATA_DIR = os.path.join(os.getcwd(), 'data_clean')
+OUT_DIR = os.path.join('outputs', 'marts')
+
+# ingest.py's inferred Postgres types -> DuckDB
+DUCK_TYPES = {
+    'BOOLEAN': 'BOOLEAN', 'BIGINT': 'BIGINT', 'NUMERIC(18,6)': 'DECIMAL(18,6)',
+    'NUMERIC': 'DOUBLE', 'TIMESTAMP': 'TIMESTAMP', 'TEXT': 'VARCHAR',
+}
+
+COMPAT_MACROS = """
+CREATE SCHEMA IF NOT EXISTS raw;
+CREATE SCHEMA IF NOT EXISTS staging;
+CREATE SCHEMA IF NOT EXISTS mart;
+-- Postgres width_bucket: 0 below lo, n + 1 at or above hi
+CREATE OR REPLACE MACRO width_bucket(x, lo, hi, n) AS
+  CASE WHEN x < lo THEN 0
+       WHEN x >= hi THEN n + 1
+       ELSE CAST(floor((x - lo) / (hi - lo) * n) AS INTEGER) + 1 END;
+"""
+
+DO_PAT = re.compile(r'\bDO\s+\$(\w*)\$.*?\$\1\$\s*;', re.I | re.S)
+PLPGSQL_PAT = re.compile(r'\bCREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\b[^$;]*?\bLANGUAGE\s+plpgsql\b[^$;]*'
+                         r'\$(\w*)\$.*?\$\1\$[^;]*;', re.I | re.S)
+TRIGGER_PAT = re.compile(r'\bCREATE\s+(?:OR\s+REPLACE\s+)?(?:CONSTRAINT\s+)?TRIGGER\b[^;]*;', re.I)
+MATVIEW_PAT = re.compile(r'\bCREATE\s+MATERIALIZED\s+VIEW\s+(?:IF\s+NOT\s+EXISTS\s+)?([\w.]+)\s+AS\b'
+                         r'(.*?)(?:\s+WITH\s+(?:NO\s+)?DATA)?\s*;', re.I | re.S)
+REFRESH_PAT = re.compile(r'\bREFRESH\s+MATERIALIZED\s+VIEW\b[^;]*;', re.I)
+ALTER_KEY_PAT = re.compile(r'\bALTER\s+TABLE\s+[\w.]+\s+(?:ADD\s+(?:CONSTRAINT\s+\w+\s+)?PRIMARY\s+KEY|DROP\s+CONSTRAINT)\b[^;]*;', re.I)
+ANALYZE_PAT = re.compile(r'\bANALYZE\b[^;]*;', re.I)
+INDEX_PAT = re.compile(r'\bCREATE\s+(?:UNIQUE\s+)?INDEX\b[^;]*;', re.I)
+TABLE_PK_PAT = re.compile(r',\s*PRIMARY\s+KEY\s*\([^)]*\)', re.I)
+COLUMN_PK_PAT = re.compile(r'\s+PRIMARY\s+KEY\b', re.I)
+ON_COMMIT_DROP_PAT = re.compile(r'\s+ON\s+COMMIT\s+DROP\b', re.I)
+PARTITION_PAT = re.compile(r'\)\s*PARTITION\s+BY\s+(?:LIST|RANGE|HASH)\s*\([^)]*\)', re.I)
+SETTING_PAT = re.compile(r"\bcurrent_setting\(\s*'([^']+)'\s*(?:,\s*(?:true|false)\s*)?\)", re.I)
+NUMERIC_P_PAT = re.compile(r'\bnumeric\s*\(', re.I)
+NUMERIC_PAT = re.compile(r'\bnumeric\b(?!\s*\()', re.I)
+FUNC_PAT = re.compile(r"""
+    \bCREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+(?P<name>[\w.]+)\s*\((?P<params>.*?)\)\s*
+    RETURNS\s+TABLE\s*\((?P<cols>.*?)\)\s*
+    (?:(?:LANGUAGE\s+sql|STABLE|IMMUTABLE|VOLATILE|PARALLEL\s+\w+|STRICT)\s*)*
+    AS\s+\$(?P<tag>\w*)\$(?P<body>.*?)\$(?P=tag)\$\s*;""", re.I | re.S | re.X)
+
+def split_top(s):
+    """Split on commas that are not inside parentheses."""
+    parts, depth, cur = [], 0, []
+    for ch in s:
+        if ch == ',' and depth == 0:
+            parts.append(''.join(cur).strip())
+            cur = []
+            continue
+        depth += (ch == '(') - (ch == ')')
+        cur.append(ch)
+    tail = ''.join(cur).strip()
+    return parts + [tail] if tail else parts
+
+def _table_macro(m):
+    params, args = [], []
+    for p in split_top(m.group('params')):
+        name, rest = p.split(None, 1)
+        typ, *default = re.split(r'\s+DEFAULT\s+|\s*=\s*', rest, maxsplit=1, flags=re.I)
+        params.append((name, typ.strip()))
+        args.append(f'{name} := {default[0].strip()}' if default else name)
+    body = m.group('body').strip().rstrip(';')
+    # Macro arguments are substituted untyped; cast them as the Postgres signature would
+    for name, typ in params:
+        body = re.sub(rf'\b{name}\b', f'(SELECT CAST({name} AS {typ}))', body)
+    cols = [c.split(None, 1) for c in split_top(m.group('cols'))]
+    select = ',\n  '.join(f'CAST(_f.{c} AS {t}) AS {c}' for c, t in cols)
+    alias = ', '.join(c for c, _ in cols)
+    return (f"CREATE OR REPLACE MACRO {m.group('name')}({', '.join(args)}) AS TABLE\n"
+            f"SELECT\n  {select}\nFROM (\n{body}\n) AS _f({alias});")
+
+def to_duckdb(sql):
+    """Translate one pipeline file from the Postgres dialect to DuckDB."""
+    sql = COMMENT_PAT.sub(' ', sql)
+    sql = DO_PAT.sub('', sql)
+    sql = PLPGSQL_PAT.sub('', sql)
+    sql = TRIGGER_PAT.sub('', sql)
+    sql = MATVIEW_PAT.sub(r'CREATE OR REPLACE TABLE \1 AS\2;', sql)
+    sql = REFRESH_PAT.sub('', sql)
+    sql = ALTER_KEY_PAT.sub('', sql)
+    sql = ANALYZE_PAT.sub('', sql)
+    sql = INDEX_PAT.sub('', sql)
+    sql = PARTITION_PAT.sub(')', sql)
+    sql = ON_COMMIT_DROP_PAT.sub('', sql)
+    sql = TABLE_PK_PAT.sub('', sql)
+    sql = COLUMN_PK_PAT.sub(' NOT NULL', sql)
+    sql = SETTING_PAT.sub(r"getvariable('\1')", sql)
+    sql = NUMERIC_P_PAT.sub('DECIMAL(', sql)
+    sql = NUMERIC_PAT.sub('DOUBLE', sql)
+    return FUNC_PAT.sub(_table_macro, sql)
+
+def _quote(s):
+    return "'" + str(s).replace("'", "''") + "'"
+
+def csv_types(path, columns):
+    """Column -> DuckDB type from the ingest manifest (if current) plus ingest's overrides."""
+    types = {}
+    manifest_path = os.path.join(os.path.dirname(path), 'schema_manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(os.path.basename(path))
+        st = os.stat(path)
+        if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime:
+            types = {c['name']: DUCK_TYPES.get(c['pg_type'], 'VARCHAR') for c in entry['columns']}
+    for c in columns:
+        override = COLUMN_TYPE_OVERRIDES.get(c.strip().lower())
+        if c not in types and override:
+            types[c] = DUCK_TYPES.get(override, 'VARCHAR')
+    return types
+
+def load_raw(con, data_dir=DATA_DIR):
+    """raw.<file stem> for every whitelisted CSV in data_dir; returns {table: rows}."""
+    wanted = {f.lower() for f in FILE_WHITELIST}
+    files = sorted(f for f in os.listdir(data_dir) if f.lower() in wanted)
+    missing = wanted - {f.lower() for f in files}
+    if missing:
+        raise FileNotFoundError(f'Missing in {data_dir}: {", ".join(sorted(missing))}')
+    counts = {}
+    for fname in files:
+        path = os.path.join(data_dir, fname)
+        header = [r[0] for r in con.execute(
+            f'DESCRIBE SELECT * FROM read_csv_auto({_quote(path)}, header = true)').fetchall()]
+        types = csv_types(path, header)
+        types_sql = ', '.join(f'{_quote(c)}: {_quote(t)}' for c, t in types.items())
+        # Same column naming as ingest.create_table
+        select = ', '.join(f'"{c}" AS "{re.sub(r"[^a-zA-Z0-9_]", "_", c).lower()}"' for c in header)
+        table = f'raw.{sanitize_table_name(fname)}'
+        con.execute(f"""CREATE OR REPLACE TABLE {table} AS
+                        SELECT {select}
+                        FROM read_csv_auto({_quote(path)}, header = true, nullstr = ''
+                                           {f', types = {{{types_sql}}}' if types else ''})""")
+        counts[table] = con.execute(f'SELECT count(*) FROM {table}').fetchone()[0]
+    return counts
+
+def mart_tables(con):
+    return [r[0] for r in con.execute("""
+        SELECT table_name FROM duckdb_tables()
+        WHERE database_name = current_database() AND schema_name = 'mart'
+          AND NOT starts_with(table_name, '_')    -- bookkeeping tables
+        ORDER BY table_name
+    """).fetchall()]
+
+def export_marts(con, out_dir=OUT_DIR):
+    """Write every mart.* table to <out_dir>/<table>.parquet; returns {path: rows}."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = {}
+    for table in mart_tables(con):
+        path = os.path.join(out_dir, f'{table}.parquet')
+        con.execute(f"COPY mart.{table} TO {_quote(path + '.part')} (FORMAT parquet, COMPRESSION zstd)")
+        os.replace(path + '.part', path)
+        written[path] = con.execute(f'SELECT count(*) FROM mart.{table}').fetchone()[0]
+    return written
+
+def run_all(workers=None, dry_run=False, ref_date=None, sql_dir=SQL_DIR,
+            data_dir=DATA_DIR, out_dir=OUT_DIR, db_file=None):
+    """
+    Load raw CSVs, run the translated DAG and export the marts. Returns the names
+    of nodes that failed or were blocked by a failed upstream, like run_sql.run_all.
+    """
+    import duckdb
+
+    nodes = build_dag(sql_dir)
+    if dry_run:
+        for n in nodes:
+            deps = ', '.join(d.name for d in n.deps) or '-'
+            print(f"run   {n.name:<36} <- {deps}")
+            print(f"      writes: {', '.join(sorted(n.writes)) or '-'}")
+        return []
+
+    t_run = time.perf_counter()
+    con = duckdb.connect(db_file or ':memory:')
+    try:
+        if workers:
+            con.execute(f'SET threads = {int(workers)}')
+        if ref_date:
+            con.execute(f"SET VARIABLE \"olist.ref_date\" = {_quote(ref_date)}")
+        con.execute(COMPAT_MACROS)
+        t0 = time.perf_counter()
+        loaded = load_raw(con, data_dir)
+        print(f'-> Loaded {", ".join(f"{k}={v:,}" for k, v in loaded.items())} '
+              f'in {time.perf_counter() - t0:.2f}s')
+
+        status = {}
+        for n in nodes:
+            if any(status.get(d) in ('failed', 'blocked') for d in n.deps):
+                status[n] = 'blocked'
+                print(f'   {n.name:<36} blocked (upstream failed)')
+                continue
+            t0 = time.perf_counter()
+            try:
+                con.execute('BEGIN')
+                con.execute(to_duckdb(n.sql))
+                con.execute('COMMIT')
+            except Exception as e:
+                con.execute('ROLLBACK')
+                status[n] = 'failed'
+                print(f'   {n.name:<36} FAILED: {str(e).strip()}')
+                continue
+            status[n] = 'ok'
+            tables = set(mart_tables(con))
+            counts = {w: con.execute(f'SELECT count(*) FROM {w}').fetchone()[0]
+                      for w in sorted(n.writes) if w.startswith('mart.') and w[5:] in tables}
+            rows = ', '.join(f'{k}={v:,}' for k, v in counts.items()) or '-'
+            print(f'   {n.name:<36} ok {time.perf_counter() - t0:8.2f}s  {rows}')
+
+        failed = [n.name for n in nodes if status.get(n) in ('failed', 'blocked')]
+        t0 = time.perf_counter()
+        written = export_marts(con, out_dir)
+        print(f'-> Wrote {len(written)} Parquet marts to {out_dir} in {time.perf_counter() - t0:.2f}s')
+    finally:
+        con.close()
+    print(f'Done in {time.perf_counter() - t_run:.1f}s'
+          + (f'; not completed: {", ".join(failed)}' if failed else ' ✅'))
+    return failed
@@ -1,74 +1,82 @@
 ﻿import os
+import argparse
 import pandas as pd
-
-# Try to reuse your existing db.get_conn(); fall back to env/psycopg2 if needed.
-def get_conn():
-    try:
-        from db import get_conn as _gc
-        return _gc()
-    except Exception:
-        import psycopg2
-        from dotenv import load_dotenv
-        load_dotenv()
-        import os as _os
-        return psycopg2.connect(
-            host=_os.getenv('PG_HOST', 'localhost'),
-            port=int(_os.getenv('PG_PORT', '5432')),
-            dbname=_os.getenv('PG_DB', 'olist'),
-            user=_os.getenv('PG_USER', 'olist'),
-            password=_os.getenv('PG_PASSWORD', 'olist'),
-        )
+from db import connection
+from streaming_export import export_queries, export_query, output_path, FORMATS
 
 OUTDIR = os.path.join('outputs', 'bi_exports')
 os.makedirs(OUTDIR, exist_ok=True)
 
 def q(sql):
-    conn = get_conn()
-    try:
+    with connection() as conn:
         return pd.read_sql_query(sql, conn)
-    finally:
-        conn.close()
-
-def export_core():
-    print('-> bi_orders_daily.csv')
-    q('SELECT d, orders, gmv, ontime_rate, late_rate, avg_review, heavy_bulky_share FROM mart.bi_orders_daily ORDER BY d;'
-     ).to_csv(os.path.join(OUTDIR, 'bi_orders_daily.csv'), index=False)
 
-    print('-> bi_seller_pareto.csv')
-    q('SELECT seller_id, state, gmv, rank, cumulative_share FROM mart.seller_pareto ORDER BY rank;'
-     ).to_csv(os.path.join(OUTDIR, 'bi_seller_pareto.csv'), index=False)
+CORE_QUERIES = {
+    'bi_orders_daily.csv':  'SELECT d, orders, gmv, ontime_rate, late_rate, avg_review, heavy_bulky_share FROM mart.bi_orders_daily ORDER BY d',
+    'bi_seller_pareto.csv': 'SELECT seller_id, state, gmv, rank, cumulative_share FROM mart.seller_pareto ORDER BY rank',
+    'bi_geo_state.csv':     'SELECT state, cust_share, seller_share, gmv_share, desert_index FROM mart.geo_state ORDER BY state',
+    'bi_law3_scores.csv':   'SELECT ontime_flag, review_score, n, pct FROM mart.law3_scores ORDER BY ontime_flag, review_score',
+}
 
-    print('-> bi_geo_state.csv')
-    q('SELECT state, cust_share, seller_share, gmv_share, desert_index FROM mart.geo_state ORDER BY state;'
-     ).to_csv(os.path.join(OUTDIR, 'bi_geo_state.csv'), index=False)
+def export_core(fmt='csv', workers=4):
+    print(f'-> {len(CORE_QUERIES)} core BI tables ({fmt})')
+    export_queries(CORE_QUERIES, OUTDIR, fmt=fmt, workers=workers)
 
-    print('-> bi_law3_scores.csv')
-    q('SELECT ontime_flag, review_score, n, pct FROM mart.law3_scores ORDER BY ontime_flag, review_score;'
-     ).to_csv(os.path.join(OUTDIR, 'bi_law3_scores.csv'), index=False)
+# One row per customer, joined on the int cust_id; {churn} supplies cust_id, churn_prob
+RFM_CUSTOMERS_SQL = """
+SELECT d.cust_uid, t.r, t.f, t.m, t.rfm_sum,
+       s.avg_order_value AS aov, s.ontime_rate, s.heavy_bulky_share, p.churn_prob
+FROM mart.rfm_scored t
+JOIN mart.customer_dim d USING (cust_id)
+LEFT JOIN mart.churn_snapshot s USING (cust_id)
+LEFT JOIN {churn} p USING (cust_id)
+ORDER BY d.cust_uid
+"""
+PREDS_TABLE = 'staging.bi_churn_predictions'
 
-def export_rfm_customers():
-    print('-> bi_rfm_customers.csv')
-    rfm = q('SELECT cust_uid, r, f, m, rfm_sum FROM mart.rfm_scored ORDER BY cust_uid;')
-    snap = q('SELECT cust_uid, avg_order_value AS aov, ontime_rate, heavy_bulky_share FROM mart.churn_snapshot;')
+def stage_predictions(path):
+    """COPY a trainer's predictions CSV into PREDS_TABLE as is (text columns); returns the table."""
+    with open(path, encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+    if not {'cust_id', 'churn_prob'} <= set(header):
+        raise ValueError(f"{path} must contain columns: {{'cust_id', 'churn_prob'}}")
+    with connection() as conn, conn.cursor() as cur, open(path, 'rb') as f:
+        cur.execute(f'DROP TABLE IF EXISTS {PREDS_TABLE}')
+        cols = ', '.join(f'"{c}" text' for c in header)
+        cur.execute(f'CREATE TABLE {PREDS_TABLE} ({cols})')
+        cur.copy_expert(f'COPY {PREDS_TABLE} FROM STDIN WITH (FORMAT csv, HEADER true)', f)
+    return PREDS_TABLE
 
-    df = rfm.merge(snap, on='cust_uid', how='left')
-
-    # Attach churn_prob from local predictions (optional)
+def churn_source():
+    """
+    churn_prob per cust_id: full-base scores from score_churn.py if present, else the
+    trainer's test-split predictions (covers ~30% of customers), else none.
+    """
     preds_path = os.path.join('outputs', 'churn_predictions_snapshot.csv')
+    if q("SELECT to_regclass('mart.churn_scores') IS NOT NULL AS ok")['ok'].iat[0]:
+        return 'mart.churn_scores'
     if os.path.exists(preds_path):
-        preds = pd.read_csv(preds_path, usecols=['cust_uid','churn_prob'])
-        preds = preds.sort_values(['cust_uid','churn_prob'], ascending=[True, False]).drop_duplicates('cust_uid')
-        df = df.merge(preds, on='cust_uid', how='left')
-    else:
-        df['churn_prob'] = None
+        table = stage_predictions(preds_path)
+        return (f'(SELECT cust_id::int AS cust_id, max(churn_prob::float8) AS churn_prob'
+                f' FROM {table} GROUP BY 1)')
+    return '(SELECT NULL::int AS cust_id, NULL::float8 AS churn_prob)'
 
-    cols = ['cust_uid','r','f','m','rfm_sum','aov','ontime_rate','heavy_bulky_share','churn_prob']
-    df[cols].to_csv(os.path.join(OUTDIR, 'bi_rfm_customers.csv'), index=False)
+def export_rfm_customers(fmt='csv'):
+    print(f'-> bi_rfm_customers.{fmt}')
+    sql = RFM_CUSTOMERS_SQL.format(churn=churn_source())
+    path = output_path(OUTDIR, 'bi_rfm_customers.csv', fmt)
+    rows, size, secs = export_query(sql, path, fmt)
+    print(f'   Wrote {path} ({rows:,} rows, {size / 1e6:.1f} MB, {secs:.1f}s)')
 
 def main():
-    export_core()
-    export_rfm_customers()
-    print(f'All BI CSVs written to {OUTDIR}')
+    ap = argparse.ArgumentParser(description='Export BI tables.')
+    ap.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default csv)')
+    ap.add_argument('--workers', type=int, default=4, help='Concurrent exports (one connection each)')
+    args = ap.parse_args()
+
+    export_core(args.format, args.workers)
+    export_rfm_customers(args.format)
+    print(f'All BI exports written to {OUTDIR}')
 
 if __name__ == '__main__':
     main()
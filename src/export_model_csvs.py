@@ -1,28 +1,59 @@
 import os
-import pandas as pd
-from db import get_conn
+import re
+import argparse
+import artifacts
+from db import connection
+from streaming_export import export_queries, output_path, FORMATS
 
 OUTDIR = os.path.join(os.getcwd(), 'outputs')
 os.makedirs(OUTDIR, exist_ok=True)
 
+# Marts key on the int cust_id; the exports add the text cust_uid as a lookup column
 QUERIES = {
-    'rfm_scored.csv':     'SELECT * FROM mart.rfm_scored ORDER BY cust_uid',
-    'clv_proxy.csv':      'SELECT * FROM mart.clv_proxy ORDER BY cust_uid, as_of_date',
-    'churn_features.csv': 'SELECT * FROM mart.churn_features ORDER BY cust_uid',
-    'churn_snapshot.csv': 'SELECT * FROM mart.churn_snapshot ORDER BY cust_uid',
+    'rfm_scored.csv':     'SELECT d.cust_uid, t.* FROM mart.rfm_scored t JOIN mart.customer_dim d USING (cust_id) ORDER BY t.cust_id',
+    'clv_proxy.csv':      'SELECT d.cust_uid, t.* FROM mart.clv_proxy t JOIN mart.customer_dim d USING (cust_id) ORDER BY t.cust_id, t.as_of_date',
+    'churn_features.csv': 'SELECT d.cust_uid, t.* FROM mart.churn_features t JOIN mart.customer_dim d USING (cust_id) ORDER BY t.cust_id',
+    'churn_snapshot.csv': 'SELECT d.cust_uid, t.* FROM mart.churn_snapshot t JOIN mart.customer_dim d USING (cust_id) ORDER BY t.cust_id',
 }
 
+def source_table(sql):
+    return re.search(r'\bFROM\s+([\w.]+)', sql, re.I).group(1)
+
+def stale_queries(queries, versions, force=False):
+    """The CSV exports whose cached source version differs from the table's current one."""
+    todo = {}
+    for name, sql in queries.items():
+        path = output_path(OUTDIR, name, 'csv')
+        meta = artifacts.read_meta(path)
+        version = versions[source_table(sql)]
+        if (not force and version is not None and artifacts.is_current(path, meta)
+                and meta.get('source') == version):
+            print(f'   {path} is current ({version["rows"]:,} rows), skipped')
+        else:
+            todo[name] = sql
+    return todo
+
 def main():
-    conn = get_conn()
-    try:
-        for fname, sql in QUERIES.items():
-            print(f'-> Exporting {fname} ...')
-            df = pd.read_sql_query(sql, conn)
-            path = os.path.join(OUTDIR, fname)
-            df.to_csv(path, index=False)
-            print(f'   Wrote {path} ({len(df):,} rows)')
-    finally:
-        conn.close()
+    ap = argparse.ArgumentParser(description='Export model marts via streaming COPY.')
+    ap.add_argument('--format', choices=FORMATS, default='csv', help='Output format (default csv)')
+    ap.add_argument('--workers', type=int, default=4, help='Concurrent exports (one connection each)')
+    ap.add_argument('--force', action='store_true', help='csv: re-export tables that have not changed')
+    args = ap.parse_args()
+
+    queries = QUERIES
+    if args.format == 'csv':
+        # CSVs also get an Arrow cache stamped with the source table's version (see artifacts)
+        with connection() as conn:
+            versions = artifacts.table_versions(conn, sorted({source_table(q) for q in QUERIES.values()}))
+        queries = stale_queries(QUERIES, versions, args.force)
+
+    print(f'-> Exporting {len(queries)} tables as {args.format} ...')
+    export_queries(queries, OUTDIR, fmt=args.format, workers=args.workers)
+
+    if args.format == 'csv':
+        for name, sql in queries.items():
+            meta = artifacts.cache_csv(output_path(OUTDIR, name, 'csv'), versions[source_table(sql)])
+            print(f"   Cached {meta['path']} ({meta['bytes'] / 1e6:.1f} MB)")
 
 if __name__ == '__main__':
     main()
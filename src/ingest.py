@@ -1,7 +1,10 @@
 # src/ingest.py
-import os, re
+import os, re, json, time, argparse, hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from db import get_conn
+from db import connection, get_pool
+from profiling import span
+import checks
 
 DATA_CLEAN = os.path.join(os.getcwd(), "data_clean")
 
@@ -38,48 +41,166 @@ COLUMN_TYPE_OVERRIDES = {
     "n_items": "NUMERIC(18,6)",
 }
 
+# Natural keys for --incremental upserts: first candidate whose columns all exist wins
+NATURAL_KEYS = {
+    "features_orders": [("order_id",)],
+    "order_items_clean": [("order_id", "order_item_id"), ("order_id", "product_id")],
+    "products_clean": [("product_id",)],
+    "order_reviews_dedup": [("order_id",)],
+    "payments_order_agg": [("order_id",)],
+}
+HIGH_WATER_COL = "order_purchase_timestamp"
+# --incremental only re-stages rows purchased at most this long before the last high
+# water mark; older rows are assumed final (late status/delivery updates land within it).
+# sql/04b_clv_incremental.sql recomputes the same window (olist.lateness_days).
+LATENESS_DAYS = int(os.getenv("OLIST_LATENESS_DAYS", 60))
+
 DATE_HINT_PAT = re.compile(r"[-/T:]", re.I)
 BOOLEAN_TOKENS = {"true","false","0","1","yes","no","t","f","y","n"}
 
-def infer_pg_type(series: pd.Series, col_name: str = "") -> str:
-    s = series.dropna()
-    if s.empty:
-        return "TEXT"
-
-    cname = (col_name or "").strip().lower()
-    if cname in COLUMN_TYPE_OVERRIDES:
-        return COLUMN_TYPE_OVERRIDES[cname]
-
-    # BOOLEAN first
-    vals = [str(v).strip() for v in s.head(10000).tolist()]
-    vals_nb = [v for v in vals if v != ""]
-    lows = {v.lower() for v in vals_nb}
-    name_hints_bool = any(h in cname for h in ["_flag","is_","has_","delivered_late","late_flag","ontime"])
-    if (len(vals_nb) > 0 and all(v in BOOLEAN_TOKENS for v in lows)) or (name_hints_bool and lows <= BOOLEAN_TOKENS):
-        return "BOOLEAN"
-
-    # NUMERIC: if any decimal/exponent in raw strings, use DECIMAL
-    looks_decimal = any(("." in v) or ("e" in v.lower()) for v in vals_nb[:2000])
+# ---------- schema inference ----------
+# Type lattice: a column gets the leftmost type that every one of its values parses as.
+TYPE_LATTICE = ["BOOLEAN", "BIGINT", "NUMERIC(18,6)", "TIMESTAMP", "TEXT"]
+INT_PAT = r"[+-]?\d{1,18}"
+NUM_PAT = r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?"
+INFER_CHUNK_ROWS = 500_000
+SCHEMA_MANIFEST = os.path.join(DATA_CLEAN, "schema_manifest.json")
+
+def _parse_ts(v: pd.Series) -> pd.Series:
+    ts = pd.to_datetime(v, errors="coerce", format="ISO8601")
+    if ts.isna().any():
+        ts = pd.to_datetime(v, errors="coerce", format="mixed")
+    return ts
+
+def _fits(level, v: pd.Series) -> bool:
+    """Do all (non-null, stripped) values in v parse as lattice level `level`?"""
+    t = TYPE_LATTICE[level]
+    if t == "BOOLEAN":
+        return bool(v.str.lower().isin(BOOLEAN_TOKENS).all())
+    if t == "BIGINT":
+        return bool(v.str.fullmatch(INT_PAT).all())
+    if t == "NUMERIC(18,6)":
+        return bool(v.str.fullmatch(NUM_PAT).all())
+    if t == "TIMESTAMP":
+        if not v.str.contains(DATE_HINT_PAT).all():
+            return False
+        return bool(_parse_ts(v).notna().all())
+    return True
+
+class ColumnProfile:
+    """
+    Running type level + null count, min/max and max string length for one column.
+    `fits[i]` says whether every value seen so far parses as TYPE_LATTICE[i]; the
+    level is the first type that still fits. Lower levels are not subsets of higher
+    ones ("true" is no BIGINT, "1.5" no TIMESTAMP), so the level can only be judged
+    against all values, never against the current chunk alone.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.fits = [True] * len(TYPE_LATTICE)
+        self.nulls = 0
+        self.max_len = 0
+        self.num_min = self.num_max = None
+        self.ts_min = self.ts_max = None
+        self.str_min = self.str_max = None
+
+    @property
+    def level(self):
+        return self.fits.index(True)
+
+    def update(self, col: pd.Series):
+        v = col.dropna().str.strip()
+        v = v[v != ""]
+        self.nulls += len(col) - len(v)
+        if v.empty:
+            return
+        self.max_len = max(self.max_len, int(v.str.len().max()))
+        lo, hi = v.min(), v.max()
+        self.str_min = lo if self.str_min is None else min(self.str_min, lo)
+        self.str_max = hi if self.str_max is None else max(self.str_max, hi)
+
+        for i in range(len(TYPE_LATTICE) - 1):   # TEXT always fits
+            if self.fits[i]:
+                self.fits[i] = _fits(i, v)
+
+        # min/max are kept for every type that still fits, so they cover all values
+        # whichever level the column ends at
+        if self.fits[TYPE_LATTICE.index("NUMERIC(18,6)")]:
+            nums = v.astype("float64")
+            lo, hi = float(nums.min()), float(nums.max())
+            self.num_min = lo if self.num_min is None else min(self.num_min, lo)
+            self.num_max = hi if self.num_max is None else max(self.num_max, hi)
+        if self.fits[TYPE_LATTICE.index("TIMESTAMP")]:
+            ts = _parse_ts(v)
+            lo, hi = ts.min().isoformat(), ts.max().isoformat()
+            self.ts_min = lo if self.ts_min is None else min(self.ts_min, lo)
+            self.ts_max = hi if self.ts_max is None else max(self.ts_max, hi)
+
+    def pg_type(self):
+        cname = self.name.strip().lower()
+        if cname in COLUMN_TYPE_OVERRIDES:
+            return COLUMN_TYPE_OVERRIDES[cname]
+        if self.str_min is None:
+            return "TEXT"  # all null
+        t = TYPE_LATTICE[self.level]
+        if t == "NUMERIC(18,6)" and max(abs(self.num_min), abs(self.num_max)) >= 1e12:
+            return "NUMERIC"  # would overflow 12 integer digits
+        return t
+
+    def to_dict(self):
+        t = TYPE_LATTICE[self.level]
+        if t == "BIGINT" and self.num_min is not None:
+            lo, hi = int(self.num_min), int(self.num_max)
+        elif t in ("BIGINT", "NUMERIC(18,6)"):
+            lo, hi = self.num_min, self.num_max
+        elif t == "TIMESTAMP":
+            lo, hi = self.ts_min, self.ts_max
+        else:
+            lo, hi = self.str_min, self.str_max
+        return {"name": self.name, "pg_type": self.pg_type(), "lattice": t, "nulls": self.nulls,
+                "min": lo, "max": hi, "max_len": self.max_len}
+
+def _string_dtype():
     try:
-        nums = pd.to_numeric(s, errors="raise")
-        if looks_decimal:
-            return "NUMERIC(18,6)"
-        if (nums.dropna() % 1 == 0).all():
-            return "BIGINT"
-        return "NUMERIC(18,6)"
-    except Exception:
-        pass
+        import pyarrow  # noqa: F401  (Arrow-backed strings make the .str scans run in C++)
+        return "string[pyarrow]"
+    except ImportError:
+        return str
+
+def infer_schema(path, chunk_rows=INFER_CHUNK_ROWS):
+    """Scan the whole file in chunks and return {"rows": n, "columns": [profile dicts]}."""
+    profiles, rows = None, 0
+    # Only an empty field is NULL, as COPY ... NULL '' loads it; "NA", "null", "NaN" are values
+    for chunk in pd.read_csv(path, dtype=_string_dtype(), engine="c", chunksize=chunk_rows,
+                             keep_default_na=False, na_values=[""]):
+        if profiles is None:
+            profiles = [ColumnProfile(c) for c in chunk.columns]
+        for p in profiles:
+            p.update(chunk[p.name])
+        rows += len(chunk)
+    if profiles is None:
+        profiles = [ColumnProfile(c) for c in pd.read_csv(path, nrows=0).columns]
+    return {"rows": rows, "columns": [p.to_dict() for p in profiles]}
 
-    # TIMESTAMP only if strings look like dates
-    head = s.astype(str).head(50)
-    if any(DATE_HINT_PAT.search(v) for v in head):
-        try:
-            pd.to_datetime(s.head(10000), errors="raise")
-            return "TIMESTAMP"
-        except Exception:
-            pass
+def load_or_infer_schema(path, manifest_path=SCHEMA_MANIFEST):
+    """Reuse the manifest entry while the file's size/mtime match; otherwise infer and save it."""
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    st = os.stat(path)
+    key = os.path.basename(path)
+    entry = manifest.get(key)
+    if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+        return entry, True
 
-    return "TEXT"
+    with span("ingest.infer", file=key, bytes=st.st_size) as sp:
+        entry = {"size": st.st_size, "mtime": st.st_mtime, **infer_schema(path)}
+        sp.set(rows=entry["rows"])
+    manifest[key] = entry
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return entry, False
 
 def sanitize_table_name(fname: str) -> str:
     name = re.sub(r"\.csv$", "", fname, flags=re.I).lower()
@@ -117,26 +238,291 @@ def table_has_rows(cur, schema, table):
     cur.execute(f'SELECT 1 FROM {schema}."{table}" LIMIT 1;')
     return cur.fetchone() is not None
 
-def create_table(cur, schema, table, df: pd.DataFrame):
+def create_table(cur, schema, table, columns):
+    """columns: profile dicts from infer_schema (name, pg_type, nulls, ...)."""
     cols_sql = []
-    print(f"   Inferring column types for {schema}.{table} ...")
-    for col in df.columns:
-        pg_type = infer_pg_type(df[col], col_name=col)
-        safe_col = re.sub(r"[^a-zA-Z0-9_]", "_", col).lower()
+    for col in columns:
+        pg_type = col["pg_type"]
+        safe_col = re.sub(r"[^a-zA-Z0-9_]", "_", col["name"]).lower()
         cols_sql.append(f'"{safe_col}" {pg_type}')
-        print(f"     - {safe_col} -> {pg_type}")
+        print(f"     - {safe_col} -> {pg_type} (nulls={col['nulls']:,}, max_len={col['max_len']})")
     cur.execute(f'CREATE TABLE IF NOT EXISTS {schema}."{table}" ({", ".join(cols_sql)});')
 
-def copy_csv(cur, schema, table, path):
+def copy_csv(cur, schema, table, path, where=None):
+    """COPY a whole CSV into schema.table; `where` is a COPY ... WHERE filter (SQL text)."""
     with open(path, "r", encoding="utf-8") as f:
         cur.copy_expert(
             sql=f'''COPY {schema}."{table}"
                     FROM STDIN
-                    WITH (FORMAT csv, HEADER true, NULL '', QUOTE '\"')''',
+                    WITH (FORMAT csv, HEADER true, NULL '', QUOTE '\"')'''
+                + (f" WHERE {where}" if where else ""),
             file=f,
         )
 
+# ---------- parallel COPY ----------
+SPLIT_BLOCK = 8 * 1024 * 1024
+
+def split_csv(path, chunk_bytes):
+    """
+    Split a CSV into byte ranges that each start on a row boundary.
+    Quote parity is tracked so newlines inside quoted fields never split a row.
+    The first range includes the header line.
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    target = chunk_bytes
+    odd_quotes = 0  # quote parity at the start of the current block
+    pos = 0
+    with open(path, "rb") as f:
+        while target < size:
+            block = f.read(SPLIT_BLOCK)
+            if not block:
+                break
+            i = max(target - pos, 0)
+            while i < len(block):
+                nl = block.find(b"\n", i)
+                if nl < 0:
+                    break
+                if (odd_quotes + block.count(b'"', 0, nl)) % 2 == 0:
+                    bounds.append(pos + nl + 1)
+                    target = pos + nl + 1 + chunk_bytes
+                    i = max(target - pos, nl + 1)
+                else:
+                    i = nl + 1
+            odd_quotes = (odd_quotes + block.count(b'"')) % 2
+            pos += len(block)
+    if bounds[-1] >= size and len(bounds) > 1:
+        bounds.pop()
+    return list(zip(bounds, bounds[1:] + [size]))
+
+class RangeReader:
+    """Read-only file view over [start, end) of a file, for copy_expert."""
+    def __init__(self, path, start, end):
+        self.f = open(path, "rb")
+        self.f.seek(start)
+        self.left = end - start
+
+    def read(self, size=-1):
+        if self.left <= 0:
+            return b""
+        n = self.left if size is None or size < 0 else min(size, self.left)
+        data = self.f.read(n)
+        self.left -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if self.left <= 0:
+            return b""
+        data = self.f.readline(self.left if size is None or size < 0 else min(size, self.left))
+        self.left -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+def copy_range(conn, schema, table, path, start, end, header):
+    """COPY one row-aligned byte range into schema.table and commit; returns rows loaded."""
+    reader = RangeReader(path, start, end)
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                sql=f'''COPY {schema}."{table}"
+                        FROM STDIN
+                        WITH (FORMAT csv, HEADER {"true" if header else "false"}, NULL '', QUOTE '\"')''',
+                file=reader,
+            )
+            rows = cur.rowcount
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        reader.close()
+
+def parallel_copy(tables, jobs=4, chunk_bytes=256 * 1024 * 1024):
+    """
+    COPY several (schema, table, path) targets concurrently.
+    Files larger than chunk_bytes are split into row-aligned ranges that are
+    COPY'd in parallel into the same table. If any range of a table fails, the
+    table is truncated again so the skip-if-populated check stays trustworthy.
+    Returns {table: stats} with rows, bytes, seconds, rows_s, mb_s, chunks, error.
+    """
+    stats, futures = {}, {}
+
+    def timed_copy(schema, table, path, start, end, header):
+        t0 = time.perf_counter()
+        with span("ingest.copy", table=table, bytes=end - start) as sp:
+            with connection() as conn:
+                rows = copy_range(conn, schema, table, path, start, end, header)
+            sp.set(rows=rows)
+        return rows, t0, time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=jobs) as ex:
+        for schema, table, path in tables:
+            ranges = split_csv(path, chunk_bytes)
+            stats[table] = {"rows": 0, "bytes": os.path.getsize(path), "chunks": len(ranges),
+                            "start": float("inf"), "end": float("-inf"), "error": None}
+            for i, (start, end) in enumerate(ranges):
+                fut = ex.submit(timed_copy, schema, table, path, start, end, i == 0)
+                futures[fut] = (schema, table)
+
+        for fut in as_completed(futures):
+            schema, table = futures[fut]
+            st = stats[table]
+            try:
+                rows, t0, t1 = fut.result()
+                st["rows"] += rows
+                st["start"], st["end"] = min(st["start"], t0), max(st["end"], t1)
+            except Exception as e:
+                st["error"] = st["error"] or e
+
+    for schema, table, _ in tables:
+        st = stats[table]
+        secs = max(st.pop("end") - st.pop("start"), 1e-9)
+        st.update(seconds=secs, rows_s=st["rows"] / secs, mb_s=st["bytes"] / 1e6 / secs)
+        if st["error"] is not None:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(f'TRUNCATE {schema}."{table}";')
+    return stats
+
+# ---------- incremental ingest ----------
+def ensure_ingest_state(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS raw._ingest_state (
+          table_name    text PRIMARY KEY,
+          file_name     text,
+          file_size     bigint,
+          file_mtime    double precision,
+          checksum      text,
+          high_water_ts timestamp,
+          rows_changed  bigint,
+          loaded_at     timestamptz DEFAULT now()
+        );
+    """)
+
+def file_checksum(path, block=8 * 1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def table_columns(cur, schema, table):
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s ORDER BY ordinal_position
+    """, (schema, table))
+    return [r[0] for r in cur.fetchall()]
+
+def record_ingest_state(cur, table, path, checksum=None, rows_changed=None):
+    cols = table_columns(cur, "raw", table)
+    hwm = None
+    if HIGH_WATER_COL in cols:
+        cur.execute(f'SELECT max("{HIGH_WATER_COL}")::timestamp FROM raw."{table}";')
+        hwm = cur.fetchone()[0]
+    st = os.stat(path)
+    cur.execute("""
+        INSERT INTO raw._ingest_state AS s
+          (table_name, file_name, file_size, file_mtime, checksum, high_water_ts, rows_changed, loaded_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, now())
+        ON CONFLICT (table_name) DO UPDATE SET
+          file_name = EXCLUDED.file_name, file_size = EXCLUDED.file_size,
+          file_mtime = EXCLUDED.file_mtime, checksum = EXCLUDED.checksum,
+          high_water_ts = EXCLUDED.high_water_ts, rows_changed = EXCLUDED.rows_changed,
+          loaded_at = now();
+    """, (table, os.path.basename(path), st.st_size, st.st_mtime, checksum, hwm, rows_changed))
+    return hwm
+
+def file_unchanged(cur, table, path):
+    """(unchanged, checksum). Same size+mtime is trusted; otherwise compare content hashes."""
+    cur.execute("SELECT file_name, file_size, file_mtime, checksum FROM raw._ingest_state WHERE table_name=%s",
+                (table,))
+    row = cur.fetchone()
+    st = os.stat(path)
+    if row and row[0] == os.path.basename(path) and row[1] == st.st_size and row[2] == st.st_mtime:
+        return True, row[3]
+    checksum = file_checksum(path)
+    return bool(row) and row[3] == checksum, checksum
+
+def incremental_load(conn, schema, table, path, lateness_days=LATENESS_DAYS):
+    """
+    Stage the CSV into a temp table via COPY, then upsert on the natural key:
+    keys whose set of rows differs from the target are deleted and re-inserted,
+    identical rows are left alone. Tables with HIGH_WATER_COL only stage rows
+    at or after the recorded high water mark minus lateness_days. Rows with a
+    NULL key column are rejected (ValueError), since they cannot be matched.
+    Returns (rows_changed, high_water_ts), or None when the file is unchanged
+    since the last recorded load.
+    """
+    try:
+        with span("ingest.upsert", table=table, bytes=os.path.getsize(path)) as sp:
+            res = _incremental_load(conn, schema, table, path, lateness_days)
+            sp.set(rows=res[0] if res else 0, unchanged=res is None)
+        return res
+    except Exception:
+        conn.rollback()
+        raise
+
+def _incremental_load(conn, schema, table, path, lateness_days):
+    with conn.cursor() as cur:
+        ensure_ingest_state(cur)
+        same, checksum = file_unchanged(cur, table, path)
+        if same:
+            conn.commit()
+            return None
+        cur.execute("SELECT high_water_ts FROM raw._ingest_state WHERE table_name=%s", (table,))
+        row = cur.fetchone()
+        prev_hwm = row[0] if row else None
+
+        cols = table_columns(cur, schema, table)
+        keys = next((k for k in NATURAL_KEYS.get(table, []) if set(k) <= set(cols)), None)
+        if keys is None:
+            raise ValueError(f"No natural key available for {schema}.{table}; cannot load incrementally")
+        kcols = ", ".join(f'"{k}"' for k in keys)
+        kjoin = " AND ".join(f't."{k}" = c."{k}"' for k in keys)
+
+        where = None
+        if prev_hwm is not None and HIGH_WATER_COL in cols:
+            # Rows with a NULL timestamp are kept: they cannot be placed before the window
+            where = cur.mogrify(f'"{HIGH_WATER_COL}" IS NULL OR "{HIGH_WATER_COL}" >= %s',
+                                (prev_hwm - pd.Timedelta(days=lateness_days),)).decode()
+        cur.execute(f'CREATE TEMP TABLE _stg (LIKE {schema}."{table}") ON COMMIT DROP;')
+        copy_csv(cur, "pg_temp", "_stg", path, where=where)
+        knull = " OR ".join(f'"{k}" IS NULL' for k in keys)
+        cur.execute(f"SELECT count(*) FROM _stg WHERE {knull};")
+        null_keys = cur.fetchone()[0]
+        if null_keys:
+            raise ValueError(f"{null_keys:,} row(s) of {os.path.basename(path)} have a NULL natural key "
+                             f"({', '.join(keys)}); fix the file or load it without --incremental")
+        cur.execute(f"""
+            CREATE TEMP TABLE _keys ON COMMIT DROP AS SELECT DISTINCT {kcols} FROM _stg;
+            CREATE TEMP TABLE _cur ON COMMIT DROP AS
+              SELECT t.* FROM {schema}."{table}" t JOIN _keys USING ({kcols});
+            CREATE TEMP TABLE _chg ON COMMIT DROP AS
+              SELECT {kcols} FROM (SELECT * FROM _stg EXCEPT ALL SELECT * FROM _cur) a
+              UNION
+              SELECT {kcols} FROM (SELECT * FROM _cur EXCEPT ALL SELECT * FROM _stg) b;
+            DELETE FROM {schema}."{table}" t USING _chg c WHERE {kjoin};
+        """)
+        cur.execute(f'INSERT INTO {schema}."{table}" SELECT s.* FROM _stg s JOIN _chg USING ({kcols});')
+        rows = cur.rowcount
+        hwm = record_ingest_state(cur, table, path, checksum=checksum, rows_changed=rows)
+    conn.commit()
+    return rows, hwm
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=4, help="parallel COPY connections")
+    ap.add_argument("--chunk-mb", type=int, default=256, help="split files larger than this into parallel COPY chunks")
+    ap.add_argument("--incremental", action="store_true",
+                    help="upsert changed rows on natural keys instead of skipping populated tables")
+    ap.add_argument("--lateness-days", type=int, default=LATENESS_DAYS,
+                    help="--incremental: re-check rows this many days before the last high water mark")
+    ap.add_argument("--checks", choices=["fail", "warn", "off"], default="fail",
+                    help="data checks before loading: stop on errors (default), only report, or skip")
+    args = ap.parse_args()
+
     if not os.path.isdir(DATA_CLEAN):
         raise SystemExit("data_clean/ not found. Put your cleaned CSVs there.")
 
@@ -148,41 +534,83 @@ def main():
         print("⚠️  Missing required CSVs in data_clean/:")
         for m in missing: print("   -", m)
 
-    conn = get_conn(); conn.autocommit = False
-    try:
+    if args.checks != "off":
+        print(f"-> Data checks ({checks.REPORT_PATH}) ...")
+        report = checks.run_all(DATA_CLEAN, workers=args.jobs, raise_on_error=False)
+        print(checks.format_report(report))
+        if report["ok"]:
+            print(f"Data checks OK ✅ ({report['seconds']:.1f}s)")
+        elif args.checks == "fail":
+            raise SystemExit(f"Data checks failed, nothing loaded: {checks.DataQualityError(report)}")
+        else:
+            print("⚠️  Data checks failed, loading anyway (--checks warn)")
+
+    # main holds one connection for the whole run; the workers need the rest
+    get_pool(maxconn=args.jobs + 1)
+    with connection() as conn:
         with conn.cursor() as cur:
-            ensure_schemas(cur); conn.commit()
+            ensure_schemas(cur); ensure_ingest_state(cur); conn.commit()
 
             if not files:
                 raise SystemExit("No whitelisted CSVs found to load. Add your clean files to data_clean/.")
 
+            to_load = []
             for fname in files:
                 path = os.path.join(DATA_CLEAN, fname)
                 table = sanitize_table_name(fname)
                 print(f"-> {fname} -> raw.{table}")
 
-                df_sample = pd.read_csv(path, nrows=2000)
-
                 if not table_exists(cur, "raw", table):
-                    create_table(cur, "raw", table, df_sample); conn.commit()
+                    schema, cached = load_or_infer_schema(path)
+                    print(f"   {'Schema from manifest' if cached else 'Inferred schema'} for raw.{table} "
+                          f"({schema['rows']:,} rows)")
+                    create_table(cur, "raw", table, schema["columns"]); conn.commit()
 
-                if table_has_rows(cur, "raw", table):
+                if not args.incremental and table_has_rows(cur, "raw", table):
                     print(f"   Skip: raw.{table} already has rows"); continue
 
-                copy_csv(cur, "raw", table, path); conn.commit()
-                print(f"   Loaded {fname} ✅")
+                to_load.append(("raw", table, path))
+            conn.commit()   # release the catalog/table locks before the workers start
+
+            if to_load and args.incremental:
+                print(f"-> Incremental upsert of {len(to_load)} table(s) ...")
+
+                def load_one(t):
+                    with connection() as c:
+                        return incremental_load(c, *t, lateness_days=args.lateness_days)
+
+                with ThreadPoolExecutor(max_workers=args.jobs) as ex:
+                    futs = {ex.submit(load_one, t): t for t in to_load}
+                    for fut in as_completed(futs):
+                        _, table, _ = futs[fut]
+                        res = fut.result()
+                        if res is None:
+                            print(f"   Skip: raw.{table} source file unchanged")
+                        else:
+                            print(f"   Upserted raw.{table} ✅ {res[0]:,} rows changed (high water: {res[1]})")
+            elif to_load:
+                print(f"-> COPY {len(to_load)} table(s) with {args.jobs} connection(s) ...")
+                stats = parallel_copy(to_load, jobs=args.jobs, chunk_bytes=args.chunk_mb * 1024 * 1024)
+                failed = []
+                for _, table, _ in to_load:
+                    st = stats[table]
+                    if st["error"] is not None:
+                        failed.append(table)
+                        print(f"   ❌ raw.{table}: {st['error']}")
+                        continue
+                    print(f"   Loaded raw.{table} ✅ {st['rows']:,} rows in {st['seconds']:.1f}s "
+                          f"({st['rows_s']:,.0f} rows/s, {st['mb_s']:.1f} MB/s, {st['chunks']} chunk(s))")
+                if failed:
+                    raise SystemExit(f"COPY failed for: {', '.join(failed)}")
+                for _, table, path in to_load:
+                    record_ingest_state(cur, table, path, rows_changed=stats[table]["rows"])
+                conn.commit()
 
             ignored = sorted(set(all_csvs) - set(files))
             if ignored:
                 print("ℹ️  Ignored non-pipeline CSVs:", ", ".join(ignored))
-    finally:
-        conn.close()
 
 if __name__ == "__main__":
-    try:
-        import checks; checks.run_all(); print("Data checks OK ✅")
-    except Exception as e:
-        print("⚠️ Checks warning:", e)
     main()
     print("Ingest complete ✅")
 
@@ -0,0 +1,181 @@
+"""
+Load test for serve_lookup.py: p50/p90/p99 latency and throughput per endpoint.
+
+  python src/loadtest_lookup.py                                  # in-process server, 200k synthetic customers
+  python src/loadtest_lookup.py --synthetic 0                    # in-process server on the Postgres marts
+  python src/loadtest_lookup.py --url http://127.0.0.1:8765 --requests 50000 --concurrency 16
+
+Without --url a server is started in this process on a free port (synthetic customers by
+default, so no database is needed); client and server then share the CPU and the GIL, so
+point --url at a separately started server for numbers that reflect the service alone.
+
+Customer ids are harvested from /segment responses. Every client thread keeps one HTTP/1.1
+connection open and draws requests from a fixed mix: --lookup-share customer lookups, the
+rest segment queries picked from --segments distinct filter combinations (repeats hit the
+service's LRU cache, so fewer combinations mean a higher hit rate). Results are appended
+to --out as one JSON record per run.
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode, quote
+
+import numpy as np
+
+import serve_lookup
+
+STATES = ['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'DF', 'GO', 'ES']
+
+def get(conn, path):
+    conn.request('GET', path)
+    resp = conn.getresponse()
+    body = resp.read()
+    return resp.status, body
+
+def segment_paths(n, rng):
+    """n distinct segment queries: state and score filters with a top share."""
+    paths = set()
+    while len(paths) < n:
+        q = {}
+        if rng.random() < 0.8:
+            q['state'] = rng.choice(STATES)
+        for col in ('r', 'f', 'm'):
+            if rng.random() < 0.4:
+                q[col] = ','.join(map(str, sorted(rng.sample(range(1, 6), rng.randint(1, 2)))))
+        q['top'] = rng.choice(['0.01', '0.05', '0.1', '0.25', '1'])
+        q['limit'] = rng.choice(['10', '50', '100'])
+        paths.add('/segment?' + urlencode(q))
+    return sorted(paths)
+
+def harvest_uids(host, port, n):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    uids = []
+    for r in range(1, 6):
+        for f in range(1, 6):
+            status, body = get(conn, f'/segment?r={r}&f={f}&limit={max(1, n // 25)}')
+            if status == 200:
+                uids += [c['cust_uid'] for c in json.loads(body)['customers']]
+    conn.close()
+    return uids[:n]
+
+def worker(host, port, plan, out, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    for kind, path in plan:
+        t0 = time.perf_counter()
+        try:
+            status, _ = get(conn, path)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            status = None
+        out.append((kind, time.perf_counter() - t0))
+        if status != 200:
+            errors.append((kind, path, status))
+    conn.close()
+
+def summarize(samples, wall):
+    by_kind = {}
+    for kind, secs in samples:
+        by_kind.setdefault(kind, []).append(secs)
+    by_kind['all'] = [s for _, s in samples]
+    out = {}
+    for kind, xs in by_kind.items():
+        ms = np.asarray(xs) * 1000
+        out[kind] = {
+            'requests': len(xs),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p90_ms': float(np.percentile(ms, 90)),
+            'p99_ms': float(np.percentile(ms, 99)),
+            'max_ms': float(ms.max()),
+            'rps': len(xs) / wall if wall > 0 else None,
+        }
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description='Load-test the customer lookup service.')
+    ap.add_argument('--url', default=None, help='Running service; default starts one in-process')
+    serve_lookup.add_source_args(ap)
+    ap.set_defaults(synthetic=200_000)
+    ap.add_argument('--requests', type=int, default=20_000)
+    ap.add_argument('--concurrency', type=int, default=8, help='Client threads (one connection each)')
+    ap.add_argument('--lookup-share', type=float, default=0.8, help='Share of /customer requests')
+    ap.add_argument('--segments', type=int, default=200, help='Distinct segment queries in the mix')
+    ap.add_argument('--warmup', type=int, default=500, help='Untimed requests before measuring')
+    ap.add_argument('--mix-seed', type=int, default=7, help='Request mix seed')
+    ap.add_argument('--out', default=os.path.join('outputs', 'bench', 'lookup_loadtest.json'))
+    args = ap.parse_args()
+
+    httpd = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+        target = args.url
+    else:
+        source = serve_lookup.make_source(args)
+        t_load = time.perf_counter()
+        service = serve_lookup.LookupService(source, args.cache_size, reload_interval=0)
+        print(f'-> Loaded {service.store.n:,} customers in {time.perf_counter() - t_load:.1f}s')
+        httpd = serve_lookup.make_server(service, port=0)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        host, port = httpd.server_address[:2]
+        target = f'in-process {type(source).__name__}'
+
+    rng = random.Random(args.mix_seed)
+    uids = harvest_uids(host, port, 5000)
+    if not uids:
+        raise SystemExit('No customers returned by /segment; is the service loaded?')
+    segments = segment_paths(args.segments, rng)
+
+    def draw(n):
+        return [('customer', '/customer/' + quote(rng.choice(uids), safe='')) if rng.random() < args.lookup_share
+                else ('segment', rng.choice(segments)) for _ in range(n)]
+
+    def run(plan):
+        shards = [plan[i::args.concurrency] for i in range(args.concurrency)]
+        samples, errors = [], []
+        threads = [threading.Thread(target=worker, args=(host, port, s, samples, errors)) for s in shards]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return samples, errors, time.perf_counter() - t0
+
+    run(draw(args.warmup))
+    print(f'-> {args.requests:,} requests, {args.concurrency} connections, '
+          f'{args.lookup_share:.0%} lookups / {len(segments)} distinct segments against {target}')
+    samples, errors, wall = run(draw(args.requests))
+    stats = summarize(samples, wall)
+
+    print(f"{'endpoint':<10} {'requests':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'req/s':>9}")
+    for kind in ('customer', 'segment', 'all'):
+        if kind in stats:
+            s = stats[kind]
+            print(f"{kind:<10} {s['requests']:>9,} {s['p50_ms']:>8.2f} {s['p90_ms']:>8.2f} "
+                  f"{s['p99_ms']:>8.2f} {s['max_ms']:>8.2f} {s['rps']:>9,.0f}")
+    if errors:
+        print(f'!! {len(errors)} failed requests, e.g. {errors[0]}')
+
+    record = {
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'target': target, 'requests': args.requests,
+        'concurrency': args.concurrency, 'lookup_share': args.lookup_share,
+        'segments': len(segments), 'errors': len(errors), 'wall_s': wall, 'stats': stats,
+    }
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    history = []
+    if os.path.exists(args.out):
+        with open(args.out, encoding='utf-8') as f:
+            history = json.load(f)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(history + [record], f, indent=2)
+    print(f'Wrote {args.out}')
+    if httpd is not None:
+        httpd.shutdown()
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
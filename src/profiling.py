@@ -0,0 +1,191 @@
+"""
+Opt-in instrumentation: timed spans with rows/s and peak RSS, written to a JSONL trace.
+
+    OLIST_PROFILE=1 python src/run_sql.py --all
+    python src/profiling.py outputs/profile/trace.jsonl          # summary of a trace (all processes)
+
+    from profiling import span
+    with span('export.query', path=path) as sp:
+        rows = export(...)
+        sp.set(rows=rows)
+
+Off (the default), span() hands back one shared no-op object and traced() returns the
+function unchanged, so instrumented code costs a function call per span. On, every
+span appends one JSON line to OLIST_PROFILE_TRACE (default outputs/profile/trace.jsonl):
+name, attributes, wall and thread-CPU seconds, rows and rows/s, current and peak RSS,
+pid/thread and the enclosing span. Pool workers inherit the environment and append to
+the same file. A per-name summary table is printed when the process exits.
+
+OLIST_PROFILE_EXPLAIN=N (with OLIST_PROFILE=1) makes run_sql run DML statements under
+EXPLAIN (ANALYZE, BUFFERS) and keep the plans of the N slowest statements per file in
+the trace. ANALYZE adds per-node timing overhead, so use it to read plans, not timings.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import itertools
+import threading
+import functools
+
+ENABLED = os.getenv('OLIST_PROFILE', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+TRACE_PATH = os.getenv('OLIST_PROFILE_TRACE', os.path.join('outputs', 'profile', 'trace.jsonl'))
+EXPLAIN_TOP = int(os.getenv('OLIST_PROFILE_EXPLAIN', '0') or 0) if ENABLED else 0
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def rss_mb():
+    """Current resident set size in MB (Linux /proc; None elsewhere)."""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+_lock = threading.Lock()
+_local = threading.local()
+_ids = itertools.count(1)
+_out = {'pid': None, 'file': None}
+_totals = {}
+
+def _accumulate(totals, rec):
+    """Fold a span record into {name: [calls, total_s, max_s, rows, peak_rss_mb]}."""
+    if 'wall_s' not in rec:
+        return
+    t = totals.setdefault(rec['name'], [0, 0.0, 0.0, 0, None])
+    t[0] += 1
+    t[1] += rec['wall_s']
+    t[2] = max(t[2], rec['wall_s'])
+    t[3] += rec.get('rows') or 0
+    if rec.get('peak_rss_mb') is not None:
+        t[4] = max(t[4] or 0, rec['peak_rss_mb'])
+
+def _emit(rec):
+    line = json.dumps(rec, default=str)
+    with _lock:
+        # Reopen after a fork so each process appends through its own handle
+        if _out['pid'] != os.getpid():
+            os.makedirs(os.path.dirname(TRACE_PATH) or '.', exist_ok=True)
+            _out.update(pid=os.getpid(), file=open(TRACE_PATH, 'a', encoding='utf-8'))
+        _out['file'].write(line + '\n')
+        _out['file'].flush()
+        _accumulate(_totals, rec)
+
+class _NoSpan:
+    """What span() returns while profiling is off."""
+    __slots__ = ()
+    wall_s = None
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def set(self, **attrs):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.rows = None
+        self.wall_s = None
+
+    def set(self, **attrs):
+        """Attach attributes; rows=n also yields rows/s in the trace."""
+        if 'rows' in attrs:
+            self.rows = attrs.pop('rows')
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = _local.__dict__.setdefault('stack', [])
+        self.parent = stack[-1].id if stack else None
+        self.id = f'{os.getpid()}.{next(_ids)}'
+        stack.append(self)
+        self.started = time.time()
+        self.cpu0 = time.thread_time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_s = time.perf_counter() - self.t0
+        cpu_s = time.thread_time() - self.cpu0
+        _local.stack.pop()
+        rec = {'name': self.name, 'id': self.id, 'parent': self.parent, 'pid': os.getpid(),
+               'thread': threading.current_thread().name, 'start': self.started,
+               'wall_s': round(self.wall_s, 6), 'cpu_s': round(cpu_s, 6),
+               'rows': self.rows,
+               'rows_s': round(self.rows / self.wall_s, 1) if self.rows and self.wall_s > 0 else None,
+               'rss_mb': rss_mb(), 'peak_rss_mb': peak_rss_mb(), **self.attrs}
+        if exc_type is not None:
+            rec['error'] = f'{exc_type.__name__}: {exc}'
+        _emit(rec)
+        return False
+
+def span(name, **attrs):
+    """Context manager timing a block; a shared no-op unless OLIST_PROFILE is set."""
+    if not ENABLED:
+        return _NO_SPAN
+    return Span(name, attrs)
+
+def traced(name=None):
+    """Decorator form of span(); leaves the function untouched when profiling is off."""
+    def deco(fn):
+        if not ENABLED:
+            return fn
+        label = name or f'{fn.__module__}.{fn.__qualname__}'
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def event(name, **attrs):
+    """One untimed trace record (e.g. a captured query plan)."""
+    if ENABLED:
+        _emit({'name': name, 'pid': os.getpid(), 'start': time.time(), **attrs})
+
+def format_summary(totals):
+    """Table of _accumulate() totals, largest total time first."""
+    lines = [f"{'span':<28} {'calls':>7} {'total s':>10} {'max s':>9} {'rows':>14} {'rows/s':>12} {'peak MB':>9}"]
+    for name, (calls, total, mx, rows, peak) in sorted(totals.items(), key=lambda kv: -kv[1][1]):
+        rate = f'{rows / total:,.0f}' if rows and total > 0 else '-'
+        lines.append(f"{name:<28} {calls:>7,} {total:>10.2f} {mx:>9.2f} {rows or 0:>14,} {rate:>12} "
+                     f"{f'{peak:,.0f}' if peak is not None else '-':>9}")
+    return '\n'.join(lines)
+
+def _print_summary():
+    if _totals and _out['pid'] == os.getpid():
+        print(f'\n-> Profile ({TRACE_PATH})\n{format_summary(_totals)}', file=sys.stderr)
+
+if ENABLED:
+    atexit.register(_print_summary)
+
+def summarize_trace(path):
+    totals = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            _accumulate(totals, json.loads(line))
+    return totals
+
+def main():
+    ap = argparse.ArgumentParser(description='Summarize an OLIST_PROFILE trace.')
+    ap.add_argument('trace', nargs='?', default=TRACE_PATH)
+    args = ap.parse_args()
+    print(format_summary(summarize_trace(args.trace)))
+
+if __name__ == '__main__':
+    main()
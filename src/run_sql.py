@@ -1,34 +1,439 @@
-﻿import os, sys
-import psycopg2
-from dotenv import load_dotenv
-
-load_dotenv()
-
-def get_conn():
-    return psycopg2.connect(
-        host=os.getenv('PG_HOST','localhost'),
-        port=int(os.getenv('PG_PORT','5432')),
-        dbname=os.getenv('PG_DB','olist'),
-        user=os.getenv('PG_USER','olist'),
-        password=os.getenv('PG_PASSWORD','olist'),
-    )
-
-def run(path):
-    with open(path, 'r', encoding='utf-8') as f:
-        sql = f.read()
-    # Strip UTF-8 BOM if present and normalize line endings
-    sql = sql.lstrip('\ufeff').replace('\r\n', '\n')
+"""
+Run SQL files against the warehouse.
+
+  python src/run_sql.py sql/03_marts_churn_features.sql    # one file, one transaction
+  python src/run_sql.py --all --workers 4                    # whole sql/ pipeline as a DAG
+  python src/run_sql.py --all --engine duckdb                # same pipeline in-process, marts to Parquet
+
+In --all mode each top-level sql/*.sql file is a node. The raw/staging/mart objects a
+file reads and writes are parsed from its text; a node depends on every earlier file
+(in filename order) that writes something it reads or writes, or reads something it
+writes. Independent nodes run concurrently on a small connection pool. A node is
+skipped when its fingerprint (SQL text, upstream fingerprints and the versions of the
+raw tables it reads) matches its last successful run. Objects a file uses only
+indirectly (e.g. a function another script fills its table from) can be declared in a
+`-- reads: schema.name, ...` comment line. Every node is logged to mart._run_log with
+wall time and the rows it inserted or updated per table it writes (from the
+transaction's statistics, so logging scans nothing).
+A `CREATE MATERIALIZED VIEW IF NOT EXISTS` view is dropped and recreated when the
+md5 of its statement differs from the one kept as the view's comment.
+
+--engine duckdb needs no server: see duckdb_engine.py.
+
+With OLIST_PROFILE=1 each statement of a file runs as its own profiling span (see
+profiling.py); OLIST_PROFILE_EXPLAIN=N also keeps plans for the N slowest per file.
+"""
+import os, re, sys, json, time, uuid, hashlib, argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from db import connection, get_pool, session_settings
+import profiling
+from profiling import span
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql')
+
+# Files that are not part of the default pipeline (run them explicitly).
+EXCLUDE = {
+    '04b_clv_incremental.sql',   # incremental alternative to 04, not a separate stage
+}
+
+SCHEMAS = r'(?:raw|staging|mart)'
+OBJ = rf'({SCHEMAS}\.[A-Za-z_][A-Za-z0-9_]*)'
+WRITE_PAT = re.compile(r"""
+    \b(?:
+        CREATE\s+(?:OR\s+REPLACE\s+)?(?:UNLOGGED\s+)?(?:MATERIALIZED\s+VIEW|TABLE|VIEW|FUNCTION)\s+(?:IF\s+NOT\s+EXISTS\s+)?
+      | CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(?:\w+\s+)?ON\s+(?:ONLY\s+)?
+      | INSERT\s+INTO\s+
+      | UPDATE\s+(?:ONLY\s+)?
+      | DELETE\s+FROM\s+(?:ONLY\s+)?
+      | TRUNCATE\s+(?:TABLE\s+)?(?:ONLY\s+)?
+      | ALTER\s+(?:TABLE|VIEW|MATERIALIZED\s+VIEW)\s+(?:IF\s+EXISTS\s+)?(?:ONLY\s+)?
+      | DROP\s+(?:TABLE|VIEW|MATERIALIZED\s+VIEW|FUNCTION)\s+(?:IF\s+EXISTS\s+)?
+      | REFRESH\s+MATERIALIZED\s+VIEW\s+(?:CONCURRENTLY\s+)?
+    )""" + OBJ, re.I | re.X)
+REF_PAT = re.compile(r'\b' + OBJ, re.I)
+# Index names are not relations any node reads: DROP/ALTER INDEX must not add inputs
+INDEX_DDL_PAT = re.compile(r'\b(?:DROP|ALTER)\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+EXISTS\s+)?' + OBJ, re.I)
+DECLARED_READS_PAT = re.compile(r'^--\s*reads:(.*)$', re.I | re.M)
+COMMENT_PAT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+LITERAL_PAT = re.compile(r"'(?:[^']|'')*'")
+DOLLAR_PAT = re.compile(r'\$[A-Za-z_]*\$')
+MATVIEW_DEF_PAT = re.compile(r'CREATE\s+MATERIALIZED\s+VIEW\s+IF\s+NOT\s+EXISTS\s+' + OBJ + r'\s', re.I)
+# Statements EXPLAIN ANALYZE can run in place (it executes them, side effects included)
+EXPLAINABLE_PAT = re.compile(r'\s*(?:WITH|SELECT|INSERT|UPDATE|DELETE|MERGE)\b', re.I)
+
+# The schemas are created here, before any node runs: concurrent CREATE SCHEMA IF NOT
+# EXISTS from two nodes on a fresh database can fail with a duplicate key error.
+RUN_LOG_DDL = """
+CREATE SCHEMA IF NOT EXISTS staging;
+CREATE SCHEMA IF NOT EXISTS mart;
+CREATE TABLE IF NOT EXISTS mart._run_log (
+  run_id      text,
+  node        text,
+  status      text,          -- ok | skipped | failed | blocked
+  fingerprint text,
+  started_at  timestamptz,
+  wall_s      numeric(12,3),
+  row_counts  jsonb,
+  error       text
+);
+CREATE INDEX IF NOT EXISTS idx_run_log_node ON mart._run_log (node, started_at);
+"""
 
-    conn = get_conn()
+def read_sql(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    # Some files were saved from Windows editors; fall back to cp1252 for stray bytes
     try:
-        cur = conn.cursor()
-        # reasonable safety net so long queries don't hang forever
-        cur.execute("SET statement_timeout = '300s';")
+        sql = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        sql = raw.decode('cp1252')
+    # Strip UTF-8 BOM if present and normalize line endings
+    return sql.lstrip('\ufeff').replace('\r\n', '\n')
+
+def split_statements(sql):
+    """Top-level statements of a script; quotes, dollar-quoted bodies and comments respected."""
+    stmts, start, i, n = [], 0, 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if sql.startswith('--', i):
+            j = sql.find('\n', i)
+            i = n if j < 0 else j + 1
+        elif sql.startswith('/*', i):
+            j = sql.find('*/', i + 2)
+            i = n if j < 0 else j + 2
+        elif c in '\'"':
+            j = i + 1
+            while True:
+                j = sql.find(c, j)
+                if j < 0 or not sql.startswith(c * 2, j):
+                    break
+                j += 2
+            i = n if j < 0 else j + 1
+        elif c == '$' and DOLLAR_PAT.match(sql, i):
+            tag = DOLLAR_PAT.match(sql, i).group(0)
+            j = sql.find(tag, i + len(tag))
+            i = n if j < 0 else j + len(tag)
+        elif c == ';':
+            stmts.append(sql[start:i])
+            start = i = i + 1
+        else:
+            i += 1
+    stmts.append(sql[start:])
+    return [s.strip() for s in stmts if COMMENT_PAT.sub('', s).strip()]
+
+def _plan_rows(plan):
+    """Rows produced by an EXPLAIN (FORMAT JSON) plan; for DML, the rows fed to the table."""
+    node = plan[0]['Plan']
+    if node.get('Node Type') == 'ModifyTable' and node.get('Plans'):
+        node = node['Plans'][0]
+    return node.get('Actual Rows')
+
+def matview_defs(sql):
+    """{view: md5 of its CREATE MATERIALIZED VIEW IF NOT EXISTS statement} for a file."""
+    defs = {}
+    for stmt in split_statements(sql):
+        text = ' '.join(COMMENT_PAT.sub(' ', stmt).split())
+        m = MATVIEW_DEF_PAT.match(text)
+        if m:
+            defs[m.group(1).lower()] = 'definition md5=' + hashlib.md5(text.encode('utf-8')).hexdigest()
+    return defs
+
+def drop_changed_matviews(cur, defs):
+    """
+    Drop (CASCADE) each view of defs whose comment is not its current definition hash, so
+    that IF NOT EXISTS recreates an edited query instead of keeping the old one. Views
+    from before the hashes were kept have no comment and are recreated once.
+    """
+    for name, comment in defs.items():
+        cur.execute("SELECT obj_description(oid, 'pg_class') FROM pg_class WHERE oid = to_regclass(%s) AND relkind = 'm'",
+                    (name,))
+        row = cur.fetchone()
+        if row and row[0] != comment:
+            cur.execute(f'DROP MATERIALIZED VIEW {name} CASCADE')
+
+def execute_sql(cur, sql, label):
+    """
+    Run a file's SQL on cur. Profiling off: one round trip, as always. On: one span per
+    statement, and with OLIST_PROFILE_EXPLAIN=N the N slowest DML plans go to the trace.
+    Materialized views the file creates are recreated when their definition changed.
+    """
+    defs = matview_defs(sql)
+    drop_changed_matviews(cur, defs)
+    _execute_statements(cur, sql, label)
+    for name, comment in defs.items():
+        cur.execute(f'COMMENT ON MATERIALIZED VIEW {name} IS %s', (comment,))
+
+def _execute_statements(cur, sql, label):
+    if not profiling.ENABLED:
         cur.execute(sql)
-        conn.commit()
-        print(f'Executed {path} ✅')
-    finally:
-        conn.close()
+        return
+    timed = []
+    for i, stmt in enumerate(split_statements(sql)):
+        head = ' '.join(COMMENT_PAT.sub(' ', stmt).split())[:120]
+        plan = None
+        with span('sql.statement', file=label, n=i, sql=head) as sp:
+            if profiling.EXPLAIN_TOP and EXPLAINABLE_PAT.match(COMMENT_PAT.sub(' ', stmt)):
+                cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + stmt)
+                plan = cur.fetchone()[0]
+                sp.set(rows=_plan_rows(plan), explained=True)
+            else:
+                cur.execute(stmt)
+                sp.set(rows=cur.rowcount if cur.rowcount >= 0 else None)
+        if plan is not None:
+            timed.append((sp.wall_s, i, head, plan))
+    for wall, i, head, plan in sorted(timed, key=lambda t: -t[0])[:profiling.EXPLAIN_TOP]:
+        profiling.event('sql.explain', file=label, n=i, sql=head, wall_s_explained=round(wall, 6), plan=plan)
+
+def run(path, timeout='300s', ref_date=None):
+    sql = read_sql(path)
+
+    # statement_timeout is a reasonable safety net so long queries don't hang forever
+    with span('sql.file', file=os.path.basename(path)):
+        with connection(statement_timeout=timeout, ref_date=ref_date) as conn:
+            with conn.cursor() as cur:
+                execute_sql(cur, sql, os.path.basename(path))
+    print(f'Executed {path} ✅')
+
+# ---------------------------------------------------------------- DAG
+
+class Node:
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.sql = read_sql(path)
+        body = LITERAL_PAT.sub("''", COMMENT_PAT.sub(' ', self.sql))
+        self.writes = {m.lower() for m in WRITE_PAT.findall(body)}
+        declared = {m.lower() for line in DECLARED_READS_PAT.findall(self.sql) for m in REF_PAT.findall(line)}
+        indexes = {m.lower() for m in INDEX_DDL_PAT.findall(body)}
+        self.reads = ({m.lower() for m in REF_PAT.findall(body)} - indexes | declared) - self.writes - {'mart._run_log'}
+        self.deps = []
+        self.fingerprint = None
+
+def build_dag(sql_dir=SQL_DIR):
+    """Nodes in filename order with deps resolved from read/write sets."""
+    names = sorted(f for f in os.listdir(sql_dir) if f.endswith('.sql') and f not in EXCLUDE)
+    nodes = [Node(os.path.join(sql_dir, f)) for f in names]
+    for j, node in enumerate(nodes):
+        for prev in nodes[:j]:
+            if prev.writes & (node.reads | node.writes) or prev.reads & node.writes:
+                node.deps.append(prev)
+        # Keep only direct edges; a dep already reachable through another dep is implied
+        implied = set()
+        for d in node.deps:
+            implied |= ancestors(d)
+        node.deps = [d for d in node.deps if d not in implied]
+    return nodes
+
+def ancestors(node):
+    seen, stack = set(), list(node.deps)
+    while stack:
+        n = stack.pop()
+        if n not in seen:
+            seen.add(n)
+            stack.extend(n.deps)
+    return seen
+
+def external_versions(conn, names):
+    """
+    Version signature for inputs no node produces (the raw.* tables): relfilenode plus
+    cumulative insert/update/delete counters, and the ingest checksum when recorded.
+    """
+    if not names:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT n.nspname || '.' || c.relname, c.relfilenode,
+                   s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE n.nspname || '.' || c.relname = ANY(%s)
+        """, (sorted(names),))
+        versions = {r[0]: list(r[1:]) for r in cur.fetchall()}
+        cur.execute("SELECT to_regclass('raw._ingest_state') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT 'raw.' || table_name, checksum, high_water_ts::text FROM raw._ingest_state")
+            for name, checksum, hw in cur.fetchall():
+                if name in versions:
+                    versions[name] += [checksum, hw]
+    return {n: versions.get(n, 'missing') for n in names}
+
+def fingerprint_nodes(nodes, conn, ref_date=None):
+    produced = set().union(*(n.writes for n in nodes))
+    externals = set().union(*(n.reads for n in nodes)) - produced
+    versions = external_versions(conn, externals)
+    for node in nodes:
+        h = hashlib.sha256(node.sql.encode('utf-8'))
+        h.update(f'olist.ref_date={ref_date or ""}'.encode())
+        for d in node.deps:
+            h.update(d.fingerprint.encode())
+        for name in sorted(node.reads & externals):
+            h.update(json.dumps([name, versions[name]], default=str).encode())
+        node.fingerprint = h.hexdigest()
+
+def last_fingerprints(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT ON (node) node, fingerprint
+            FROM mart._run_log
+            WHERE status = 'ok'
+            ORDER BY node, started_at DESC
+        """)
+        return dict(cur.fetchall())
+
+def missing_outputs(conn, node):
+    with conn.cursor() as cur:
+        for name in sorted(node.writes):
+            cur.execute("SELECT to_regclass(%s) IS NULL AND to_regproc(%s) IS NULL", (name, name))
+            if cur.fetchone()[0]:
+                return True
+    return False
+
+def tuples_written(cur, node):
+    """
+    {relid: (name, inserted + updated)} for the tables/materialized views of node.writes,
+    from the transaction's own statistics: no table is scanned. The counters may include
+    earlier, not yet flushed transactions of the pooled backend, so callers diff two reads.
+    """
+    cur.execute("""
+        SELECT c.oid, n.nspname || '.' || c.relname,
+               COALESCE(s.n_tup_ins + s.n_tup_upd, 0)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_stat_xact_user_tables s ON s.relid = c.oid
+        WHERE c.relkind IN ('r', 'p', 'm') AND n.nspname || '.' || c.relname = ANY(%s)
+    """, (sorted(node.writes),))
+    return {oid: (name, n) for oid, name, n in cur.fetchall()}
+
+def row_counts(before, after):
+    """Rows each written table received from the node (a rebuilt table: its row count)."""
+    counts = {name: n - before.get(oid, (name, 0))[1] for oid, (name, n) in after.items()}
+    return dict(sorted(counts.items()))
+
+def execute_node(node, timeout, ref_date=None):
+    """Run one node as a single transaction on a pooled connection."""
+    t_start = time.perf_counter()
+    with span('sql.file', file=node.name) as sp:
+        with connection(statement_timeout=timeout, ref_date=ref_date) as conn:
+            with conn.cursor() as cur:
+                before = tuples_written(cur, node)
+                execute_sql(cur, node.sql, node.name)
+                counts = row_counts(before, tuples_written(cur, node))
+        sp.set(rows=sum(counts.values()), tables=counts)
+    return counts, time.perf_counter() - t_start
+
+def log_node(conn, run_id, node, status, started, wall=None, counts=None, error=None):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO mart._run_log
+              (run_id, node, status, fingerprint, started_at, wall_s, row_counts, error)
+            VALUES (%s, %s, %s, %s, to_timestamp(%s), %s, %s, %s)
+        """, (run_id, node.name, status, node.fingerprint, started, wall,
+              json.dumps(counts) if counts is not None else None, error))
+    conn.commit()
+
+def run_all(workers=4, force=False, dry_run=False, timeout='300s', ref_date=None, sql_dir=SQL_DIR):
+    nodes = build_dag(sql_dir)
+    ref_date = ref_date or session_settings().get('olist.ref_date')
+    with connection() as ctl:
+        with ctl.cursor() as cur:
+            cur.execute(RUN_LOG_DDL)
+        ctl.commit()
+        fingerprint_nodes(nodes, ctl, ref_date)
+        last = last_fingerprints(ctl)
+        fresh = {n for n in nodes
+                 if not force and last.get(n.name) == n.fingerprint and not missing_outputs(ctl, n)}
+        # A skipped node is only fresh if everything upstream is fresh too
+        fresh = {n for n in fresh if ancestors(n) <= fresh}
+
+        if dry_run:
+            for n in nodes:
+                deps = ', '.join(d.name for d in n.deps) or '-'
+                print(f"{'skip' if n in fresh else 'run '}  {n.name:<36} <- {deps}")
+                print(f"      writes: {', '.join(sorted(n.writes)) or '-'}")
+            return []
+
+        run_id = uuid.uuid4().hex[:12]
+        print(f'-> Run {run_id}: {len(nodes)} nodes, {len(nodes) - len(fresh)} to execute, workers={workers}')
+        # Size the node pool before the first checkout; later calls reuse it
+        get_pool(maxconn=max(1, workers), statement_timeout=timeout, ref_date=ref_date)
+
+        status = {}
+        pending = list(nodes)
+        running = {}
+        t_run = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            while pending or running:
+                for n in list(pending):
+                    dep_status = [status.get(d) for d in n.deps]
+                    if any(s in ('failed', 'blocked') for s in dep_status):
+                        status[n] = 'blocked'
+                        log_node(ctl, run_id, n, 'blocked', time.time())
+                        print(f'   {n.name:<36} blocked (upstream failed)')
+                        pending.remove(n)
+                    elif all(s in ('ok', 'skipped') for s in dep_status):
+                        pending.remove(n)
+                        if n in fresh:
+                            status[n] = 'skipped'
+                            log_node(ctl, run_id, n, 'skipped', time.time())
+                            print(f'   {n.name:<36} skipped (unchanged)')
+                        else:
+                            running[ex.submit(execute_node, n, timeout, ref_date)] = (n, time.time())
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    n, started = running.pop(fut)
+                    try:
+                        counts, wall = fut.result()
+                        status[n] = 'ok'
+                        log_node(ctl, run_id, n, 'ok', started, wall, counts)
+                        rows = ', '.join(f'{k}={v:,}' for k, v in counts.items()) or '-'
+                        print(f'   {n.name:<36} ok {wall:8.2f}s  {rows}')
+                    except Exception as e:
+                        status[n] = 'failed'
+                        log_node(ctl, run_id, n, 'failed', started, time.time() - started, error=str(e))
+                        print(f'   {n.name:<36} FAILED: {str(e).strip()}')
+        failed = [n.name for n in nodes if status.get(n) in ('failed', 'blocked')]
+        print(f'Done in {time.perf_counter() - t_run:.1f}s'
+              + (f'; not completed: {", ".join(failed)}' if failed else ' ✅'))
+        return failed
+
+def main():
+    ap = argparse.ArgumentParser(description='Run one SQL file, or the whole sql/ pipeline as a DAG.')
+    ap.add_argument('path', nargs='?', help='SQL file to run on its own')
+    ap.add_argument('--all', action='store_true', help='Run every sql/*.sql file in dependency order')
+    ap.add_argument('--workers', type=int, default=4, help='Concurrent nodes/connections (--all)')
+    ap.add_argument('--force', action='store_true', help='Run nodes even if unchanged since the last run')
+    ap.add_argument('--dry-run', action='store_true', help='Print the DAG and what would run, then exit')
+    ap.add_argument('--timeout', default='300s', help="statement_timeout per file (default '300s')")
+    ap.add_argument('--ref-date', default=None,
+                    help='Pin olist.ref_date for the session (default: OLIST_REF_DATE or last order date)')
+    ap.add_argument('--engine', choices=('postgres', 'duckdb'), default='postgres',
+                    help='postgres (default) or an in-process DuckDB run over data_clean/*.csv')
+    ap.add_argument('--data-dir', default=None, help='duckdb: directory with the cleaned CSVs (default data_clean)')
+    ap.add_argument('--out-dir', default=None, help='duckdb: where mart Parquet files go (default outputs/marts)')
+    ap.add_argument('--duckdb-file', default=None, help='duckdb: keep the database in this file (default in-memory)')
+    args = ap.parse_args()
+
+    if args.engine == 'duckdb':
+        if not args.all:
+            ap.error('--engine duckdb runs the whole pipeline; use --all')
+        import duckdb_engine
+        failed = duckdb_engine.run_all(
+            args.workers, args.dry_run, args.ref_date or session_settings().get('olist.ref_date'),
+            data_dir=args.data_dir or duckdb_engine.DATA_DIR, out_dir=args.out_dir or duckdb_engine.OUT_DIR,
+            db_file=args.duckdb_file)
+        if failed:
+            sys.exit(1)
+    elif args.all:
+        failed = run_all(args.workers, args.force, args.dry_run, args.timeout, args.ref_date)
+        if failed:
+            sys.exit(1)
+    elif args.path:
+        run(args.path, args.timeout, args.ref_date)
+    else:
+        ap.error('give a SQL file or --all')
 
 if __name__ == '__main__':
-    run(sys.argv[1])
+    main()
@@ -0,0 +1,185 @@
+"""
+Score every customer with a persisted churn model, without refitting.
+
+  python src/score_churn.py                                    # models/churn_sgd.joblib on mart.churn_features
+  python src/score_churn.py --model models/churn_logit_snapshot.joblib --workers 4 \
+      --csv outputs/churn_scores.csv
+
+Rows are streamed from --source through a server-side cursor in --batch-size
+batches, scored with one vectorized predict_proba per batch (optionally on a
+process pool), and COPY'd into a fresh mart.churn_scores_new. Its key is built
+once at the end and it is swapped in for mart.churn_scores by a rename in a short
+transaction, so readers keep the previous scores (and are never blocked) while the
+run is in progress. cust_id must be unique in --source (after --where); this is
+checked before any scoring is done. --csv also writes cust_uid,cust_id,churn_prob
+(cust_uid from mart.customer_dim), which ab_simulator --preds reads.
+
+The default --source is mart.churn_features: current features for every customer.
+mart.churn_snapshot is cut 90 days before the last order (so that its label is
+known) and leaves out the customers who first bought after that.
+"""
+import io
+import os
+import time
+import argparse
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from db import connection
+from churn_model import DEFAULT_ARTIFACT, churn_prob, feature_matrix, iter_chunks, load_artifact
+from profiling import span
+
+# Loaded without the key, which is built once at the end: faster than index maintenance per row
+SCORES_DDL = """
+CREATE SCHEMA IF NOT EXISTS mart;
+DROP TABLE IF EXISTS mart.churn_scores_new;
+CREATE TABLE mart.churn_scores_new (
+  cust_id      int NOT NULL,
+  churn_prob   double precision,
+  scored_at    timestamptz DEFAULT now()
+);
+"""
+
+# Readers hold ACCESS SHARE on the old table; the swap waits for them, they never wait for the scoring
+SWAP_SQL = """
+DROP TABLE IF EXISTS mart.churn_scores;
+ALTER TABLE mart.churn_scores_new RENAME TO churn_scores;
+ALTER TABLE mart.churn_scores RENAME CONSTRAINT churn_scores_new_pkey TO churn_scores_pkey;
+"""
+
+# Written from the new table before the swap; ab_simulator --preds reads cust_id,churn_prob
+CSV_SQL = """
+COPY (SELECT d.cust_uid, s.cust_id, s.churn_prob
+      FROM mart.churn_scores_new s LEFT JOIN mart.customer_dim d USING (cust_id)
+      ORDER BY s.cust_id)
+TO STDOUT WITH (FORMAT csv, HEADER)
+"""
+
+# Column lists of the unique indexes on a table
+UNIQUE_KEYS_SQL = """
+SELECT array_agg(a.attname::text ORDER BY k.ord)
+FROM pg_index i
+CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+WHERE i.indrelid = to_regclass(%s) AND i.indisunique
+GROUP BY i.indexrelid
+"""
+
+_MODEL = None
+
+def _init_worker(model_path):
+    global _MODEL
+    _MODEL = load_artifact(model_path)
+
+def _score(X):
+    with span('score.predict', rows=len(X)):
+        return churn_prob(_MODEL['pipeline'], X)
+
+def batches(source, batch_size, cols, where=None):
+    for df in iter_chunks(source, batch_size, cols=['cust_id', *cols], where=where):
+        yield df['cust_id'].to_numpy(), feature_matrix(df, cols)
+
+def check_unique_ids(cur, source, where=None):
+    """
+    Fail fast unless cust_id is unique in source (after where): the scores table is
+    keyed on it, and a duplicate would otherwise surface only at the final ADD PRIMARY KEY.
+    """
+    if source.lower().endswith('.csv'):
+        ids = np.concatenate([df['cust_id'].to_numpy() for df in iter_chunks(source, cols=['cust_id'])])
+        dup = ids.size - np.unique(ids).size
+    else:
+        cur.execute(UNIQUE_KEYS_SQL, (source,))
+        if ['cust_id'] in [r[0] for r in cur.fetchall()]:
+            return
+        if where is None:
+            raise SystemExit(f'cust_id is not a key of {source} (e.g. one row per snapshot_date and customer); '
+                             f'pass --where to select one row per customer')
+        cur.execute(f'SELECT count(*) - count(DISTINCT cust_id) FROM {source} WHERE {where}')
+        dup = cur.fetchone()[0]
+    if dup:
+        raise SystemExit(f'{dup:,} duplicate cust_id row(s) in {source}'
+                         + (f' WHERE {where}' if where else '') + '; scores are keyed on cust_id')
+
+def score_stream(stream, pipe, pool=None, max_inflight=2):
+    """
+    Yield (ids, probs) per batch in input order. With a pool, at most max_inflight
+    batches are submitted ahead of the writer (Pool.imap would read the whole
+    stream ahead, so memory would grow with the table).
+    """
+    if pool is None:
+        for ids, X in stream:
+            with span('score.predict', rows=len(X)):
+                probs = churn_prob(pipe, X)
+            yield ids, probs
+        return
+    pending = deque()
+    for ids, X in stream:
+        pending.append((ids, pool.apply_async(_score, (X,))))
+        if len(pending) >= max_inflight:
+            ids0, res = pending.popleft()
+            yield ids0, res.get()
+    while pending:
+        ids0, res = pending.popleft()
+        yield ids0, res.get()
+
+def score_lines(ids, probs, sep):
+    # repr() of a Python float is the shortest string that round-trips exactly
+    return ''.join(f'{i}{sep}{p!r}\n' for i, p in zip(ids.tolist(), probs.tolist()))
+
+def copy_scores(cur, ids, probs):
+    with span('score.copy', rows=len(ids)):
+        buf = io.StringIO(score_lines(ids, probs, '\t'))
+        cur.copy_expert("COPY mart.churn_scores_new (cust_id, churn_prob) FROM STDIN", buf)
+
+def main():
+    ap = argparse.ArgumentParser(description='Batch-score customers with a saved churn model.')
+    ap.add_argument('--model', default=DEFAULT_ARTIFACT, help='joblib artifact written by a trainer')
+    ap.add_argument('--source', default='mart.churn_features',
+                    help='Table (one row per customer) or CSV with the model features (default mart.churn_features)')
+    ap.add_argument('--where', default=None, help='Optional SQL filter on --source, e.g. "snapshot_date = \'2018-06-02\'"')
+    ap.add_argument('--batch-size', type=int, default=250_000)
+    ap.add_argument('--workers', type=int, default=1, help='Score batches on a process pool')
+    ap.add_argument('--csv', default=None, help='Also write cust_uid,cust_id,churn_prob to this CSV')
+    args = ap.parse_args()
+
+    if not os.path.exists(args.model):
+        raise FileNotFoundError(f'Missing {args.model}. Train first, e.g. python src/train_churn_stream.py')
+    artifact = load_artifact(args.model)
+    cols = artifact['feature_cols']
+    model_name = os.path.basename(args.model)
+    print(f"-> Scoring {args.source} with {model_name} (trained {artifact.get('trained_at', '?')})")
+
+    t_start = time.perf_counter()
+    n = 0
+    pool = Pool(args.workers, initializer=_init_worker, initargs=(args.model,)) if args.workers > 1 else None
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            check_unique_ids(cur, args.source, args.where)
+            cur.execute(SCORES_DDL)
+            stream = batches(args.source, args.batch_size, cols, args.where)
+            for ids, probs in score_stream(stream, artifact['pipeline'], pool, 2 * args.workers):
+                copy_scores(cur, ids, probs)
+                n += len(ids)
+                print(f'   {n:>12,} rows  {n / (time.perf_counter() - t_start):>12,.0f} rows/s')
+            cur.execute('ALTER TABLE mart.churn_scores_new ADD CONSTRAINT churn_scores_new_pkey PRIMARY KEY (cust_id)')
+            cur.execute("COMMENT ON TABLE mart.churn_scores_new IS %s",
+                        (f"model={model_name} trained_at={artifact.get('trained_at', '?')} source={args.source}",))
+            cur.execute('ANALYZE mart.churn_scores_new')
+            if args.csv:
+                with span('score.csv', path=args.csv), open(args.csv + '.part', 'w', newline='') as f:
+                    cur.copy_expert(CSV_SQL, f)
+            conn.commit()
+            with span('score.swap'):
+                cur.execute(SWAP_SQL)
+    finally:
+        if pool is not None:
+            pool.close(); pool.join()
+    if args.csv:
+        os.replace(args.csv + '.part', args.csv)
+        print(f'Wrote {args.csv}')
+    print(f'Scored {n:,} customers into mart.churn_scores in {time.perf_counter() - t_start:.1f}s')
+
+if __name__ == '__main__':
+    main()
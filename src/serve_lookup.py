@@ -0,0 +1,391 @@
+"""
+Local HTTP/JSON lookups over the customer marts (RFM, churn scores, CLV) for CRM tools.
+
+  python src/serve_lookup.py                              # marts from Postgres, port 8765
+  python src/serve_lookup.py --synthetic 500000           # generated customers, no database
+
+  GET /customer/<cust_uid>                  RFM, churn_prob, latest clv_90d and state of one customer
+  GET /segment?state=SP&r=5&top=0.05        customers of a segment, highest churn risk first
+  GET /health                               row count, load time and source version
+
+Segment filters are state, r, f and m; each takes one value or a comma list (values of one
+filter are OR'ed, filters AND'ed). top keeps that share of the segment by churn_prob
+(default 1), limit caps the customers returned (default 100, at most 10000).
+
+The marts are loaded once into numpy columns with rows in churn-risk order (highest
+churn_prob first, ties by cust_id): a dict maps cust_uid to its row, and every r/f/m value
+and state has a packed bitmap over those rows. A segment is a few ANDs and ORs over n/8
+bytes, and its matching rows come out already ranked, so top-k is a prefix. Segment
+responses are kept in an LRU cache (--cache-size) as encoded JSON.
+
+A background thread polls the marts' versions (relfilenode and row counters, as run_sql
+fingerprints its inputs) every --reload-interval seconds. Once a change has been stable
+for one interval, a new store is built and swapped in; the cache goes with it. Requests
+in flight keep the store they started with.
+
+Postgres sources: mart.rfm_scored + mart.customer_dim (required), mart.churn_scores
+(score_churn.py), latest mart.clv_proxy row and the state of the latest order in
+staging.orders. Customers without a score get churn_prob null and sort last.
+"""
+import io
+import json
+import math
+import time
+import threading
+import argparse
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+
+from profiling import span
+
+DEFAULT_PORT = 8765
+MAX_LIMIT = 10_000
+SCORES = range(1, 6)
+
+# ---------------------------------------------------------------- store
+
+class CustomerStore:
+    """Immutable columnar snapshot of the customer marts with lookup and segment indexes."""
+
+    def __init__(self, df, version=None, cache_size=4096):
+        # Risk order; customers without a score go last
+        df = (df.assign(_risk=df['churn_prob'].fillna(-1.0))
+                .sort_values(['_risk', 'cust_id'], ascending=[False, True])
+                .reset_index(drop=True))
+        self.n = len(df)
+        self.version = version
+        self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.uids = df['cust_uid'].astype(str).to_numpy(dtype=object)
+        self.row_of = {u: i for i, u in enumerate(self.uids)}
+        self.cols = {
+            'cust_id': df['cust_id'].to_numpy(np.int32),
+            'recency_days': df['recency_days'].to_numpy(np.float64),
+            'frequency': df['frequency'].to_numpy(np.float64),
+            'monetary': df['monetary'].to_numpy(np.float64),
+            'r': df['r'].to_numpy(np.int8),
+            'f': df['f'].to_numpy(np.int8),
+            'm': df['m'].to_numpy(np.int8),
+            'rfm_sum': df['rfm_sum'].to_numpy(np.int8),
+            'churn_prob': df['churn_prob'].to_numpy(np.float64),
+            'clv_90d': df['clv_90d'].to_numpy(np.float64),
+        }
+        self.clv_as_of = df['clv_as_of'].astype(object).where(df['clv_as_of'].notna(), None).to_numpy()
+        state = df['cust_state'].fillna('').astype(str)
+        self.states, self.state_code = np.unique(state.to_numpy(dtype=object), return_inverse=True)
+        self.bitmaps = {('state', s): np.packbits(self.state_code == i) for i, s in enumerate(self.states) if s}
+        for col in ('r', 'f', 'm'):
+            for v in SCORES:
+                self.bitmaps[(col, v)] = np.packbits(self.cols[col] == v)
+        self.segment_json = lru_cache(maxsize=cache_size)(self._segment_json)
+
+    def _row(self, i):
+        c = self.cols
+        return {
+            'cust_uid': self.uids[i],
+            'cust_id': int(c['cust_id'][i]),
+            'state': self.states[self.state_code[i]] or None,
+            'recency_days': _num(c['recency_days'][i]),
+            'frequency': _num(c['frequency'][i]),
+            'monetary': _num(c['monetary'][i]),
+            'r': int(c['r'][i]), 'f': int(c['f'][i]), 'm': int(c['m'][i]),
+            'rfm_sum': int(c['rfm_sum'][i]),
+            'churn_prob': _num(c['churn_prob'][i]),
+            'clv_90d': _num(c['clv_90d'][i]),
+            'clv_as_of': self.clv_as_of[i],
+        }
+
+    def customer(self, cust_uid):
+        i = self.row_of.get(cust_uid)
+        return None if i is None else self._row(i)
+
+    def segment_rows(self, filters):
+        """Rows matching filters ({'state'|'r'|'f'|'m': tuple of values}), highest risk first."""
+        mask = None
+        for col, values in filters.items():
+            bm = None
+            for v in values:
+                b = self.bitmaps.get((col, v))
+                if b is not None:
+                    bm = b if bm is None else np.bitwise_or(bm, b)
+            if bm is None:   # no customer has any of the values
+                return np.empty(0, dtype=np.int64)
+            mask = bm if mask is None else np.bitwise_and(mask, bm)
+        if mask is None:
+            return np.arange(self.n)
+        return np.flatnonzero(np.unpackbits(mask, count=self.n))
+
+    def segment(self, filters, top=1.0, limit=100):
+        rows = self.segment_rows(filters)
+        k = int(math.ceil(top * len(rows)))
+        selected = rows[:k]
+        probs = self.cols['churn_prob'][selected]
+        clv = self.cols['clv_90d'][selected]
+        return {
+            'filters': {c: list(v) for c, v in filters.items()},
+            'top': top,
+            'n_segment': int(len(rows)),
+            'n_selected': int(k),
+            'mean_churn_prob': _num(np.nanmean(probs)) if np.isfinite(probs).any() else None,
+            'mean_clv_90d': _num(np.nanmean(clv)) if np.isfinite(clv).any() else None,
+            'customers': [self._row(i) for i in selected[:limit]],
+        }
+
+    def _segment_json(self, key):
+        filters, top, limit = key
+        return _dumps(self.segment(dict(filters), top, limit))
+
+def _num(x):
+    x = float(x)
+    return None if math.isnan(x) else x
+
+def _dumps(obj):
+    return json.dumps(obj, default=str).encode('utf-8')
+
+# ---------------------------------------------------------------- sources
+
+CUSTOMERS_SQL = """
+SELECT d.cust_uid, s.cust_id, s.recency_days, s.frequency, s.monetary::float8 AS monetary,
+       s.r, s.f, s.m, s.rfm_sum
+FROM mart.rfm_scored s JOIN mart.customer_dim d USING (cust_id)
+"""
+SCORES_SQL = "SELECT cust_id, churn_prob FROM mart.churn_scores"
+CLV_SQL = """
+SELECT DISTINCT ON (cust_id) cust_id, clv_90d::float8 AS clv_90d, as_of_date AS clv_as_of
+FROM mart.clv_proxy ORDER BY cust_id, as_of_date DESC
+"""
+STATE_SQL = """
+SELECT DISTINCT ON (cust_id) cust_id, cust_state
+FROM staging.orders WHERE cust_id IS NOT NULL ORDER BY cust_id, order_ts DESC
+"""
+WATCHED = ['mart.rfm_scored', 'mart.customer_dim', 'mart.churn_scores', 'mart.clv_proxy', 'staging.orders']
+
+def copy_frame(cur, sql):
+    """Query result through COPY and pyarrow's CSV reader (much faster than row fetches)."""
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    from streaming_export import copy_sql
+    buf = io.BytesIO()
+    cur.copy_expert(copy_sql(sql), buf)
+    buf.seek(0)
+    text = {c: pa.string() for c in ('cust_uid', 'cust_state', 'clv_as_of')}
+    return pv.read_csv(buf, convert_options=pv.ConvertOptions(column_types=text)).to_pandas()
+
+def assemble(customers, scores=None, clv=None, states=None):
+    """One row per customer from the mart frames; missing parts become nulls."""
+    df = customers
+    parts = [(scores, ['churn_prob']), (clv, ['clv_90d', 'clv_as_of']), (states, ['cust_state'])]
+    for part, cols in parts:
+        if part is None:
+            for c in cols:
+                df[c] = np.nan if c in ('churn_prob', 'clv_90d') else None
+        else:
+            df = df.merge(part[['cust_id', *cols]], on='cust_id', how='left')
+    return df
+
+class PostgresSource:
+    def version(self):
+        from db import connection
+        from run_sql import external_versions
+        with connection() as conn:
+            v = external_versions(conn, WATCHED)
+            conn.rollback()
+        return json.dumps(v, sort_keys=True, default=str)
+
+    def load(self):
+        from db import connection
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('mart.churn_scores') IS NOT NULL")
+            has_scores = cur.fetchone()[0]
+            customers = copy_frame(cur, CUSTOMERS_SQL)
+            scores = copy_frame(cur, SCORES_SQL) if has_scores else None
+            clv = copy_frame(cur, CLV_SQL)
+            states = copy_frame(cur, STATE_SQL)
+            conn.rollback()
+        return assemble(customers, scores, clv, states)
+
+class SyntheticSource:
+    """Generated customers with mart-like distributions, for tests and load tests."""
+    STATES = ['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'DF', 'GO', 'ES']
+    STATE_P = [0.42, 0.13, 0.12, 0.055, 0.05, 0.037, 0.034, 0.021, 0.02, 0.02]
+
+    def __init__(self, n, seed=42):
+        self.n, self.seed = n, seed
+
+    def version(self):
+        return f'synthetic:{self.n}:{self.seed}'
+
+    def load(self):
+        rng = np.random.default_rng(self.seed)
+        n = self.n
+        ids = np.arange(1, n + 1, dtype=np.int32)
+        freq = rng.geometric(0.8, n)
+        monetary = np.round(rng.lognormal(4.8, 0.7, n) * freq, 2)
+        recency = rng.integers(0, 700, n)
+        p = np.asarray(self.STATE_P) / sum(self.STATE_P)
+        df = pd.DataFrame({
+            'cust_uid': [f'{h:016x}{i:016x}' for h, i in zip(rng.integers(0, 2**63, n), ids)],
+            'cust_id': ids,
+            'recency_days': recency,
+            'frequency': freq,
+            'monetary': monetary,
+            'r': 5 - np.minimum(recency * 5 // 700, 4),
+            'f': np.select([freq == 1, freq == 2, freq <= 4], [1, 3, 4], 5),
+            'm': rng.integers(1, 6, n),
+            'churn_prob': np.where(rng.random(n) < 0.05, np.nan, rng.beta(5, 2, n)),
+            'clv_90d': np.round(monetary / 90, 6),
+            'clv_as_of': (pd.Timestamp('2018-08-29') - pd.to_timedelta(recency, unit='D')).strftime('%Y-%m-%d'),
+            'cust_state': rng.choice(self.STATES, n, p=p),
+        })
+        df['rfm_sum'] = df['r'] + df['f'] + df['m']
+        return df
+
+# ---------------------------------------------------------------- service
+
+class LookupService:
+    """Holds the current store and swaps in a new one when the source changes."""
+
+    def __init__(self, source, cache_size=4096, reload_interval=30.0):
+        self.source = source
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self.store = self._build(source.version())
+        self._stop = threading.Event()
+
+    def _build(self, version):
+        with span('serve.load', source=type(self.source).__name__) as sp:
+            store = CustomerStore(self.source.load(), version, self.cache_size)
+            sp.set(rows=store.n)
+        return store
+
+    def check_reload(self, last_seen):
+        """Reload if the version changed and has stayed the same since the last check."""
+        v = self.source.version()
+        if v != self.store.version and v == last_seen:
+            self.store = self._build(v)
+            print(f'-> Reloaded {self.store.n:,} customers ({self.store.loaded_at})')
+        return v
+
+    def start_reloader(self):
+        def loop():
+            seen = self.store.version
+            while not self._stop.wait(self.reload_interval):
+                try:
+                    seen = self.check_reload(seen)
+                except Exception as e:   # keep serving the current store
+                    print(f'!! reload check failed: {e}')
+        t = threading.Thread(target=loop, name='lookup-reloader', daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+def parse_segment(query):
+    """(filters, top, limit) from a query string dict; ValueError on bad input."""
+    filters = {}
+    for col in ('state', 'r', 'f', 'm'):
+        raw = ','.join(query.get(col, []))
+        if not raw:
+            continue
+        if col == 'state':
+            values = tuple(sorted({v.strip().upper() for v in raw.split(',') if v.strip()}))
+        else:
+            values = tuple(sorted({int(v) for v in raw.split(',') if v.strip()}))
+            if any(v not in SCORES for v in values):
+                raise ValueError(f'{col} must be 1..5')
+        filters[col] = values
+    top = float(query.get('top', ['1'])[0])
+    if not 0 < top <= 1:
+        raise ValueError('top must be in (0, 1]')
+    limit = int(query.get('limit', ['100'])[0])
+    if not 0 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be in [0, {MAX_LIMIT}]')
+    return tuple(sorted(filters.items())), top, limit
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive for CRM clients and the load test
+    server_version = 'olist-lookup/1'
+    # headers and body go out as separate writes; with Nagle on, each keep-alive
+    # response waits ~40ms for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        store = self.server.service.store
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        try:
+            if parts[:1] == ['customer'] and len(parts) == 2:
+                row = store.customer(unquote(parts[1]))
+                if row is None:
+                    return self._send(404, _dumps({'error': 'unknown cust_uid'}))
+                return self._send(200, _dumps(row))
+            if parts == ['segment']:
+                return self._send(200, store.segment_json(parse_segment(parse_qs(url.query))))
+            if parts == ['health']:
+                info = store.segment_json.cache_info()
+                return self._send(200, _dumps({
+                    'rows': store.n, 'loaded_at': store.loaded_at, 'version': store.version,
+                    'cache': {'hits': info.hits, 'misses': info.misses, 'size': info.currsize},
+                }))
+            return self._send(404, _dumps({'error': 'not found'}))
+        except ValueError as e:
+            return self._send(400, _dumps({'error': str(e)}))
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+def make_server(service, host='127.0.0.1', port=DEFAULT_PORT, verbose=False):
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    httpd.verbose = verbose
+    return httpd
+
+def make_source(args):
+    return SyntheticSource(args.synthetic, args.seed) if args.synthetic else PostgresSource()
+
+def add_source_args(ap):
+    ap.add_argument('--synthetic', type=int, default=0, metavar='N',
+                    help='Serve N generated customers instead of the Postgres marts')
+    ap.add_argument('--seed', type=int, default=42, help='--synthetic data seed')
+    ap.add_argument('--cache-size', type=int, default=4096, help='LRU entries for segment queries')
+
+def main():
+    ap = argparse.ArgumentParser(description='HTTP/JSON customer and segment lookups over the marts.')
+    add_source_args(ap)
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=DEFAULT_PORT)
+    ap.add_argument('--reload-interval', type=float, default=30.0,
+                    help='Seconds between mart version checks (0 disables reloading)')
+    ap.add_argument('--verbose', action='store_true', help='Log every request')
+    args = ap.parse_args()
+
+    t_start = time.perf_counter()
+    service = LookupService(make_source(args), args.cache_size, args.reload_interval)
+    print(f'-> Loaded {service.store.n:,} customers in {time.perf_counter() - t_start:.1f}s')
+    if args.reload_interval > 0:
+        service.start_reloader()
+    httpd = make_server(service, args.host, args.port, args.verbose)
+    print(f'Serving on http://{args.host}:{httpd.server_address[1]} (Ctrl+C to stop)')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        httpd.server_close()
+
+if __name__ == '__main__':
+    main()
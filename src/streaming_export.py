@@ -0,0 +1,166 @@
+"""
+Streaming exports: COPY (query) TO STDOUT straight into the output file.
+
+Rows never pass through Python objects or a DataFrame. CSV output is written as
+psycopg2 receives it from the server. Parquet output pipes the same CSV stream into
+pyarrow's incremental CSV reader and writes fixed-size row groups, so memory stays
+bounded by the row group size whatever the table size. Several queries are exported
+concurrently, each on its own pooled connection.
+
+    from streaming_export import export_queries
+    export_queries({'clv_proxy.csv': 'SELECT * FROM mart.clv_proxy ORDER BY cust_id'},
+                   outdir='outputs', fmt='parquet', workers=4)
+"""
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from db import connection
+from profiling import span
+
+FORMATS = ('csv', 'parquet')
+BLOCK_BYTES = 16 * 1024 * 1024
+# Parquet path: small CSV parse blocks keep the pipe/parser buffers from fragmenting the
+# heap; parsed batches are regrouped so row groups still have a useful size.
+PARSE_BLOCK_BYTES = 1024 * 1024
+ROW_GROUP_ROWS = 250_000
+
+def copy_sql(sql):
+    return f"COPY ({sql.strip().rstrip(';')}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+def output_path(outdir, name, fmt):
+    stem, _ = os.path.splitext(name)
+    return os.path.join(outdir, f'{stem}.{fmt}')
+
+def export_csv(conn, sql, path):
+    """COPY the query result into path; returns the row count reported by the server."""
+    tmp = path + '.part'
+    with conn.cursor() as cur, open(tmp, 'wb') as f:
+        cur.copy_expert(copy_sql(sql), f, size=BLOCK_BYTES)
+        rows = cur.rowcount
+    os.replace(tmp, path)
+    return rows
+
+def arrow_schema(conn, sql):
+    """Arrow schema for the query's result columns, from the Postgres type OIDs."""
+    import pyarrow as pa
+    simple = {
+        16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(), 1082: pa.date32(),
+        1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+    }
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) q LIMIT 0")
+        fields = []
+        for col in cur.description:
+            if col.type_code == 1700:
+                # numeric(p,s) keeps its exact scale; unconstrained numeric becomes float64
+                typ = (pa.decimal128(col.precision, col.scale)
+                       if col.precision and col.precision <= 38 else pa.float64())
+            else:
+                typ = simple.get(col.type_code, pa.string())
+            fields.append(pa.field(col.name, typ))
+    conn.rollback()
+    return pa.schema(fields)
+
+def export_parquet(conn, sql, path, block_bytes=PARSE_BLOCK_BYTES, row_group_rows=ROW_GROUP_ROWS):
+    """
+    Stream COPY CSV through a pipe into pyarrow.csv.open_csv and write the parsed
+    batches as Parquet row groups of about row_group_rows. Returns the rows written.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pv
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(conn, sql)
+    r_fd, w_fd = os.pipe()
+    reader_end, writer_end = os.fdopen(r_fd, 'rb'), os.fdopen(w_fd, 'wb')
+    copy_error = []
+
+    def produce():
+        try:
+            with conn.cursor() as cur:
+                cur.copy_expert(copy_sql(sql), writer_end, size=block_bytes)
+        except Exception as e:   # includes BrokenPipeError if the reader gave up
+            copy_error.append(e)
+        finally:
+            try:
+                writer_end.close()
+            except OSError:
+                pass
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    tmp = path + '.part'
+    rows = 0
+    try:
+        batches = pv.open_csv(
+            reader_end,
+            read_options=pv.ReadOptions(block_size=block_bytes),
+            convert_options=pv.ConvertOptions(
+                column_types=schema,
+                # COPY writes NULL as an unquoted empty field and '' as ""
+                strings_can_be_null=True, quoted_strings_can_be_null=False,
+                true_values=['t'], false_values=['f'],
+            ),
+        )
+        with pq.ParquetWriter(tmp, schema) as writer:
+            pending, pending_rows = [], 0
+            for batch in batches:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                if pending_rows >= row_group_rows:
+                    writer.write_table(pa.Table.from_batches(pending, schema))
+                    rows += pending_rows
+                    pending, pending_rows = [], 0
+            if pending:
+                writer.write_table(pa.Table.from_batches(pending, schema))
+                rows += pending_rows
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        reader_end.close()
+        producer.join()
+    if copy_error:
+        os.remove(tmp)
+        raise copy_error[0]
+    os.replace(tmp, path)
+    return rows
+
+def export_query(sql, path, fmt='csv', dbname=None):
+    """Export one query on a pooled connection. Returns (rows, bytes, seconds)."""
+    t_start = time.perf_counter()
+    with span('export.query', path=path, fmt=fmt) as sp:
+        with connection(dbname) as conn:
+            if fmt == 'parquet':
+                rows = export_parquet(conn, sql, path)
+            else:
+                rows = export_csv(conn, sql, path)
+        size = os.path.getsize(path)
+        sp.set(rows=rows, bytes=size)
+    return rows, size, time.perf_counter() - t_start
+
+def export_queries(queries, outdir, fmt='csv', workers=4, dbname=None):
+    """
+    Export {file name: query} concurrently. The file extension follows fmt.
+    Prints one line per finished file and returns {path: (rows, bytes, seconds)}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'fmt must be one of {FORMATS}, got {fmt!r}')
+    os.makedirs(outdir, exist_ok=True)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(export_query, sql, output_path(outdir, name, fmt), fmt, dbname):
+                output_path(outdir, name, fmt)
+            for name, sql in queries.items()
+        }
+        for fut in as_completed(futures):
+            path = futures[fut]
+            rows, size, secs = fut.result()
+            results[path] = (rows, size, secs)
+            print(f'   Wrote {path} ({rows:,} rows, {size / 1e6:.1f} MB, {secs:.1f}s)')
+    return results
@@ -0,0 +1,235 @@
+"""
+Synthetic Olist-shaped data for scaling tests: writes the five data_clean/ CSVs that
+ingest.py loads, at any volume from 10k to tens of millions of orders.
+
+  python src/synth_data.py --orders 1e6                      # -> data_clean/
+  python src/synth_data.py --orders 5e7 --out /data/olist50m/data_clean --seed 7
+
+Shapes follow the real dataset closely enough that the marts don't degenerate:
+  - customers: about 0.8 per order with skewed repeat purchases (as bench_sql.py),
+    and a customer keeps one state;
+  - orders: Sep 2016 to Oct 2018 with volume growing over time; 1-6 items each;
+  - products: about 1 in 10 heavy/bulky (heavier, larger, dearer freight), skewed
+    popularity, each sold by one seller with Pareto-like seller sizes;
+  - payments: credit card / boleto / voucher / debit card mix, installments on cards;
+  - delivery: ~2% never delivered, ~8% late, and late orders get worse reviews.
+Everything is generated in chunks of --chunk-orders with numpy and written with
+pyarrow's CSV writer, so memory does not grow with the order count. The same
+--orders and --seed always produce the same files.
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+DATA_CLEAN = os.path.join(os.getcwd(), 'data_clean')
+FILES = ('features_orders.csv', 'order_items_clean.csv', 'products_clean.csv',
+         'order_reviews_dedup.csv', 'payments_order_agg.csv')
+MANIFEST = '_synth.json'
+
+START = np.datetime64('2016-09-04T00:00:00', 's').astype(np.int64)
+SPAN_S = 773 * 86400
+CUST_PER_ORDER = 0.8
+REPEAT_SKEW = 1.3          # customer index = n_cust * u**skew; > 1 means more repeat buyers
+GROWTH = 0.7               # order time = span * u**growth; < 1 puts more orders late in the range
+HEAVY_SHARE = 0.10
+
+STATES = ['SP', 'RJ', 'MG', 'RS', 'PR', 'SC', 'BA', 'DF', 'ES', 'GO', 'PE', 'CE',
+          'PA', 'MT', 'MA', 'MS', 'PB', 'PI', 'RN', 'AL', 'SE', 'TO', 'RO', 'AM', 'AC', 'AP', 'RR']
+STATE_P = np.array([42.0, 12.9, 11.7, 5.5, 5.1, 3.7, 3.4, 2.2, 2.0, 2.0, 1.7, 1.3,
+                    1.0, 0.9, 0.7, 0.7, 0.5, 0.5, 0.5, 0.4, 0.3, 0.3, 0.3, 0.2, 0.1, 0.1, 0.1])
+CATEGORIES = ['cama_mesa_banho', 'beleza_saude', 'esporte_lazer', 'informatica_acessorios',
+              'utilidades_domesticas', 'relogios_presentes', 'telefonia', 'automotivo',
+              'brinquedos', 'perfumaria', 'bebes', 'eletronicos']
+HEAVY_CATEGORIES = ['moveis_decoracao', 'ferramentas_jardim', 'eletrodomesticos', 'moveis_escritorio']
+PAYMENT_TYPES = ['credit_card', 'boleto', 'voucher', 'debit_card']
+PAYMENT_P = [0.74, 0.19, 0.055, 0.015]
+# review score 1..5 by delivery outcome
+REVIEW_P = {
+    'ontime': [0.07, 0.02, 0.08, 0.20, 0.63],
+    'late': [0.45, 0.10, 0.13, 0.12, 0.20],
+    'undelivered': [0.70, 0.10, 0.10, 0.05, 0.05],
+}
+NO_REVIEW_SHARE = 0.01
+
+def _ids(idx, prefix='', width=32):
+    """Zero-padded string ids, built in Arrow rather than one Python string per row."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ids = pc.utf8_lpad(pa.array(idx).cast(pa.string()), width - len(prefix), '0')
+    return pc.binary_join_element_wise(prefix, ids, '') if prefix else ids
+
+def _nullable(x, mask):
+    import pyarrow as pa
+    return pa.array(x, mask=mask)
+
+def customer_states(cust_idx):
+    """A fixed state per customer, from a multiplicative hash of its index (no lookup table)."""
+    u = ((cust_idx.astype(np.uint64) * np.uint64(2654435761)) % np.uint64(2 ** 32)) / 2.0 ** 32
+    cdf = np.cumsum(STATE_P) / STATE_P.sum()
+    return np.minimum(np.searchsorted(cdf, u, side='right'), len(STATES) - 1)
+
+def make_products(n_products, rng):
+    heavy = rng.random(n_products) < HEAVY_SHARE
+    weight = np.where(heavy, rng.lognormal(np.log(16_000), 0.5, n_products),
+                      rng.lognormal(np.log(500), 0.9, n_products))
+    volume = np.where(heavy, rng.lognormal(np.log(80_000), 0.5, n_products),
+                      rng.lognormal(np.log(4_000), 0.9, n_products))
+    side = np.cbrt(volume)
+    dims = np.maximum(2, np.round(side[:, None] * rng.lognormal(0, 0.25, (n_products, 3)))).astype(np.int64)
+    cat = np.where(heavy, rng.integers(0, len(HEAVY_CATEGORIES), n_products) + len(CATEGORIES),
+                   rng.integers(0, len(CATEGORIES), n_products))
+    n_sellers = max(50, n_products // 10)
+    return {
+        'heavy': heavy,
+        'weight': np.round(weight),
+        'dims': dims,
+        'category': cat,
+        'price': np.round(rng.lognormal(np.log(80), 0.9, n_products) * np.where(heavy, 3.0, 1.0), 2),
+        'seller': np.floor(n_sellers * rng.random(n_products) ** 2.0).astype(np.int64),
+    }
+
+def products_table(p):
+    import pyarrow as pa
+    n = len(p['heavy'])
+    names = np.array(CATEGORIES + HEAVY_CATEGORIES, dtype=object)
+    l, h, w = p['dims'].T
+    return pa.table({
+        'product_id': _ids(np.arange(n), 'p', 9),
+        'product_category_name': pa.array(names[p['category']]),
+        'product_weight_g': p['weight'],
+        'product_length_cm': l, 'product_height_cm': h, 'product_width_cm': w,
+        'product_volume_cm3': l * h * w,
+        'is_heavy_bulky': p['heavy'],
+    })
+
+def order_chunk(first, n, n_orders, products, rng):
+    """Tables for orders [first, first + n): (features_orders, items, reviews, payments)."""
+    import pyarrow as pa
+    n_cust = max(1, int(n_orders * CUST_PER_ORDER))
+    order_idx = np.arange(first, first + n)
+    cust = np.floor(n_cust * rng.random(n) ** REPEAT_SKEW).astype(np.int64)
+    ts = START + (SPAN_S * rng.random(n) ** GROWTH).astype(np.int64)
+
+    # items: 1 + geometric extra items (mean ~1.15 per order), products by skewed popularity
+    k = np.minimum(rng.geometric(0.87, n), 6)
+    item_order = np.repeat(np.arange(n), k)
+    item_no = np.arange(len(item_order)) - np.repeat(np.cumsum(k) - k, k) + 1
+    n_products = len(products['heavy'])
+    prod = np.floor(n_products * rng.random(len(item_order)) ** 2.0).astype(np.int64)
+    price = products['price'][prod]
+    freight = np.round(7.5 + products['weight'][prod] * 0.0012 * rng.lognormal(0, 0.3, len(prod)), 2)
+    merch = np.round(np.bincount(item_order, price, n), 2)
+    freight_total = np.round(np.bincount(item_order, freight, n), 2)
+    gmv = np.round(merch + freight_total, 2)
+    heavy = np.bincount(item_order, products['heavy'][prod], n) > 0
+
+    # delivery and reviews
+    eta = ts + (rng.uniform(15, 35, n) * 86400).astype(np.int64)
+    delivered = ts + (rng.gamma(2.0, 5.5, n) * 86400).astype(np.int64)
+    undelivered = rng.random(n) < 0.02
+    late = ~undelivered & (delivered > eta)
+    score = np.empty(n, dtype=np.float64)
+    for outcome, mask in (('ontime', ~undelivered & ~late), ('late', late), ('undelivered', undelivered)):
+        score[mask] = rng.choice(5, mask.sum(), p=REVIEW_P[outcome]) + 1
+    no_review = rng.random(n) < NO_REVIEW_SHARE
+
+    pay_type = rng.choice(len(PAYMENT_TYPES), n, p=PAYMENT_P)
+    installments = np.where(pay_type == 0, np.minimum(rng.geometric(0.35, n), 10), 1)
+    n_methods = np.where((pay_type == 2) | (rng.random(n) < 0.01), 2, 1)
+    pay_names = np.array(PAYMENT_TYPES, dtype=object)[pay_type]
+
+    ts_type = pa.timestamp('s')
+    order_ids = _ids(order_idx)
+    orders = pa.table({
+        'order_id': order_ids,
+        'cust_uid': _ids(cust),
+        'order_purchase_timestamp': pa.array(ts, ts_type),
+        'order_delivered_customer_date': pa.array(delivered, ts_type, mask=undelivered),
+        'order_estimated_delivery_date': pa.array(eta, ts_type),
+        'customer_id': _ids(order_idx, 'k', 12),
+        'cust_state': pa.array(np.array(STATES, dtype=object)[customer_states(cust)]),
+        'gmv': gmv, 'merchandise_total': merch, 'freight_total': freight_total, 'pay_total': gmv,
+        'review_score': _nullable(score, no_review),
+        'main_payment_type': pa.array(pay_names),
+        'any_heavy_bulky': heavy,
+    })
+    items = pa.table({
+        'order_id': order_ids.take(pa.array(item_order)),
+        'order_item_id': item_no,
+        'product_id': _ids(prod, 'p', 9),
+        'seller_id': _ids(products['seller'][prod], 's', 7),
+        'price': price,
+        'freight_value': freight,
+    })
+    reviews = pa.table({'order_id': order_ids, 'review_score': score}).filter(pa.array(~no_review))
+    payments = pa.table({
+        'order_id': order_ids,
+        'main_payment_type': pa.array(pay_names),
+        'pay_total': gmv,
+        'installments_max': installments,
+        'n_payment_methods': n_methods,
+    })
+    return orders, items, reviews, payments
+
+def generate(out_dir=DATA_CLEAN, n_orders=100_000, seed=42, chunk_orders=1_000_000):
+    """Write the five CSVs into out_dir; returns {file: rows}."""
+    import pyarrow.csv as pv
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_products = int(min(max(n_orders // 3, 500), 1_000_000))
+    products = make_products(n_products, rng)
+    paths = {f: os.path.join(out_dir, f) for f in FILES}
+    rows = dict.fromkeys(FILES, 0)
+    opts = pv.WriteOptions(quoting_style='needed')
+
+    prod_table = products_table(products)
+    pv.write_csv(prod_table, paths['products_clean.csv'] + '.part', opts)
+    rows['products_clean.csv'] = prod_table.num_rows
+
+    writers = {}
+    try:
+        for first in range(0, n_orders, chunk_orders):
+            tables = order_chunk(first, min(chunk_orders, n_orders - first), n_orders, products, rng)
+            for name, table in zip(('features_orders.csv', 'order_items_clean.csv',
+                                    'order_reviews_dedup.csv', 'payments_order_agg.csv'), tables):
+                if name not in writers:
+                    writers[name] = pv.CSVWriter(paths[name] + '.part', table.schema, write_options=opts)
+                writers[name].write_table(table)
+                rows[name] += table.num_rows
+    finally:
+        for w in writers.values():
+            w.close()
+    for path in paths.values():
+        os.replace(path + '.part', path)
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'orders': n_orders, 'seed': seed, 'rows': rows}, f, indent=2)
+    return rows
+
+def is_current(out_dir, n_orders, seed):
+    """True when out_dir already holds this generator's output for (n_orders, seed)."""
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path) or not all(os.path.exists(os.path.join(out_dir, f)) for f in FILES):
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        m = json.load(f)
+    return m.get('orders') == n_orders and m.get('seed') == seed
+
+def main():
+    ap = argparse.ArgumentParser(description='Write synthetic Olist-shaped data_clean/ CSVs.')
+    ap.add_argument('--orders', type=float, default=100_000, help='Number of orders, e.g. 1e6')
+    ap.add_argument('--out', default=DATA_CLEAN, help='Output directory (default ./data_clean)')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--chunk-orders', type=int, default=1_000_000, help='Orders generated per batch')
+    args = ap.parse_args()
+
+    t_start = time.perf_counter()
+    rows = generate(args.out, int(args.orders), args.seed, args.chunk_orders)
+    for name, n in rows.items():
+        print(f'   {name:<26} {n:>14,} rows')
+    print(f'Wrote {args.out} in {time.perf_counter() - t_start:.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -8,10 +8,16 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import roc_auc_score, classification_report, confusion_matrix
 
+import artifacts
+from churn_model import MODEL_DIR, save_artifact
+from profiling import span
+
 INPATH = os.path.join('outputs', 'churn_features.csv')
 OUT_PRED = os.path.join('outputs', 'churn_predictions.csv')
 
-df = pd.read_csv(INPATH)
+with span('train.load', path=INPATH) as sp:
+    df = artifacts.read_frame(INPATH)
+    sp.set(rows=len(df))
 
 # --- Label ---
 # Heuristic: churn if no purchase within last 90 days at ref date
@@ -34,7 +40,7 @@ X = X.replace([np.inf, -np.inf], np.nan).fillna(0)
 
 # Train/test split (stratified)
 X_train, X_test, y_train, y_test, cust_train, cust_test = train_test_split(
-    X, y, df['cust_uid'], test_size=0.3, random_state=42, stratify=y
+    X, y, df[['cust_uid', 'cust_id']], test_size=0.3, random_state=42, stratify=y
 )
 
 # Pipeline: scale + logistic regression (balanced)
@@ -43,10 +49,12 @@ pipe = Pipeline(steps=[
     ('logit', LogisticRegression(max_iter=1000, class_weight='balanced', solver='lbfgs'))
 ])
 
-pipe.fit(X_train, y_train)
+with span('train.fit', model='logit', rows=len(X_train)):
+    pipe.fit(X_train, y_train)
 
 # Evaluate
-proba = pipe.predict_proba(X_test)[:,1]
+with span('train.predict', rows=len(X_test)):
+    proba = pipe.predict_proba(X_test)[:,1]
 pred = (proba >= 0.5).astype(int)
 
 auc = roc_auc_score(y_test, proba)
@@ -60,11 +68,18 @@ print(confusion_matrix(y_test, pred))
 
 # Save predictions
 out = pd.DataFrame({
-    'cust_uid': cust_test,
+    'cust_uid': cust_test['cust_uid'],
+    'cust_id': cust_test['cust_id'],
     'churn_prob': proba,
     'churn_pred_0_1': pred,
     'churn_true': y_test.values
 }).sort_values('churn_prob', ascending=False)
 
 out.to_csv(OUT_PRED, index=False)
+artifacts.write_frame(OUT_PRED, out, source={'model': 'churn_logit', 'input': INPATH})
 print(f'Wrote {OUT_PRED} ({len(out):,} rows)')
+
+# Persist the fitted pipeline so score_churn.py can score every customer without refitting
+path = save_artifact(pipe, os.path.join(MODEL_DIR, 'churn_logit.joblib'),
+                     source=INPATH, label='recency_days >= 90', metrics={'test_auc': auc})
+print(f'Saved {path}')
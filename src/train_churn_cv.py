@@ -0,0 +1,320 @@
+"""
+Cross-validated churn model search: a grid of logistic regressions (C, penalty, class
+weight) and histogram gradient boosting, scored with time-aware folds on a process pool.
+
+  python src/train_churn_cv.py                                        # mart.churn_snapshot_history
+  python src/train_churn_cv.py --n-jobs 4 --C 0.01,0.1,1 --models logit
+  python src/train_churn_cv.py --source outputs/churn_snapshot.csv --refit
+
+The features are streamed from --source once into a float32 matrix under --workdir
+(X.f32, raw row-major, plus y/snapshot_date/cust_id .npy files and a meta.json with the
+source version); later runs reuse it while the source has not changed. Pool workers open
+the files with mmap and slice out their fold, so no array is pickled to them and the page
+cache holds a single copy of the matrix for all workers.
+
+Folds are rolling-origin over snapshot_date: each of the last --folds snapshot dates is
+a validation fold, trained on the snapshots whose 90-day label window closed by that
+date (t0 <= fold date - 90 days), so no fold trains on labels from its own future.
+A source with a single snapshot date falls back to --folds customer-hash folds.
+
+Candidates are raced fold by fold, oldest (smallest) fold first: after each fold, a
+candidate whose mean AUC so far trails the best candidate on the same folds by more
+than --prune-margin is dropped. Every candidate's per-fold AUC and fit time go to
+--leaderboard (CSV, best first); --refit fits the winner on all rows and saves it for
+score_churn.py.
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from churn_model import FEATURE_COLS, LABEL_COL, MODEL_DIR, feature_matrix, iter_chunks, save_artifact
+from profiling import span
+
+LABEL_DAYS = 90
+WORKDIR = os.path.join('outputs', 'cv')
+LEADERBOARD = os.path.join('outputs', 'cv', 'leaderboard.csv')
+
+# ---------------------------------------------------------------- feature matrix
+
+def source_version(source):
+    if source.lower().endswith('.csv'):
+        from artifacts import file_version
+        return file_version(source)
+    import artifacts
+    from db import connection
+    with connection() as conn:
+        return artifacts.table_versions(conn, [source])[source]
+
+def build_matrix(source, workdir, chunksize=200_000):
+    """Stream source into workdir as float32 features + labels/dates/ids; returns meta."""
+    os.makedirs(workdir, exist_ok=True)
+    x_path = os.path.join(workdir, 'X.f32')
+    cols = ['cust_id', 'snapshot_date', *FEATURE_COLS, LABEL_COL]
+    ys, dates, ids = [], [], []
+    rows = 0
+    with span('cv.matrix', source=source) as sp, open(x_path + '.part', 'wb') as f:
+        for df in iter_chunks(source, chunksize, cols):
+            f.write(np.ascontiguousarray(feature_matrix(df), dtype=np.float32).tobytes())
+            ys.append(df[LABEL_COL].to_numpy(dtype=np.int8))
+            dates.append(pd.to_datetime(df['snapshot_date']).to_numpy().astype('datetime64[D]'))
+            ids.append(df['cust_id'].to_numpy(dtype=np.int32))
+            rows += len(df)
+        sp.set(rows=rows)
+    os.replace(x_path + '.part', x_path)
+    for name, parts, dtype in (('y', ys, np.int8), ('snapshot_date', dates, 'datetime64[D]'),
+                               ('cust_id', ids, np.int32)):
+        np.save(os.path.join(workdir, f'{name}.npy'),
+                np.concatenate(parts) if parts else np.empty(0, dtype=dtype))
+    meta = {'source': source, 'version': source_version(source), 'rows': rows,
+            'feature_cols': FEATURE_COLS, 'dtype': 'float32',
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(os.path.join(workdir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, default=str)
+    return meta
+
+def current_meta(source, workdir):
+    """meta.json of workdir if it was built from this version of source and these features."""
+    try:
+        with open(os.path.join(workdir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    version = json.loads(json.dumps(source_version(source), default=str))
+    if (meta.get('source') != source or meta.get('version') != version
+            or meta.get('feature_cols') != FEATURE_COLS or version is None):
+        return None
+    return meta
+
+def open_matrix(workdir, rows):
+    """(X, y, snapshot_date, cust_id), all memory-mapped read-only."""
+    X = np.memmap(os.path.join(workdir, 'X.f32'), dtype=np.float32, mode='r',
+                  shape=(rows, len(FEATURE_COLS)))
+    y, dates, ids = (np.load(os.path.join(workdir, f'{n}.npy'), mmap_mode='r')
+                     for n in ('y', 'snapshot_date', 'cust_id'))
+    return X, y, dates, ids
+
+# ---------------------------------------------------------------- folds and candidates
+
+def make_folds(dates, ids, n_folds):
+    """
+    [(name, train_spec, valid_spec)] oldest first. Specs are small tuples the workers
+    turn into masks themselves: ('date_le', d) / ('date_eq', d) or ('hash_ne', k, n) /
+    ('hash_eq', k, n).
+    """
+    days = np.unique(dates)
+    folds = []
+    for d in days[-n_folds:]:
+        cutoff = d - np.timedelta64(LABEL_DAYS, 'D')
+        if (days <= cutoff).any():
+            folds.append((str(d), ('date_le', str(cutoff)), ('date_eq', str(d))))
+    if len(days) > 1:
+        return folds
+    print(f'-> Single snapshot date ({days[0] if len(days) else "-"}): '
+          f'falling back to {n_folds} customer-hash folds (not time-aware)')
+    return [(f'hash{k}', ('hash_ne', k, n_folds), ('hash_eq', k, n_folds)) for k in range(n_folds)]
+
+def fold_mask(spec, dates, ids):
+    kind = spec[0]
+    if kind in ('date_le', 'date_eq'):
+        d = np.datetime64(spec[1], 'D')
+        return dates <= d if kind == 'date_le' else dates == d
+    k, n = spec[1], spec[2]
+    h = pd.util.hash_array(np.asarray(ids, dtype=np.int64)) % n
+    return h != k if kind == 'hash_ne' else h == k
+
+def candidates(args):
+    out = []
+    if 'logit' in args.models:
+        for C, penalty, cw in itertools.product(args.C, args.penalty, args.class_weight):
+            out.append({'name': f'logit C={C:g} {penalty} cw={cw}', 'model': 'logit',
+                        'C': C, 'penalty': penalty, 'class_weight': None if cw == 'none' else cw})
+    if 'hgb' in args.models:
+        for lr, leaves in itertools.product(args.hgb_lr, args.hgb_leaves):
+            out.append({'name': f'hgb lr={lr:g} leaves={leaves}', 'model': 'hgb',
+                        'learning_rate': lr, 'max_leaf_nodes': leaves})
+    return out
+
+def make_model(cand, seed=42):
+    from sklearn.pipeline import Pipeline
+    if cand['model'] == 'hgb':
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        # Trees need no scaling; its own early stopping picks the iteration count
+        return Pipeline(steps=[('hgb', HistGradientBoostingClassifier(
+            learning_rate=cand['learning_rate'], max_leaf_nodes=cand['max_leaf_nodes'],
+            max_iter=300, early_stopping=True, random_state=seed))])
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.linear_model import LogisticRegression
+    # lbfgs has no l1. saga fits the float32 fold in place, where liblinear builds a float64
+    # copy plus its own row format (~3 GB per worker at 3M rows); tol=1e-3 stops it in
+    # ~15 epochs on millions of rows. l2 is the default penalty, so only l1 is spelled out.
+    l1 = {'penalty': 'l1', 'solver': 'saga', 'tol': 1e-3} if cand['penalty'] == 'l1' else {}
+    return Pipeline(steps=[
+        ('scaler', StandardScaler()),
+        ('logit', LogisticRegression(C=cand['C'], class_weight=cand['class_weight'],
+                                     max_iter=1000, **l1)),
+    ])
+
+# ---------------------------------------------------------------- workers
+
+_DATA = None
+
+def _init_worker(workdir, rows):
+    global _DATA
+    # One process per core already; keep BLAS/OpenMP from oversubscribing it
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(1)
+    _DATA = open_matrix(workdir, rows)
+
+def _fit_fold(task):
+    """Fit one candidate on one fold; the fold is sliced from the shared memmap here."""
+    from sklearn.metrics import roc_auc_score
+    cand, (fold, train_spec, valid_spec) = task
+    X, y, dates, ids = _DATA
+    train, valid = fold_mask(train_spec, dates, ids), fold_mask(valid_spec, dates, ids)
+    model = make_model(cand)
+    t0 = time.perf_counter()
+    with span('cv.fit', candidate=cand['name'], fold=fold, rows=int(train.sum())):
+        model.fit(X[train], y[train])
+    fit_s = time.perf_counter() - t0
+    y_valid = y[valid]
+    auc = (roc_auc_score(y_valid, model.predict_proba(X[valid])[:, 1])
+           if 0 < y_valid.sum() < len(y_valid) else float('nan'))
+    return {'candidate': cand['name'], 'fold': fold, 'auc': float(auc), 'fit_s': fit_s,
+            'n_train': int(train.sum()), 'n_valid': int(valid.sum())}
+
+# ---------------------------------------------------------------- search
+
+def race(cands, folds, pool, margin):
+    """Run folds in order over the surviving candidates; {name: [fold results]}, {name: pruned_at}."""
+    results = {c['name']: [] for c in cands}
+    pruned = {}
+    alive = list(cands)
+    for i, fold in enumerate(folds):
+        t_fold = time.perf_counter()
+        for fut in as_completed([pool.submit(_fit_fold, (c, fold)) for c in alive]):
+            r = fut.result()
+            results[r['candidate']].append(r)
+        means = {c['name']: np.nanmean([r['auc'] for r in results[c['name']]]) for c in alive}
+        best = max(means.values())
+        print(f'   fold {fold[0]} ({i + 1}/{len(folds)}): {len(alive)} candidates, '
+              f'best mean AUC {best:.4f} ({time.perf_counter() - t_fold:.1f}s)')
+        if i + 1 == len(folds):
+            break
+        for c in alive:
+            if means[c['name']] < best - margin:
+                pruned[c['name']] = fold[0]
+        alive = [c for c in alive if c['name'] not in pruned]
+    return results, pruned
+
+def leaderboard(cands, folds, results, pruned):
+    rows = []
+    for c in cands:
+        res = {r['fold']: r for r in results[c['name']]}
+        aucs = [res[f[0]]['auc'] for f in folds if f[0] in res]
+        row = {
+            'candidate': c['name'], 'model': c['model'],
+            'params': json.dumps({k: v for k, v in c.items() if k not in ('name', 'model')}),
+            'folds_run': len(aucs), 'pruned_at': pruned.get(c['name'], ''),
+            'mean_auc': float(np.nanmean(aucs)), 'std_auc': float(np.nanstd(aucs)),
+            'fit_s_total': sum(r['fit_s'] for r in res.values()),
+            'fit_s_mean': float(np.mean([r['fit_s'] for r in res.values()])),
+        }
+        for f in folds:
+            row[f'auc_{f[0]}'] = res[f[0]]['auc'] if f[0] in res else np.nan
+        rows.append(row)
+    # Candidates that finished every fold rank above pruned ones, then by mean AUC
+    board = pd.DataFrame(rows)
+    board['complete'] = board['folds_run'] == len(folds)
+    board = board.sort_values(['complete', 'mean_auc'], ascending=[False, False]).drop(columns='complete')
+    board.insert(0, 'rank', range(1, len(board) + 1))
+    return board
+
+def csv_floats(s):
+    return [float(v) for v in s.split(',') if v.strip()]
+
+def csv_list(s):
+    return [v.strip() for v in s.split(',') if v.strip()]
+
+def main():
+    ap = argparse.ArgumentParser(description='Time-aware CV search over churn models on a process pool.')
+    ap.add_argument('--source', default='mart.churn_snapshot_history',
+                    help='schema.table (server-side cursor) or CSV path with snapshot_date')
+    ap.add_argument('--workdir', default=WORKDIR, help='Where the memory-mapped feature matrix lives')
+    ap.add_argument('--rebuild', action='store_true', help='Rebuild the matrix even if the source is unchanged')
+    ap.add_argument('--chunksize', type=int, default=200_000)
+    ap.add_argument('--folds', type=int, default=3, help='Validation snapshot dates (or hash folds)')
+    ap.add_argument('--n-jobs', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    ap.add_argument('--models', type=csv_list, default=['logit', 'hgb'], help='logit,hgb')
+    ap.add_argument('--C', type=csv_floats, default=[0.01, 0.1, 1.0, 10.0])
+    ap.add_argument('--penalty', type=csv_list, default=['l2', 'l1'])
+    ap.add_argument('--class-weight', type=csv_list, default=['none', 'balanced'])
+    ap.add_argument('--hgb-lr', type=csv_floats, default=[0.1])
+    ap.add_argument('--hgb-leaves', type=lambda s: [int(v) for v in csv_list(s)], default=[31])
+    ap.add_argument('--prune-margin', type=float, default=0.01,
+                    help='Drop a candidate trailing the best mean AUC by more than this')
+    ap.add_argument('--leaderboard', default=LEADERBOARD)
+    ap.add_argument('--refit', action='store_true', help='Fit the best candidate on all rows and save it')
+    ap.add_argument('--out', default=os.path.join(MODEL_DIR, 'churn_cv_best.joblib'))
+    args = ap.parse_args()
+
+    if args.source.lower().endswith('.csv') and not os.path.exists(args.source):
+        raise FileNotFoundError(f'Missing {args.source}. Run: python src\\export_model_csvs.py')
+
+    t_start = time.perf_counter()
+    meta = None if args.rebuild else current_meta(args.source, args.workdir)
+    if meta is None:
+        print(f'-> Building feature matrix from {args.source} ...')
+        meta = build_matrix(args.source, args.workdir, args.chunksize)
+    else:
+        print(f'-> Reusing {args.workdir} ({meta["rows"]:,} rows, built {meta["built_at"]})')
+    if meta['rows'] == 0:
+        raise SystemExit(f'{args.source} is empty. Run: python src/build_snapshot_history.py')
+    mb = meta['rows'] * len(FEATURE_COLS) * 4 / 1e6
+    print(f'   {meta["rows"]:,} rows x {len(FEATURE_COLS)} float32 features ({mb:.0f} MB memory-mapped)')
+
+    X, y, dates, ids = open_matrix(args.workdir, meta['rows'])
+    folds = make_folds(dates, ids, args.folds)
+    if not folds:
+        raise SystemExit('No fold has a training snapshot at least '
+                         f'{LABEL_DAYS} days before it; build more months of history')
+    cands = candidates(args)
+    print(f'-> {len(cands)} candidates x {len(folds)} folds on {args.n_jobs} workers; folds: '
+          + ', '.join(f[0] for f in folds))
+
+    # A worker killed mid-fit (typically by the OOM killer) breaks the executor and fails the
+    # run here; multiprocessing.Pool would replace the worker and wait for the lost task forever
+    with ProcessPoolExecutor(args.n_jobs, initializer=_init_worker,
+                             initargs=(args.workdir, meta['rows'])) as pool:
+        try:
+            results, pruned = race(cands, folds, pool, args.prune_margin)
+        except BrokenProcessPool:
+            raise SystemExit(f'A CV worker died (out of memory?); each holds a copy of its '
+                             f'training fold, so retry with fewer than --n-jobs {args.n_jobs}') from None
+
+    board = leaderboard(cands, folds, results, pruned)
+    os.makedirs(os.path.dirname(args.leaderboard) or '.', exist_ok=True)
+    board.to_csv(args.leaderboard, index=False)
+    print(board[['rank', 'candidate', 'folds_run', 'mean_auc', 'std_auc', 'fit_s_mean']]
+          .head(10).to_string(index=False, float_format=lambda v: f'{v:.4f}'))
+    print(f'Wrote {args.leaderboard} ({len(board)} candidates) in {time.perf_counter() - t_start:.1f}s')
+
+    if args.refit:
+        best = next(c for c in cands if c['name'] == board.iloc[0]['candidate'])
+        model = make_model(best)
+        with span('cv.refit', candidate=best['name'], rows=meta['rows']):
+            model.fit(X, y)
+        path = save_artifact(model, args.out, source=args.source, label=LABEL_COL,
+                             metrics={'cv_mean_auc': float(board.iloc[0]['mean_auc']),
+                                      'folds': [f[0] for f in folds]},
+                             params=best)
+        print(f'Saved {path}')
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 import os
 import pandas as pd
-import numpy as np
 
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
@@ -8,27 +7,25 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import roc_auc_score, classification_report, confusion_matrix
 
+import artifacts
+from churn_model import MODEL_DIR, FEATURE_COLS, LABEL_COL, feature_matrix, save_artifact
+from profiling import span
+
 INPATH = os.path.join('outputs', 'churn_snapshot.csv')
 OUT_PRED = os.path.join('outputs', 'churn_predictions_snapshot.csv')
 
 if not os.path.exists(INPATH):
     raise FileNotFoundError(f'Missing {INPATH}. Run: python src\\export_model_csvs.py')
 
-df = pd.read_csv(INPATH)
-
-y = df['churn_90d'].astype(int)
+with span('train.load', path=INPATH) as sp:
+    df = artifacts.read_frame(INPATH, columns=['cust_uid', 'cust_id', *FEATURE_COLS, LABEL_COL])
+    sp.set(rows=len(df))
 
-feature_cols = [
-    'recency_days','frequency','monetary','r','f','m',
-    'orders_30d','orders_60d','orders_90d',
-    'avg_order_value','avg_delivery_days','avg_review_score',
-    'pay_share_card','pay_share_boleto','pay_share_voucher',
-    'heavy_bulky_share','ontime_rate'
-]
-X = df[feature_cols].replace([np.inf, -np.inf], np.nan).fillna(0)
+y = df[LABEL_COL].astype(int)
+X = feature_matrix(df)
 
 X_train, X_test, y_train, y_test, cust_train, cust_test = train_test_split(
-    X, y, df['cust_uid'], test_size=0.3, random_state=42, stratify=y
+    X, y, df[['cust_uid', 'cust_id']], test_size=0.3, random_state=42, stratify=y
 )
 
 pipe = Pipeline(steps=[
@@ -36,9 +33,11 @@ pipe = Pipeline(steps=[
     ('logit', LogisticRegression(max_iter=1000, class_weight='balanced', solver='lbfgs'))
 ])
 
-pipe.fit(X_train, y_train)
+with span('train.fit', model='logit', rows=len(X_train)):
+    pipe.fit(X_train, y_train)
 
-proba = pipe.predict_proba(X_test)[:, 1]
+with span('train.predict', rows=len(X_test)):
+    proba = pipe.predict_proba(X_test)[:, 1]
 pred  = (proba >= 0.5).astype(int)
 
 auc = roc_auc_score(y_test, proba)
@@ -51,7 +50,8 @@ print('Confusion matrix:')
 print(confusion_matrix(y_test, pred))
 
 out = pd.DataFrame({
-    'cust_uid': cust_test,
+    'cust_uid': cust_test['cust_uid'],
+    'cust_id': cust_test['cust_id'],
     'churn_prob': proba,
     'churn_pred_0_1': pred,
     'churn_true': y_test.values
@@ -59,4 +59,11 @@ out = pd.DataFrame({
 
 os.makedirs('outputs', exist_ok=True)
 out.to_csv(OUT_PRED, index=False)
+artifacts.write_frame(OUT_PRED, out, source={'model': 'churn_logit_snapshot', 'input': INPATH,
+                                             'input_sha256': (artifacts.read_meta(INPATH) or {}).get('sha256')})
 print(f'Wrote {OUT_PRED} ({len(out):,} rows)')
+
+# Persist the fitted pipeline so score_churn.py can score every customer without refitting
+path = save_artifact(pipe, os.path.join(MODEL_DIR, 'churn_logit_snapshot.joblib'),
+                     source=INPATH, label='churn_90d', metrics={'test_auc': auc})
+print(f'Saved {path}')
@@ -0,0 +1,96 @@
+"""
+Out-of-core churn training: StandardScaler.partial_fit + SGDClassifier(log_loss)
+over chunks of the snapshot, so memory stays flat as the training set grows.
+
+  python src/train_churn_stream.py                                   # outputs/churn_snapshot.csv
+  python src/train_churn_stream.py --source mart.churn_snapshot_history --epochs 5
+
+Passes over the source (each one streamed in --chunksize rows):
+  1. scaler statistics and class counts on the training side of the split
+  2. --epochs passes of SGD partial_fit (rows shuffled within each chunk)
+  3. holdout scoring into a histogram AUC
+The train/holdout split hashes cust_id, so it is stable across chunks and runs and
+keeps a customer's snapshots on one side. The fitted scaler+classifier pipeline is
+saved with joblib for scoring.
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+from sklearn.preprocessing import StandardScaler
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from churn_model import (LABEL_COL, DEFAULT_ARTIFACT, churn_prob, feature_matrix,
+                         holdout_mask, iter_chunks, StreamingAUC, save_artifact)
+from profiling import span
+
+def split_chunks(source, chunksize, holdout, want_holdout):
+    for df in iter_chunks(source, chunksize):
+        mask = holdout_mask(df['cust_id'], holdout)
+        part = df[mask] if want_holdout else df[~mask]
+        if len(part):
+            yield feature_matrix(part), part[LABEL_COL].to_numpy(dtype=np.int64)
+
+def main():
+    ap = argparse.ArgumentParser(description='Streaming churn trainer (partial_fit over chunks).')
+    ap.add_argument('--source', default=os.path.join('outputs', 'churn_snapshot.csv'),
+                    help='CSV path or schema.table read through a server-side cursor')
+    ap.add_argument('--chunksize', type=int, default=200_000)
+    ap.add_argument('--epochs', type=int, default=3)
+    ap.add_argument('--holdout', type=float, default=0.3, help='Share of customers held out')
+    ap.add_argument('--alpha', type=float, default=1e-4, help='SGD L2 regularization')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--out', default=DEFAULT_ARTIFACT, help='Model artifact path')
+    args = ap.parse_args()
+
+    if args.source.lower().endswith('.csv') and not os.path.exists(args.source):
+        raise FileNotFoundError(f'Missing {args.source}. Run: python src\\export_model_csvs.py')
+
+    t_start = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+
+    # Pass 1: scaler statistics + class balance
+    scaler = StandardScaler()
+    counts = np.zeros(2, dtype=np.int64)
+    with span('train.scaler_pass') as sp:
+        for X, y in split_chunks(args.source, args.chunksize, args.holdout, want_holdout=False):
+            scaler.partial_fit(X)
+            counts += np.bincount(y, minlength=2)[:2]
+        sp.set(rows=int(counts.sum()))
+    n_train = int(counts.sum())
+    if n_train == 0 or counts.min() == 0:
+        raise SystemExit(f'Training side needs both classes; got counts {counts.tolist()}')
+    # Same weights as class_weight='balanced', which partial_fit cannot compute itself
+    class_weight = {c: n_train / (2 * counts[c]) for c in (0, 1)}
+    print(f'-> {n_train:,} training rows (churn rate {counts[1] / n_train:.3f}); '
+          f'class weights {class_weight[0]:.3f}/{class_weight[1]:.3f}')
+
+    # Pass 2: SGD epochs
+    clf = SGDClassifier(loss='log_loss', alpha=args.alpha, class_weight=class_weight,
+                        learning_rate='optimal', random_state=args.seed)
+    for epoch in range(args.epochs):
+        t_epoch = time.perf_counter()
+        with span('train.epoch', epoch=epoch + 1, rows=n_train):
+            for X, y in split_chunks(args.source, args.chunksize, args.holdout, want_holdout=False):
+                order = rng.permutation(len(y))
+                clf.partial_fit(scaler.transform(X[order]), y[order], classes=np.array([0, 1]))
+        print(f'   epoch {epoch + 1}/{args.epochs} done in {time.perf_counter() - t_epoch:.1f}s')
+
+    # Pass 3: holdout AUC
+    pipe = Pipeline(steps=[('scaler', scaler), ('sgd', clf)])
+    auc = StreamingAUC()
+    with span('train.holdout') as sp:
+        for X, y in split_chunks(args.source, args.chunksize, args.holdout, want_holdout=True):
+            auc.update(y, churn_prob(pipe, X))
+        sp.set(rows=auc.n)
+    print(f'Holdout ROC-AUC: {auc.value():.4f} ({auc.n:,} rows)')
+
+    path = save_artifact(pipe, args.out, source=args.source, label=LABEL_COL,
+                         metrics={'holdout_auc': auc.value(), 'n_train': n_train, 'n_holdout': auc.n},
+                         params={'epochs': args.epochs, 'alpha': args.alpha, 'holdout': args.holdout})
+    print(f'Saved {path} in {time.perf_counter() - t_start:.1f}s')
+
+if __name__ == '__main__':
+    main()
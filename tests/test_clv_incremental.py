@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+def sql_file(name):
+    with open(os.path.join(ROOT, "sql", name), encoding="utf-8") as f:
+        return f.read()
+
+@pytest.fixture
+def cur():
+    # Runs against PG_DB inside one transaction that is rolled back: the marts are left as they were
+    from db import conn_params
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **conn_params())
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"no database: {e}")
+    try:
+        with conn.cursor() as c:
+            c.execute("SELECT count(*) FROM pg_attribute WHERE attrelid = to_regclass('staging.orders')"
+                      " AND attname = 'cust_id'")
+            if not c.fetchone()[0]:
+                pytest.skip("no current staging.orders; run the pipeline first")
+            yield c
+    finally:
+        conn.rollback()
+        conn.close()
+
+def diff(cur, table, snapshot):
+    cur.execute(f"SELECT count(*) FROM ((TABLE {table} EXCEPT ALL TABLE {snapshot})"
+                f" UNION ALL (TABLE {snapshot} EXCEPT ALL TABLE {table})) x")
+    return cur.fetchone()[0]
+
+def test_incremental_clv_matches_full_build_after_late_changes(cur):
+    cur.execute("SET LOCAL olist.lateness_days = 60")
+    cur.execute(sql_file("04_daily_revenue_and_clv.sql"))
+    cur.execute("SELECT max(order_ts)::date FROM staging.orders")
+    last = cur.fetchone()[0]
+
+    # Existing orders well inside the lateness window (60 days before the last order)
+    cur.execute("SELECT order_id, cust_id FROM staging.orders WHERE order_ts >= %s - 50"
+                " AND cust_id IS NOT NULL ORDER BY order_ts, order_id LIMIT 3", (last,))
+    orders = cur.fetchall()
+    if len(orders) < 3:
+        pytest.skip("fewer than 3 orders in the last 50 days")
+    (fixed_id, cust), (moved_id, _), (deleted_id, _) = orders
+
+    # A late order, a corrected amount, a moved order and a deleted one, plus a new day
+    cur.execute("INSERT INTO staging.orders (order_id, cust_id, order_ts, gmv)"
+                " VALUES ('test-late', %s, %s - 40, 123.45)", (cust, last))
+    cur.execute("UPDATE staging.orders SET gmv = gmv + 10 WHERE order_id = %s", (fixed_id,))
+    cur.execute("UPDATE staging.orders SET order_ts = order_ts + interval '3 days' WHERE order_id = %s",
+                (moved_id,))
+    cur.execute("DELETE FROM staging.orders WHERE order_id = %s", (deleted_id,))
+    cur.execute("INSERT INTO staging.orders (order_id, cust_id, order_ts, gmv)"
+                " VALUES ('test-new', %s, %s + 1, 50)", (cust, last))
+
+    cur.execute(sql_file("04b_clv_incremental.sql"))
+    cur.execute("CREATE TEMP TABLE inc_clv AS TABLE mart.clv_proxy;"
+                " CREATE TEMP TABLE inc_rev AS TABLE mart.daily_revenue")
+    cur.execute(sql_file("04_daily_revenue_and_clv.sql"))
+    assert diff(cur, "mart.clv_proxy", "inc_clv") == 0
+    assert diff(cur, "mart.daily_revenue", "inc_rev") == 0
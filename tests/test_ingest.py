@@ -0,0 +1,94 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import ingest  # noqa: E402
+
+@pytest.fixture
+def boundary_csv(tmp_path):
+    # The first three rows fit BOOLEAN / NUMERIC; the last one only fits BIGINT / TIMESTAMP
+    path = tmp_path / "boundary.csv"
+    path.write_text("flag,x\n" + "true,1.5\n" * 3 + "2,2017-01-01 10:00:00\n")
+    return str(path)
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 3, 4, 100])
+def test_inferred_type_does_not_depend_on_chunk_boundaries(boundary_csv, chunk_rows):
+    cols = {c["name"]: c for c in ingest.infer_schema(boundary_csv, chunk_rows=chunk_rows)["columns"]}
+    assert cols["flag"]["pg_type"] == "TEXT"
+    assert cols["x"]["pg_type"] == "TEXT"
+    assert (cols["flag"]["min"], cols["flag"]["max"]) == ("2", "true")
+
+def test_minmax_covers_values_seen_before_widening(tmp_path):
+    path = tmp_path / "widen.csv"
+    path.write_text("n\n" + "1\n0\n" + "7\n5\n")
+    for chunk_rows in (2, 100):
+        (col,) = ingest.infer_schema(str(path), chunk_rows=chunk_rows)["columns"]
+        assert col["pg_type"] == "BIGINT"
+        assert (col["min"], col["max"]) == (0, 7)
+
+def read_ranges(path, ranges):
+    parts = []
+    for start, end in ranges:
+        reader = ingest.RangeReader(path, start, end)
+        try:
+            parts.append(reader.read())
+        finally:
+            reader.close()
+    return parts
+
+def parsed_rows(parts):
+    import csv
+    import io
+    return [row for p in parts for row in csv.reader(io.StringIO(p.decode(), newline=""))]
+
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 16, 64, 10_000])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_split_csv_ranges_are_row_aligned(tmp_path, monkeypatch, chunk_bytes, newline):
+    # Quoted fields hold newlines, CRLFs and doubled quotes; a tiny SPLIT_BLOCK puts them on block edges
+    monkeypatch.setattr(ingest, "SPLIT_BLOCK", 5)
+    rows = [["id", "note"]] + [[str(i), f'line {i}\nnext "{i}"\r\nend'] for i in range(20)]
+    text = newline.join(",".join(f'"{c.replace(chr(34), chr(34) * 2)}"' for c in r) for r in rows) + newline
+    path = tmp_path / "quoted.csv"
+    path.write_bytes(text.encode())
+
+    ranges = ingest.split_csv(str(path), chunk_bytes)
+    parts = read_ranges(str(path), ranges)
+    assert b"".join(parts) == path.read_bytes()
+    assert [e for _, e in ranges[:-1]] == [s for s, _ in ranges[1:]]
+    assert parsed_rows(parts) == rows
+    if chunk_bytes == 1:
+        assert len(ranges) == len(rows)
+
+def test_split_csv_file_smaller_than_workers(tmp_path):
+    path = tmp_path / "tiny.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    for chunk_bytes in (1, 4, 1 << 20):
+        ranges = ingest.split_csv(str(path), chunk_bytes)
+        assert b"".join(read_ranges(str(path), ranges)) == path.read_bytes()
+        assert len(ranges) <= 2
+    empty = tmp_path / "empty.csv"
+    empty.write_bytes(b"")
+    assert ingest.split_csv(str(empty), 1) == [(0, 0)]
+
+def test_range_reader_stops_at_end(tmp_path):
+    path = tmp_path / "r.csv"
+    path.write_bytes(b"h\nab\ncd\nef\n")
+    reader = ingest.RangeReader(str(path), 2, 8)
+    try:
+        assert reader.readline() == b"ab\n"
+        assert reader.read(2) == b"cd"
+        assert reader.read() == b"\n"
+        assert reader.read() == b"" and reader.readline() == b""
+    finally:
+        reader.close()
+
+def test_only_empty_fields_are_null(tmp_path):
+    # COPY loads with NULL '': "NA" and friends arrive as text, so they must not infer as nulls
+    path = tmp_path / "na.csv"
+    path.write_text("n,t,e\n1,2017-01-01,\nNA,null,\n3,NaN,\n")
+    cols = {c["name"]: c for c in ingest.infer_schema(str(path))["columns"]}
+    assert cols["n"]["pg_type"] == "TEXT"
+    assert cols["t"]["pg_type"] == "TEXT"
+    assert (cols["n"]["nulls"], cols["e"]["nulls"]) == (0, 3)